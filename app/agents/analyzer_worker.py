@@ -1,16 +1,19 @@
 import asyncio
 import logging
+from typing import Optional
 from ..queue.redis_client import redis_client
 from ..models.events import Event, EventType, EventSource
 from ..models.task import AgentType
 from .base_worker import BaseWorker
 from ..core.groq_client import get_groq_client
+from ..core import llm, metrics
+from ..core.rate_limiter import RATE_LIMIT_ERRORS
 
 logger = logging.getLogger(__name__)
 
 class AnalyzerWorker(BaseWorker):
-    def __init__(self):
-        super().__init__(AgentType.ANALYZER, redis_client)
+    def __init__(self, concurrency: Optional[int] = None):
+        super().__init__(AgentType.ANALYZER, redis_client, concurrency)
 
     async def process_step(self, task_id: str, step_id: str, instruction: str, retry_count: int):
         # Failure Simulation
@@ -25,19 +28,12 @@ class AnalyzerWorker(BaseWorker):
         ))
         
         # 2. Fetch Context (Retrieved Data)
+        # The outcome and the completion status are published together in one round trip.
+        batch = self.redis.batch()
         try:
-            # We need to find what the Retriever found.
-            history = await self.redis.read_events(task_id, last_id="0-0", block=100, count=1000)
-            retrieved_data = ""
-            for _, data in history:
-                try:
-                    payload = data.get("payload")
-                    if payload:
-                        evt = Event.parse_raw(payload)
-                        if evt.source == EventSource.RETRIEVER and evt.message:
-                            retrieved_data += f"\n{evt.message}"
-                except Exception:
-                    pass
+            # We need to find what the Retriever found (materialized in the task's context store).
+            context = await self.redis.get_context(task_id, EventSource.RETRIEVER.value)
+            retrieved_data = "\n".join(text for _, text in context)
             
             # 3. Use Groq to Analyze
             groq = get_groq_client()
@@ -51,7 +47,7 @@ class AnalyzerWorker(BaseWorker):
                 Analyze the data above and extract key insights relevant to the instruction.
                 """
                 
-                chat_completion = groq.chat.completions.create(
+                analysis = await llm.complete(
                     messages=[
                         {"role": "system", "content": "You are an expert analyst. Extract key insights."},
                         {"role": "user", "content": prompt}
@@ -59,32 +55,36 @@ class AnalyzerWorker(BaseWorker):
                     model="llama-3.1-8b-instant",
                     temperature=0.5,
                 )
-                analysis = chat_completion.choices[0].message.content
                 
-                # Emit Analysis
-                await self.redis.publish_event(task_id, Event(
+                # Emit Analysis and materialize it for the Writer
+                batch.publish_event(task_id, Event(
                     type=EventType.STATUS,
                     source=EventSource.ANALYZER,
                     message=f"Key Insights:\n{analysis}"
                 ))
+                batch.store_context(task_id, EventSource.ANALYZER.value, step_id, analysis)
             else:
-                 await self.redis.publish_event(task_id, Event(
+                 batch.publish_event(task_id, Event(
                     type=EventType.STATUS,
                     source=EventSource.ANALYZER,
                     message="No data found to analyze."
                 ))
 
+        except RATE_LIMIT_ERRORS:
+            raise
         except Exception as e:
             logger.warning(f"Groq analysis failed: {e}")
-            await self.redis.publish_event(task_id, Event(
+            metrics.groq_fallbacks.inc(agent=AgentType.ANALYZER.value)
+            batch.publish_event(task_id, Event(
                 type=EventType.STATUS,
                 source=EventSource.ANALYZER,
                 message="Analysis failed or skipped."
             ))
 
         # 4. Emit Status: Analysis Complete
-        await self.redis.publish_event(task_id, Event(
+        batch.publish_event(task_id, Event(
             type=EventType.STATUS,
             source=EventSource.ANALYZER,
             message="Analysis complete. Key insights extracted."
         ))
+        await batch.execute()
@@ -1,55 +1,129 @@
 import asyncio
 import logging
-from abc import ABC, abstractmethod
+import os
+import time
+from abc import abstractmethod
+from contextvars import ContextVar
+from typing import List, Optional
 from ..queue.redis_client import RedisClient
+from ..queue.consumer import GroupConsumer, PoisonMessageError
+from ..queue.retry_scheduler import RetryScheduler, retry_scheduler, policy_for, retry_delay
+from ..queue.lanes import LaneSelector, lanes_for, queue_name
 from ..models.events import Event, EventType, EventSource
-from ..models.task import AgentType
+from ..models.task import AgentType, StepStatus
+from ..core import metrics
+from ..core.tracing import tracer
 
 logger = logging.getLogger(__name__)
 
-class BaseWorker(ABC):
-    def __init__(self, agent_type: AgentType, redis: RedisClient):
+# Pending entries idle longer than this are assumed orphaned (consumer crashed) and get reclaimed.
+VISIBILITY_TIMEOUT_MS = int(os.getenv("WORKER_VISIBILITY_TIMEOUT_MS", "60000"))
+RECLAIM_INTERVAL_SECONDS = float(os.getenv("WORKER_RECLAIM_INTERVAL_SECONDS", "15"))
+# A step that keeps killing its consumer is dead-lettered after this many deliveries.
+MAX_DELIVERIES = int(os.getenv("WORKER_MAX_DELIVERIES", "5"))
+
+# Default in-flight step limit per worker; override per agent with e.g. WRITER_WORKER_CONCURRENCY.
+DEFAULT_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "16"))
+
+# Queue fields of the step being processed by the current asyncio task (empty outside a step).
+current_step: ContextVar[dict] = ContextVar("current_step", default={})
+
+def concurrency_for(agent_type: AgentType) -> int:
+    value = os.getenv(f"{agent_type.value.upper()}_WORKER_CONCURRENCY")
+    return max(1, int(value) if value else DEFAULT_CONCURRENCY)
+
+class BaseWorker(GroupConsumer):
+    """
+    An agent's queue consumer (see GroupConsumer for the read loop).
+
+    Architecture Note:
+    - Workers act as independent async consumers within the `group:{agent}` consumer group,
+      so replicas share the queue instead of each processing every step.
+    - An entry is acknowledged in the same transaction that records the step's outcome
+      (completion, scheduled retry or dead letter); if the process dies mid-step the
+      entry stays pending and is reclaimed by a live consumer after
+      VISIBILITY_TIMEOUT_MS.
+    - Up to `concurrency` steps run at once. Each read asks for as many entries as there
+      are free slots (batched dequeue), so a slow LLM call no longer stalls other tasks.
+    - Lanes (interactive / standard / batch) are served by smooth weighted round robin
+      (LANE_WEIGHTS), so a flood of batch work cannot starve interactive steps.
+    - A separate heartbeat task keeps in-flight entries fresh even while every slot is busy,
+      so slow steps are never mistaken for abandoned ones.
+    """
+    def __init__(self, agent_type: AgentType, redis: RedisClient, concurrency: Optional[int] = None, scheduler: Optional[RetryScheduler] = None):
         self.agent_type = agent_type
-        self.redis = redis
-        self.is_running = False
-        # Queue name convention: queue:{agent_name}
-        self.queue_name = f"queue:{agent_type.value}"
+        self.retry_scheduler = scheduler or retry_scheduler
+        # Queue name convention: queue:{agent_name} (standard lane), queue:{agent_name}:{priority} (other lanes)
+        self.queue_name = queue_name(agent_type)
+        self.lanes = lanes_for(agent_type)
+        self._selector = LaneSelector(self.lanes)
+        self._lanes_by_queue = {lane.queue: lane for lane in self.lanes}
         self.agent_name = agent_type.value.capitalize()
+        # One consumer group per agent type (created on every lane); one consumer per replica/process.
+        super().__init__(
+            redis,
+            group_name=f"group:{agent_type.value}",
+            queues=[lane.queue for lane in self.lanes],
+            concurrency=concurrency or concurrency_for(agent_type),
+            log_name=self.agent_name,
+            visibility_timeout_ms=VISIBILITY_TIMEOUT_MS,
+            reclaim_interval_seconds=RECLAIM_INTERVAL_SECONDS,
+            max_deliveries=MAX_DELIVERIES,
+        )
+
+    def _read_order(self) -> List[str]:
+        # The lane picked by weighted round robin, then the others in case it is empty.
+        return [lane.queue for lane in self._selector.order()]
+
+    def _served(self, queue: str):
+        self._selector.served(self._lanes_by_queue[queue])
 
-    async def run(self):
+    async def _handle(self, queue: str, msg_id: str, data: dict):
+        try:
+            enqueued_at = data.get("enqueued_at")
+            if enqueued_at:
+                waited = time.time() - float(enqueued_at)
+                metrics.queue_wait.observe(max(0.0, waited), agent=self.agent_type.value, priority=data.get("priority") or "standard")
+            if not await self.process_message(data, queue, msg_id):
+                await self.redis.ack(queue, self.group_name, msg_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Left unacknowledged on purpose: the reclaim loop will retry it.
+            logger.error(f"[{self.agent_name}] Infrastructure error on entry {msg_id}: {e}")
+
+    async def _dead_letter_poison(self, queue: str, msg_id: str, data: dict, error: PoisonMessageError):
         """
-        Infinite loop to consume messages from the agent's Redis Stream.
-        
-        Architecture Note:
-        - Workers act as independent async consumers.
-        - Processing is "fire-and-forget" from the Orchestrator's perspective.
-        - Each worker processes one message at a time (Manual Batching via Redis Streams).
+        Ends a step that keeps killing its consumer like one that exhausted its retries:
+        dead-letter entry, terminal ERROR and a FAILED completion (so the orchestrator stops
+        waiting), acknowledged in the same transaction.
         """
-        self.is_running = True
-        logger.info(f"[{self.agent_name}] Worker started listening on {self.queue_name}")
-        
-        last_id = "0-0"
-        while self.is_running:
-            try:
-                # Read from own queue
-                streams = await self.redis.redis.xread({self.queue_name: last_id}, count=1, block=2000)
-                
-                if not streams:
-                    continue
-                
-                for stream_name, messages in streams:
-                    for msg_id, data in messages:
-                        last_id = msg_id
-                        await self.process_message(data)
-                        
-            except Exception as e:
-                logger.error(f"[{self.agent_name}] Infrastructure error: {e}")
-                await asyncio.sleep(1)
+        task_id, step_id = data.get("task_id"), data.get("step_id")
+        batch = self.redis.batch(transaction=True)
+        if task_id:
+            batch.publish_event(task_id, Event(
+                type=EventType.ERROR,
+                source=EventSource(self.agent_type.value),
+                message=f"[{self.agent_name}] ERROR: Step {step_id} abandoned. Details: {error}"
+            ), terminal=True)
+            if step_id is not None:
+                batch.step_finished(task_id, step_id, StepStatus.FAILED.value)
+        self.retry_scheduler.dead_letter(batch, self.agent_type.value, data, error)
+        batch.pipe.xack(queue, self.group_name, msg_id)
+        await batch.execute()
+        metrics.dead_letters.inc(agent=self.agent_type.value)
 
-    async def process_message(self, data: dict):
+    async def process_message(self, data: dict, queue: Optional[str] = None, msg_id: Optional[str] = None) -> bool:
         """
         Orchestrate step processing with Retry Logic.
+        Given the entry's `queue` and `msg_id`, the outcome (completion, scheduled retry or
+        dead letter) is written in the same transaction as its XACK, so a crash in between can
+        never run the step a second time. Returns True if the entry was acknowledged that way.
         """
+        def ack(batch):
+            if queue and msg_id:
+                batch.pipe.xack(queue, self.group_name, msg_id)
+
         task_id = data.get("task_id")
         step_id = data.get("step_id")
         instruction = data.get("instruction")
@@ -57,53 +131,77 @@ class BaseWorker(ABC):
         
         if not task_id or not instruction:
             logger.warning(f"[{self.agent_name}] Invalid message format in {self.queue_name}: {data}")
-            return
+            return False
 
         logger.info(f"[{self.agent_name}] Processing step {step_id} for task {task_id} (Attempt {retry_count + 1})")
+        current_step.set(data)
+        enqueued_at = data.get("enqueued_at")
+        # Continues the task's trace from the dispatch span carried in the message.
+        async with tracer.span(f"{self.agent_type.value}.process_step", task_id=task_id, parent=data.get("traceparent"),
+                               step_id=str(step_id), attempt=retry_count + 1) as span:
+            if enqueued_at:
+                tracer.record("queue.wait", int(float(enqueued_at) * 1e9), queue=queue_name(self.agent_type, data.get("priority")))
+            started = time.perf_counter()
         
-        try:
-            # Execute the actual work
-            await self.process_step(task_id, str(step_id), instruction, retry_count)
+            try:
+                # Execute the actual work
+                await self.process_step(task_id, str(step_id), instruction, retry_count)
             
-        except Exception as e:
-            logger.error(f"[{self.agent_name}] Failed to process step {step_id} for task {task_id}: {e}")
+            except Exception as e:
+                metrics.step_duration.observe(time.perf_counter() - started, agent=self.agent_type.value, outcome="error")
+                if span is not None:
+                    span.error = f"{type(e).__name__}: {e}"
+                logger.error(f"[{self.agent_name}] Failed to process step {step_id} for task {task_id}: {e}")
             
-            # Retry Logic
-            if retry_count < 3:
-                new_retry_count = retry_count + 1
-                backoff_time = 2 ** retry_count  # 1s, 2s, 4s
-                
-                # Emit Error/Retry Event
-                await self.redis.publish_event(task_id, Event(
-                    type=EventType.ERROR,
-                    source=EventSource(self.agent_type.value),
-                    message=f"[{self.agent_name}] ERROR: {str(e)} (retry {new_retry_count}/3)"
-                ))
+                # Retry Logic (non-blocking: the retry is parked in the scheduler, not slept on)
+                policy = policy_for(e)
+                if retry_count < policy.max_retries:
+                    new_retry_count = retry_count + 1
+                    backoff_time = retry_delay(e, retry_count)
                 
-                # Wait (Backoff)
-                await asyncio.sleep(backoff_time)
-                
-                # Re-queue the message with updated retry_count
-                await self.redis.redis.xadd(self.queue_name, {
-                    "task_id": task_id,
-                    "step_id": step_id,
-                    "instruction": instruction,
-                    "retry_count": new_retry_count
-                })
-                logger.info(f"[{self.agent_name}] Re-queued step {step_id} due to error.")
+                    # Emit Error/Retry Event and re-queue the message with updated retry_count
+                    # once the backoff has elapsed (one round trip)
+                    batch = self.redis.batch(transaction=True)
+                    batch.publish_event(task_id, Event(
+                        type=EventType.ERROR,
+                        source=EventSource(self.agent_type.value),
+                        message=f"[{self.agent_name}] ERROR: {str(e)} (retry {new_retry_count}/{policy.max_retries})"
+                    ))
+                    # Back onto the lane the step came from
+                    self.retry_scheduler.schedule(batch, queue_name(self.agent_type, data.get("priority")), {**data, "retry_count": new_retry_count}, backoff_time)
+                    ack(batch)
+                    await batch.execute()
+                    metrics.retries.inc(agent=self.agent_type.value, error=type(e).__name__)
+                    logger.info(f"[{self.agent_name}] Scheduled retry of step {step_id} in {backoff_time:.1f}s due to error.")
                 
+                else:
+                    # Dead Letter handling (Max Retries Exhausted)
+                    batch = self.redis.batch(transaction=True)
+                    batch.publish_event(task_id, Event(
+                        type=EventType.ERROR,
+                        source=EventSource(self.agent_type.value),
+                        message=f"[{self.agent_name}] ERROR: Failed after max retries. Details: {str(e)}"
+                    ), terminal=True)
+                    self.retry_scheduler.dead_letter(batch, self.agent_type.value, data, e)
+                    if step_id is not None:
+                        batch.step_finished(task_id, step_id, StepStatus.FAILED.value)
+                    ack(batch)
+                    await batch.execute()
+                    metrics.dead_letters.inc(agent=self.agent_type.value)
+                    logger.critical(f"[{self.agent_name}] Step {step_id} for task {task_id} moved to dead_letter:{self.agent_type.value} after {retry_count} retries.")
+
             else:
-                # Dead Letter handling (Max Retries Exhausted)
-                await self.redis.publish_event(task_id, Event(
-                    type=EventType.ERROR,
-                    source=EventSource(self.agent_type.value),
-                    message=f"[{self.agent_name}] ERROR: Failed after max retries. Details: {str(e)}"
-                ))
-                logger.critical(f"[{self.agent_name}] Step {step_id} for task {task_id} moved to dead-letter (log only) after {retry_count} retries.")
+                metrics.step_duration.observe(time.perf_counter() - started, agent=self.agent_type.value, outcome="completed")
+                # Tell the orchestrator, so steps depending on this one get dispatched.
+                # Outside the try: a Redis error here is not a step failure to retry (the entry
+                # stays unacknowledged and is redelivered instead).
+                batch = self.redis.batch(transaction=True)
+                if step_id is not None:
+                    batch.step_finished(task_id, step_id, StepStatus.COMPLETED.value)
+                ack(batch)
+                await batch.execute()
+        return bool(queue and msg_id)
 
     @abstractmethod
     async def process_step(self, task_id: str, step_id: str, instruction: str, retry_count: int):
         pass
-
-    def stop(self):
-        self.is_running = False
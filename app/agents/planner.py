@@ -1,3 +1,5 @@
+import os
+import time
 import asyncio
 import logging
 import json
@@ -6,33 +8,53 @@ from ..models.task import Step, StepStatus, AgentType, TaskPlan
 from ..models.events import Event, EventType, EventSource
 from ..queue.redis_client import redis_client
 from ..core.groq_client import get_groq_client
+from ..core import llm, metrics
+from ..core.rate_limiter import RATE_LIMIT_ERRORS
+from ..core.plan_cache import PLAN_CACHE_ENABLED, plan_cache
 
 logger = logging.getLogger(__name__)
 
+PLANNER_MODEL = "llama-3.3-70b-versatile"
+# Deliberate pause before the deterministic plan (mimics LLM latency in demos); 0 disables it.
+FALLBACK_DELAY_SECONDS = float(os.getenv("PLANNER_FALLBACK_DELAY_SECONDS", "1.5"))
+
 class PlannerAgent:
-    async def plan(self, task_id: str, task_input: str) -> TaskPlan:
+    async def plan(self, task_id: str, task_input: str, announce: bool = True) -> TaskPlan:
         """
         Decomposes a user task into steps.
         Strategy:
         1. Attempt to use Groq LLM for intelligent decomposition.
         2. If Groq fails or is disabled (Resilient Fallback), use deterministic logic.
+
+        Groq plans are cached by normalized prompt (see PlanCache); a repeated prompt
+        skips the planning call entirely. `announce=False` (a retried plan) skips the
+        "planning started" event the first attempt already published.
         """
         logger.info(f"Planner started for task {task_id}")
+        started = time.perf_counter()
 
         # 1. Emit "Planning started" event
-        await redis_client.publish_event(task_id, Event(
-            type=EventType.STATUS,
-            source=EventSource.PLANNER,
-            message="Analyzing task requirements..."
-        ))
+        if announce:
+            await redis_client.publish_event(task_id, Event(
+                type=EventType.STATUS,
+                source=EventSource.PLANNER,
+                message="Analyzing task requirements..."
+            ))
 
         # 2. Try Groq (Cognitive Layer)
         steps = None
+        cached = False
         try:
             groq = get_groq_client()
-            if groq:
+            if groq and PLAN_CACHE_ENABLED:
+                steps = await plan_cache.get(task_input, PLANNER_MODEL)
+                cached = steps is not None
+                if cached:
+                    logger.info(f"Plan cache hit for task {task_id}.")
+            if groq and not cached:
                 logger.info("Attempting planning via Groq...")
-                chat_completion = groq.chat.completions.create(
+                # The plan cache already covers this call; skip the completion cache.
+                content = await llm.complete(
                     messages=[
                         {
                             "role": "system",
@@ -43,8 +65,12 @@ class PlannerAgent:
                             2. {AgentType.ANALYZER.value} 
                             3. {AgentType.WRITER.value}
                             
+                            Steps are numbered from 1 in the order you return them. "depends_on" lists the
+                            numbers of earlier steps whose output this step needs; steps that don't depend
+                            on each other run in parallel.
+
                             Return ONLY valid JSON in this format:
-                            [{{ "title": "...", "description": "...", "assigned_agent": "retriever" }}, ...]
+                            [{{ "title": "...", "description": "...", "assigned_agent": "retriever", "depends_on": [] }}, ...]
                             """
                         },
                         {
@@ -52,12 +78,12 @@ class PlannerAgent:
                             "content": task_input,
                         }
                     ],
-                    model="llama-3.3-70b-versatile",
+                    model=PLANNER_MODEL,
                     temperature=0.0,
+                    cache=False,
                     response_format={"type": "json_object"},
                 )
                 
-                content = chat_completion.choices[0].message.content
                 plan_data = json.loads(content)
                 
                 # Handle both list and wrapped dict formats
@@ -77,19 +103,28 @@ class PlannerAgent:
                          id=i+1,
                          title=item.get("title", f"Step {i+1}"),
                          description=item.get("description", "Perform task"),
-                         assigned_agent=AgentType(item.get("assigned_agent").lower())
+                         assigned_agent=AgentType(item.get("assigned_agent").lower()),
+                         depends_on=self._dependencies(item.get("depends_on"), i+1)
                      ))
                      
                 logger.info(f"Groq successfully planned {len(steps)} steps.")
+                if steps and PLAN_CACHE_ENABLED:
+                    await plan_cache.put(task_input, PLANNER_MODEL, steps)
 
+        except RATE_LIMIT_ERRORS:
+            # The orchestrator service leaves the submission pending and plans it again later.
+            raise
         except Exception as e:
             logger.warning(f"Groq planning failed: {e}. Falling back to deterministic logic.")
+            metrics.groq_fallbacks.inc(agent="planner")
             steps = None
 
         # 3. Deterministic Fallback (Safety Net)
+        used_groq = bool(steps)
         if not steps:
             logger.info("Using deterministic planner fallback.")
-            await asyncio.sleep(1.5) # Simulate thinking
+            if FALLBACK_DELAY_SECONDS > 0:
+                await asyncio.sleep(FALLBACK_DELAY_SECONDS) # Simulate thinking
             steps = [
                 Step(
                     id=1,
@@ -101,16 +136,20 @@ class PlannerAgent:
                     id=2,
                     title="Analyze Data",
                     description="Process and summarize the gathered information.",
-                    assigned_agent=AgentType.ANALYZER
+                    assigned_agent=AgentType.ANALYZER,
+                    depends_on=[1]
                 ),
                 Step(
                     id=3,
                     title="Draft Content",
                     description="Write the final response based on analysis.",
-                    assigned_agent=AgentType.WRITER
+                    assigned_agent=AgentType.WRITER,
+                    depends_on=[1, 2]
                 )
             ]
 
+        metrics.planner_latency.observe(time.perf_counter() - started, source="cache" if cached else ("groq" if used_groq else "fallback"))
+
         # 4. Finalize Plan
         task_plan = TaskPlan(
             task_id=task_id,
@@ -122,7 +161,27 @@ class PlannerAgent:
         await redis_client.publish_event(task_id, Event(
             type=EventType.STATUS,
             source=EventSource.PLANNER,
-            message=f"Task decomposed into {len(steps)} steps."
+            message=f"Task decomposed into {len(steps)} steps{' (cached plan)' if cached else ''}."
         ))
 
         return task_plan
+
+    @staticmethod
+    def _dependencies(raw, step_id: int) -> List[int]:
+        """
+        Sanitizes an LLM-provided depends_on list. Only earlier steps are kept, so the plan is
+        always a DAG; a missing list defaults to the previous step (sequential execution).
+        """
+        if raw is None:
+            return [step_id - 1] if step_id > 1 else []
+        if not isinstance(raw, list):
+            raw = [raw]
+        deps = set()
+        for dep in raw:
+            try:
+                dep = int(dep)
+            except (TypeError, ValueError):
+                continue
+            if 1 <= dep < step_id:
+                deps.add(dep)
+        return sorted(deps)
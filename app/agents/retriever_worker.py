@@ -1,16 +1,19 @@
 import asyncio
 import logging
+from typing import Optional
 from ..queue.redis_client import redis_client
 from ..models.events import Event, EventType, EventSource
 from ..models.task import AgentType
 from .base_worker import BaseWorker
 from ..core.groq_client import get_groq_client
+from ..core import llm, metrics
+from ..core.rate_limiter import RATE_LIMIT_ERRORS
 
 logger = logging.getLogger(__name__)
 
 class RetrieverWorker(BaseWorker):
-    def __init__(self):
-        super().__init__(AgentType.RETRIEVER, redis_client)
+    def __init__(self, concurrency: Optional[int] = None):
+        super().__init__(AgentType.RETRIEVER, redis_client, concurrency)
 
     async def process_step(self, task_id: str, step_id: str, instruction: str, retry_count: int):
         # Failure Simulation
@@ -25,12 +28,15 @@ class RetrieverWorker(BaseWorker):
         ))
         
         # 2. Use Groq to simulate "Search"
+        # Results and the completion status are published together in one round trip.
+        batch = self.redis.batch()
+        results = None
         try:
             groq = get_groq_client()
             if groq:
                 # Ask LLM to simulated search results
                 prompt = f"Simulate a search engine result for the query: '{instruction}'. Return 3-5 relevant snippets with titles and simulated URLs."
-                chat_completion = groq.chat.completions.create(
+                search_results = await llm.complete(
                     messages=[
                         {"role": "system", "content": "You are a simulated search engine. Provide realistic search results."},
                         {"role": "user", "content": prompt}
@@ -38,33 +44,42 @@ class RetrieverWorker(BaseWorker):
                     model="llama-3.1-8b-instant",
                     temperature=0.5,
                 )
-                search_results = chat_completion.choices[0].message.content
+                results = search_results
                 
                 # Emit the "Search Results"
-                await self.redis.publish_event(task_id, Event(
+                batch.publish_event(task_id, Event(
                     type=EventType.STATUS, # Use STATUS so it shows in logs but not main output box
                     source=EventSource.RETRIEVER,
                     message=f"Search Results:\n{search_results}"
                 ))
             else:
-                await self.redis.publish_event(task_id, Event(
+                results = "[Mock] Found 5 documents about Agentic AI."
+                batch.publish_event(task_id, Event(
                     type=EventType.STATUS,
                     source=EventSource.RETRIEVER,
-                    message="[Mock] Found 5 documents about Agentic AI."
+                    message=results
                 ))
 
+        except RATE_LIMIT_ERRORS:
+            raise
         except Exception as e:
             logger.warning(f"Groq search simulation failed: {e}")
+            metrics.groq_fallbacks.inc(agent=AgentType.RETRIEVER.value)
             # Fallback
-            await self.redis.publish_event(task_id, Event(
+            results = f"Simulated search results for: {instruction}"
+            batch.publish_event(task_id, Event(
                 type=EventType.STATUS,
                 source=EventSource.RETRIEVER,
-                message=f"Simulated search results for: {instruction}"
+                message=results
             ))
 
+        # Materialize the results for downstream agents (Analyzer, Writer)
+        batch.store_context(task_id, EventSource.RETRIEVER.value, step_id, results)
+
         # 3. Emit Status: Retrieved
-        await self.redis.publish_event(task_id, Event(
+        batch.publish_event(task_id, Event(
             type=EventType.STATUS,
             source=EventSource.RETRIEVER,
             message=f"Retrieved sources for step {step_id}."
         ))
+        await batch.execute()
@@ -1,16 +1,20 @@
 import asyncio
 import logging
+from typing import Optional
 from ..queue.redis_client import redis_client
+from ..queue.partial_output import PartialOutputBuffer
 from ..models.events import Event, EventType, EventSource
 from ..models.task import AgentType
-from .base_worker import BaseWorker
+from .base_worker import BaseWorker, current_step
 from ..core.groq_client import get_groq_client
+from ..core import llm, metrics
+from ..core.rate_limiter import RATE_LIMIT_ERRORS
 
 logger = logging.getLogger(__name__)
 
 class WriterWorker(BaseWorker):
-    def __init__(self):
-        super().__init__(AgentType.WRITER, redis_client)
+    def __init__(self, concurrency: Optional[int] = None):
+        super().__init__(AgentType.WRITER, redis_client, concurrency)
 
     async def process_step(self, task_id: str, step_id: str, instruction: str, retry_count: int):
         # Failure Simulation (Standard)
@@ -23,97 +27,84 @@ class WriterWorker(BaseWorker):
             message="Drafting final response..."
         ))
 
-        # 2. Try Groq (Cognitive Layer)
-        used_groq = False
-        try:
-            groq = get_groq_client()
-            if groq:
-                logger.info("Attempting streaming via Groq...")
+        # Tokens from both paths are coalesced into larger PARTIAL_OUTPUT chunks (see TOKEN_FLUSH_*
+        # settings). Leaving the block flushes the remainder, so output survives a failure.
+        # Time to first output is only meaningful for the first attempt.
+        submitted_at = current_step.get().get("submitted_at") if retry_count == 0 else None
+        async with PartialOutputBuffer(self.redis, task_id, EventSource.WRITER,
+                                       started_at=float(submitted_at) if submitted_at else None) as output:
+            # 2. Try Groq (Cognitive Layer)
+            used_groq = False
+            try:
+                groq = get_groq_client()
+                if groq:
+                    logger.info("Attempting streaming via Groq...")
                 
-                # --- CONTEXT RETRIEVAL (The Fix) ---
-                # Fetch all previous events to understand what happened
-                history = await self.redis.read_events(task_id, last_id="0-0", block=100, count=1000)
-                context = ""
-                for _, data in history:
-                    try:
-                        # Parse the 'payload' json
-                        payload = data.get("payload")
-                        if payload:
-                            evt = Event.parse_raw(payload)
-                            # Collect content from Retriever and Analyzer
-                            if evt.source in [EventSource.RETRIEVER, EventSource.ANALYZER] and evt.message:
-                                context += f"\n[{evt.source.value.upper()}]: {evt.message}"
-                    except Exception:
-                        pass
+                    # --- CONTEXT RETRIEVAL (The Fix) ---
+                    # Fetch what the Retriever and Analyzer produced from the task's context store
+                    entries = await self.redis.get_context(task_id, EventSource.RETRIEVER.value, EventSource.ANALYZER.value)
+                    context = "".join(f"\n[{source.upper()}]: {text}" for source, text in entries)
                 
-                # Enhance the prompt with context
-                full_prompt = f"""
-                Context from previous agents:
-                {context}
+                    # Enhance the prompt with context
+                    full_prompt = f"""
+                    Context from previous agents:
+                    {context}
                 
-                Instruction: {instruction}
+                    Instruction: {instruction}
                 
-                Write a comprehensive response based ONLY on the context provided above.
-                """
-                # -----------------------------------
-
-                stream = groq.chat.completions.create(
-                    messages=[
-                        {"role": "system", "content": "You are a helpful AI writer. Be concise but informative."},
-                        {"role": "user", "content": full_prompt}
-                    ],
-                    model="llama-3.1-8b-instant",
-                    temperature=0.7,
-                    max_tokens=1024,
-                    stream=True,
-                )
+                    Write a comprehensive response based ONLY on the context provided above.
+                    """
+                    # -----------------------------------
 
-                for chunk in stream:
-                    content = chunk.choices[0].delta.content
-                    if content:
-                        await self.redis.publish_event(task_id, Event(
-                            type=EventType.PARTIAL_OUTPUT,
-                            source=EventSource.WRITER,
-                            message=content
-                        ))
-                        # Small sleep to nicely visualize streaming on frontend if needed, 
-                        # but real LLM is fast.
-                        # await asyncio.sleep(0.02) 
+                    # A cached draft is replayed chunk by chunk, just like a live stream.
+                    async for content in llm.stream(
+                        messages=[
+                            {"role": "system", "content": "You are a helpful AI writer. Be concise but informative."},
+                            {"role": "user", "content": full_prompt}
+                        ],
+                        model="llama-3.1-8b-instant",
+                        temperature=0.7,
+                        max_tokens=1024,
+                    ):
+                        await output.add(content)
 
-                used_groq = True
-                logger.info("Groq streaming complete.")
+                    used_groq = True
+                    logger.info("Groq streaming complete.")
 
-        except Exception as e:
-            logger.warning(f"[Writer] Groq Error: {e}. Switching to deterministic fallback.")
-            # If we failed mid-stream, we just continue to the fallback.
-            # We emitted some PARTIAL_OUTPUT already? That's fine.
-            # The fallback will append to it. 
-            used_groq = False
+            except RATE_LIMIT_ERRORS:
+                # Raised before any token arrives; BaseWorker retries the step with the rate-limit backoff.
+                raise
+            except Exception as e:
+                logger.warning(f"[Writer] Groq Error: {e}. Switching to deterministic fallback.")
+                metrics.groq_fallbacks.inc(agent=AgentType.WRITER.value)
+                # If we failed mid-stream, we just continue to the fallback.
+                # We emitted some PARTIAL_OUTPUT already? That's fine.
+                # The fallback will append to it. 
+                used_groq = False
 
-        # 3. Deterministic Fallback (Safety Net)
-        if not used_groq:
-            logger.info("Using deterministic writer fallback.")
-            await asyncio.sleep(0.2) # Simulate work
+            # 3. Deterministic Fallback (Safety Net)
+            if not used_groq:
+                logger.info("Using deterministic writer fallback.")
+                await asyncio.sleep(0.2) # Simulate work
             
-            response_text = " [FALLBACK] Based on the analysis, agentic AI systems represent a significant leap forward in autonomy. They can plan, execute, and verify tasks."
-            tokens = response_text.split(" ")
+                response_text = " [FALLBACK] Based on the analysis, agentic AI systems represent a significant leap forward in autonomy. They can plan, execute, and verify tasks."
+                tokens = response_text.split(" ")
             
-            for i, token in enumerate(tokens):
-                # Standard Failure Simulation (for Retry Logic verification)
-                if should_fail_mid_stream and i > 5:
-                    raise Exception("Simulated Writer Streaming Failure") 
-                    # This raises to BaseWorker -> Triggers Retry. Correct.
+                for i, token in enumerate(tokens):
+                    # Standard Failure Simulation (for Retry Logic verification)
+                    if should_fail_mid_stream and i > 5:
+                        raise Exception("Simulated Writer Streaming Failure") 
+                        # This raises to BaseWorker -> Triggers Retry. Correct.
 
-                await self.redis.publish_event(task_id, Event(
-                    type=EventType.PARTIAL_OUTPUT,
-                    source=EventSource.WRITER,
-                    message=token + " " 
-                ))
-                await asyncio.sleep(0.05)
+                    await output.add(token + " ")
+                    await asyncio.sleep(0.05)
             
-        # 4. Emit Done
-        await self.redis.publish_event(task_id, Event(
-            type=EventType.DONE,
-            source=EventSource.WRITER,
-            message="Draft generation complete."
-        ))
+            # 4. Emit Done, in the same round trip as the last buffered chunk
+            batch = self.redis.batch()
+            await output.flush(batch)
+            batch.publish_event(task_id, Event(
+                type=EventType.DONE,
+                source=EventSource.WRITER,
+                message="Draft generation complete."
+            ))
+            await batch.execute()
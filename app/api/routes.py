@@ -1,29 +1,52 @@
+import re
 import uuid
 import logging
-from fastapi import APIRouter, BackgroundTasks
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Request, Response
 from pydantic import BaseModel
 from sse_starlette.sse import EventSourceResponse
 from ..models.events import Event, EventType, EventSource
+from ..models.task import AgentType, Priority
 from ..queue.redis_client import redis_client
+from ..queue.lanes import queue_name
 from ..streaming.sse import event_generator
-from ..core.orchestrator import Orchestrator
+from ..core.coalescer import TASK_COALESCING, task_coalescer
+from ..core.admission import Rejected, admission_controller, client_key
+from ..core import metrics
+from ..core.tracing import tracer, traceparent
+from ..core.orchestrator_service import ORCHESTRATOR_GROUP, ORCHESTRATOR_QUEUE, OrchestratorService
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
-orchestrator = Orchestrator()
+
+# Redis stream entry IDs ("<ms>-<seq>") are what we send as SSE event ids.
+STREAM_ID_PATTERN = re.compile(r"^\d+-\d+$")
 
 class TaskRequest(BaseModel):
     task: str
+    # Scheduling lane for the task's steps (see app/queue/lanes.py)
+    priority: Priority = Priority.STANDARD
 
 @router.post("/task")
-async def submit_task(request: TaskRequest, background_tasks: BackgroundTasks):
+async def submit_task(request: TaskRequest, http_request: Request, x_client_id: Optional[str] = Header(None)):
     """
     Submits a new task.
-    Triggers orchestration in the background.
-    Returns the task_id.
+    Queues it for the orchestrator service (in this process or in `python -m app.worker`).
+    Returns the task_id, or HTTP 429 with Retry-After when the system (or this client) is over budget.
     """
+    client_id = client_key(http_request.client.host if http_request.client else None, x_client_id)
+    try:
+        await admission_controller.admit(client_id)
+    except Rejected as e:
+        logger.warning(f"Rejected task from {client_id}: {e.reason} (retry after {e.retry_after}s)")
+        raise HTTPException(status_code=429, detail=e.reason, headers={"Retry-After": str(e.retry_after)})
+
     task_id = str(uuid.uuid4())
     logger.info(f"Received new task request, generated ID: {task_id}")
+
+    # Identical in-flight prompt? Attach to it instead of running the whole chain again.
+    if TASK_COALESCING and await task_coalescer.claim(task_id, request.task, request.priority):
+        return {"task_id": task_id}
     
     # Publish initial status event
     initial_event = Event(
@@ -32,17 +55,79 @@ async def submit_task(request: TaskRequest, background_tasks: BackgroundTasks):
         message="Task received. Initializing planner..."
     )
     
-    await redis_client.publish_event(task_id, initial_event)
-    
-    # Trigger Orchestrator in Background
-    background_tasks.add_task(orchestrator.process_task, task_id, request.task)
+    # The task's trace starts here; its context rides along on the submission.
+    async with tracer.span("task.submit", task_id=task_id, root=True, priority=request.priority.value):
+        # Registering the task lets the retention janitor reap it if it never finishes;
+        # the submission is queued in the same transaction so no task is tracked but never run,
+        # and followers can only coalesce into it once its event stream exists.
+        batch = (redis_client.batch(transaction=True)
+                 .publish_event(task_id, initial_event)
+                 .track_task(task_id)
+                 .enqueue(ORCHESTRATOR_QUEUE, OrchestratorService.submission(task_id, request.task, request.priority, traceparent())))
+        if TASK_COALESCING:
+            task_coalescer.lead(batch, task_id, request.task, request.priority)
+        try:
+            await batch.execute()
+        except Exception:
+            if TASK_COALESCING:
+                await task_coalescer.release(task_id, request.task, request.priority)
+            raise
     
     return {"task_id": task_id}
 
 @router.get("/stream/{task_id}")
-async def stream_task(task_id: str):
+async def stream_task(task_id: str, last_event_id: Optional[str] = Header(None)):
     """
     Streams updates for the given task_id using SSE.
+    Honors the Last-Event-ID header (a Redis stream entry ID) to resume after a reconnect.
+    """
+    last_id = "0-0"
+    if last_event_id and STREAM_ID_PATTERN.match(last_event_id.strip()):
+        last_id = last_event_id.strip()
+    logger.info(f"Client connected to stream for task: {task_id} (from {last_id})")
+    if TASK_COALESCING:
+        # Coalesced followers stream their leader's events.
+        task_id = await task_coalescer.resolve(task_id)
+    return EventSourceResponse(event_generator(task_id, last_id))
+
+@router.get("/task/{task_id}/timeline")
+async def task_timeline(task_id: str):
     """
-    logger.info(f"Client connected to stream for task: {task_id}")
-    return EventSourceResponse(event_generator(task_id))
+    Trace waterfall of a task: every span (submission, planning, dispatch, queue waits, steps,
+    LLM calls, Redis publishes) with its offset from the start and its duration, in ms.
+    """
+    if TASK_COALESCING:
+        # Coalesced followers share their leader's trace.
+        task_id = await task_coalescer.resolve(task_id)
+    timeline = await tracer.timeline(task_id)
+    if timeline is None:
+        raise HTTPException(status_code=404, detail=f"No trace recorded for task {task_id}")
+    return timeline
+
+async def _collect_queue_gauges():
+    """Depth (group lag) and pending entries of every work queue, in one pipelined round trip."""
+    queues = [(ORCHESTRATOR_QUEUE, ORCHESTRATOR_GROUP)] + [
+        (queue_name(agent, priority.value), f"group:{agent.value}") for agent in AgentType for priority in Priority
+    ]
+    pipe = redis_client.redis.pipeline(transaction=False)
+    for queue, _ in queues:
+        pipe.xinfo_groups(queue)
+    results = await pipe.execute(raise_on_error=False)
+
+    metrics.queue_depth.clear()
+    metrics.queue_pending.clear()
+    for (queue, group_name), groups in zip(queues, results):
+        if isinstance(groups, Exception):
+            # Queue not created yet: nothing waiting.
+            continue
+        for group in groups:
+            if group.get("name") == group_name:
+                metrics.queue_depth.set(group.get("lag") or 0, queue=queue)
+                metrics.queue_pending.set(group.get("pending") or 0, queue=queue)
+
+metrics.REGISTRY.register_collector(_collect_queue_gauges)
+
+@router.get("/metrics")
+async def get_metrics():
+    """Prometheus scrape endpoint for this process (stage latencies, counters, queue gauges)."""
+    return Response(content=await metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
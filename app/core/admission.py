@@ -0,0 +1,197 @@
+import os
+import math
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Optional
+from ..models.task import AgentType, Priority
+from ..queue.redis_client import RedisClient, redis_client, ACTIVE_TASKS_KEY, EXPIRING_TASKS_KEY, TASK_EVENTS_TTL_SECONDS
+from ..queue.lanes import queue_name
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Tasks submitted but not finished yet (tasks:active). 0 disables the check.
+MAX_IN_FLIGHT_TASKS = int(os.getenv("ADMISSION_MAX_IN_FLIGHT_TASKS", "1000"))
+# Steps waiting in or being processed from all agent queues (group lag + pending). 0 disables the check.
+MAX_QUEUE_DEPTH = int(os.getenv("ADMISSION_MAX_QUEUE_DEPTH", "5000"))
+# Per-client token bucket: sustained submissions per second and burst size. Rate 0 disables it.
+CLIENT_RATE_PER_SECOND = float(os.getenv("ADMISSION_CLIENT_RATE_PER_SECOND", "2"))
+CLIENT_BURST = int(os.getenv("ADMISSION_CLIENT_BURST", "10"))
+# Queue depth / in-flight counts are re-read from Redis at most this often.
+SNAPSHOT_TTL_SECONDS = float(os.getenv("ADMISSION_SNAPSHOT_TTL_SECONDS", "1.0"))
+# Retry-After when the drain rate is unknown, and the bounds of any estimate.
+DEFAULT_RETRY_AFTER_SECONDS = float(os.getenv("ADMISSION_DEFAULT_RETRY_AFTER_SECONDS", "5"))
+MAX_RETRY_AFTER_SECONDS = float(os.getenv("ADMISSION_MAX_RETRY_AFTER_SECONDS", "60"))
+MAX_TRACKED_CLIENTS = 10000
+# Peers (e.g. a reverse proxy / API gateway) whose X-Client-ID header is trusted as the client key.
+# Everyone else is keyed by their remote address, so a client cannot pick a fresh identity per request.
+TRUSTED_PROXIES = {ip.strip() for ip in os.getenv("ADMISSION_TRUSTED_PROXIES", "").split(",") if ip.strip()}
+# Task turnover (tasks finished per second) is measured over this window, for in-flight Retry-After.
+TURNOVER_WINDOW_SECONDS = float(os.getenv("ADMISSION_TURNOVER_WINDOW_SECONDS", "60"))
+
+
+def client_key(remote_host: Optional[str], client_id_header: Optional[str]) -> str:
+    """Rate-limit key: X-Client-ID only when it comes from a trusted proxy, else the remote address."""
+    if client_id_header and remote_host in TRUSTED_PROXIES:
+        return client_id_header
+    return remote_host or "unknown"
+
+
+class Rejected(Exception):
+    """Raised by AdmissionController.admit(); maps to HTTP 429 with a Retry-After header."""
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Takes one token. Returns 0 on success, else the seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """
+    Decides whether POST /task may accept another task.
+
+    1. Load: in-flight tasks (ZCARD tasks:active) and total agent queue depth (XINFO GROUPS
+       lag + pending) from a snapshot refreshed at most every SNAPSHOT_TTL_SECONDS, so a
+       burst of submissions costs one pipelined round trip per second, not one per request.
+    2. Fairness: a per-client token bucket (in-process, keyed by remote address, or by
+       X-Client-ID when the request comes through one of ADMISSION_TRUSTED_PROXIES).
+
+    Rejections carry a Retry-After estimate: for too many tasks in flight, the excess divided
+    by the task turnover (tasks finished in the last TURNOVER_WINDOW_SECONDS, counted in
+    tasks:expiring); for queue depth, the excess divided by the queues' observed step drain
+    rate (growth of the groups' entries-read between snapshots); for rate limits, the time
+    until the client's next token. If Redis is unreachable we admit
+    (fail open): the queues themselves still apply backpressure.
+    """
+    def __init__(self, redis: RedisClient, max_in_flight: int = MAX_IN_FLIGHT_TASKS, max_queue_depth: int = MAX_QUEUE_DEPTH,
+                 client_rate: float = CLIENT_RATE_PER_SECOND, client_burst: int = CLIENT_BURST):
+        self.redis = redis
+        self.max_in_flight = max_in_flight
+        self.max_queue_depth = max_queue_depth
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = asyncio.Lock()
+        self._snapshot_at = 0.0
+        self.in_flight = 0
+        self.queue_depth = 0
+        # Steps delivered per second across all agent queues (None until two snapshots exist).
+        self.drain_rate: Optional[float] = None
+        # Tasks finished per second over the last TURNOVER_WINDOW_SECONDS.
+        self.task_turnover: Optional[float] = None
+        self._entries_read: Optional[int] = None
+        self.stats = {
+            "admitted": 0,
+            "rejected_in_flight": 0,
+            "rejected_queue_depth": 0,
+            "rejected_rate_limit": 0,
+        }
+
+    def queues(self):
+        # Every lane of every agent counts towards the depth.
+        return [(queue_name(agent, priority.value), f"group:{agent.value}") for agent in AgentType for priority in Priority]
+
+    async def admit(self, client_id: str):
+        """Returns if the task may be accepted; raises Rejected otherwise."""
+        await self._refresh()
+
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            self.stats["rejected_in_flight"] += 1
+            raise Rejected(f"Too many tasks in flight ({self.in_flight}/{self.max_in_flight})",
+                           self._drain_time(self.in_flight - self.max_in_flight + 1, self.task_turnover))
+        if self.max_queue_depth and self.queue_depth >= self.max_queue_depth:
+            self.stats["rejected_queue_depth"] += 1
+            raise Rejected(f"Agent queues are full ({self.queue_depth}/{self.max_queue_depth} steps)",
+                           self._drain_time(self.queue_depth - self.max_queue_depth + 1, self.drain_rate))
+
+        if self.client_rate > 0:
+            wait = self._bucket(client_id).take()
+            if wait > 0:
+                self.stats["rejected_rate_limit"] += 1
+                raise Rejected(f"Rate limit exceeded for client {client_id}", wait)
+
+        self.stats["admitted"] += 1
+
+    def _bucket(self, client_id: str) -> TokenBucket:
+        bucket = self._buckets.get(client_id)
+        if bucket is None:
+            bucket = self._buckets[client_id] = TokenBucket(self.client_rate, self.client_burst)
+            if len(self._buckets) > MAX_TRACKED_CLIENTS:
+                # The oldest idle client's bucket has long refilled; forgetting it is free.
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(client_id)
+        return bucket
+
+    @staticmethod
+    def _drain_time(excess: int, rate: Optional[float]) -> float:
+        """Seconds until `excess` units drain at `rate` units/sec (tasks or steps, matching the excess)."""
+        if not rate:
+            return DEFAULT_RETRY_AFTER_SECONDS
+        return min(MAX_RETRY_AFTER_SECONDS, excess / rate)
+
+    async def _refresh(self):
+        if time.monotonic() - self._snapshot_at < SNAPSHOT_TTL_SECONDS:
+            return
+        async with self._lock:
+            # Someone else refreshed while we waited for the lock.
+            now = time.monotonic()
+            if now - self._snapshot_at < SNAPSHOT_TTL_SECONDS:
+                return
+            try:
+                pipe = self.redis.redis.pipeline(transaction=False)
+                pipe.zcard(ACTIVE_TASKS_KEY)
+                # Finished tasks are scored with finish time + TTL, so this counts the recent finishes.
+                expires_now = time.time() + TASK_EVENTS_TTL_SECONDS
+                pipe.zcount(EXPIRING_TASKS_KEY, expires_now - TURNOVER_WINDOW_SECONDS, expires_now)
+                for queue, _ in self.queues():
+                    pipe.xinfo_groups(queue)
+                results = await pipe.execute(raise_on_error=False)
+            except Exception as e:
+                logger.warning(f"Admission snapshot failed, admitting without load check: {e}")
+                self._snapshot_at = now
+                return
+
+            in_flight, finished, groups_by_queue = results[0], results[1], results[2:]
+            depth = 0
+            entries_read = 0
+            for (_, group_name), groups in zip(self.queues(), groups_by_queue):
+                if isinstance(groups, Exception):
+                    # Queue not created yet: nothing waiting.
+                    continue
+                for group in groups:
+                    if group.get("name") != group_name:
+                        continue
+                    depth += (group.get("lag") or 0) + (group.get("pending") or 0)
+                    entries_read += group.get("entries-read") or 0
+
+            if self._entries_read is not None and now > self._snapshot_at and entries_read >= self._entries_read:
+                self.drain_rate = (entries_read - self._entries_read) / (now - self._snapshot_at)
+            self._entries_read = entries_read
+            self.in_flight = in_flight if isinstance(in_flight, int) else 0
+            self.task_turnover = finished / TURNOVER_WINDOW_SECONDS if isinstance(finished, int) and finished else None
+            self.queue_depth = depth
+            self._snapshot_at = now
+
+
+# Global instance
+admission_controller = AdmissionController(redis_client)
+REGISTRY.register_stats("agentic_admission", admission_controller.stats, "Admission decisions")
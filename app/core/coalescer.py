@@ -0,0 +1,87 @@
+import os
+import hashlib
+import logging
+from typing import Optional
+from .plan_cache import normalize_prompt
+from ..models.task import Priority
+from ..queue.redis_client import RedisBatch, RedisClient, redis_client, TASK_EVENTS_TTL_SECONDS
+from ..queue.retention import ABANDONED_TASK_SECONDS
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+TASK_COALESCING = os.getenv("TASK_COALESCING", "false").lower() == "true"
+# Identical prompts submitted within this many seconds of the first one share its execution.
+TASK_COALESCING_WINDOW_SECONDS = int(os.getenv("TASK_COALESCING_WINDOW_SECONDS", "10"))
+# A follower must resolve to its leader for as long as the leader's stream can exist.
+ALIAS_TTL_SECONDS = ABANDONED_TASK_SECONDS + TASK_EVENTS_TTL_SECONDS
+
+
+class TaskCoalescer:
+    """
+    Singleflight for task submissions (opt-in via TASK_COALESCING).
+
+    The first submission of a normalized prompt and priority becomes the leader: it runs
+    normally, and `lead()` adds its claim on `coalesce:{priority}:{hash}` (SET NX, expiring
+    after the window) to the same transaction that publishes its first event and queues it.
+    A leader is therefore only visible once its event stream exists. MULTI does not roll back
+    a command that fails inside it, so a leader whose transaction fails drops its claim again
+    with `release()`. Identical submissions within the window become followers: they get
+    their own task_id, stored as an alias (`task_alias:{task_id}` -> leader) instead of
+    running anything. `resolve()` maps a follower to the leader, so its SSE stream is the
+    leader's event stream, fanned out by the stream hub like any other viewer.
+
+    Two identical submissions that both find no leader both run; only one of them claims the key.
+    """
+    def __init__(self, redis: RedisClient, window_seconds: int = TASK_COALESCING_WINDOW_SECONDS):
+        self.redis = redis
+        self.window_seconds = window_seconds
+        self.stats = {
+            "leaders": 0,
+            "followers": 0,
+        }
+
+    @staticmethod
+    def key(prompt: str, priority: Priority = Priority.STANDARD) -> str:
+        return f"coalesce:{priority.value}:{hashlib.sha256(normalize_prompt(prompt).encode('utf-8')).hexdigest()}"
+
+    async def claim(self, task_id: str, prompt: str, priority: Priority = Priority.STANDARD) -> Optional[str]:
+        """
+        Returns the in-flight leader's task_id if there is one (the alias is already recorded;
+        the caller must not run anything), else None: the caller runs the task and adds
+        `lead()` to the batch that submits it.
+        """
+        leader_id = await self.redis.redis.get(self.key(prompt, priority))
+        if not leader_id:
+            return None
+        await self.redis.redis.set(f"task_alias:{task_id}", leader_id, ex=ALIAS_TTL_SECONDS)
+        self.stats["followers"] += 1
+        logger.info(f"🔗 Task {task_id} coalesced into in-flight task {leader_id}")
+        return leader_id
+
+    def lead(self, batch: RedisBatch, task_id: str, prompt: str, priority: Priority = Priority.STANDARD) -> RedisBatch:
+        """Adds the claim making `task_id` the leader for its prompt to `batch` (kept by an earlier leader)."""
+        batch.pipe.set(self.key(prompt, priority), task_id, nx=True, ex=self.window_seconds)
+        self.stats["leaders"] += 1
+        return batch
+
+    async def release(self, task_id: str, prompt: str, priority: Priority = Priority.STANDARD):
+        """Drops `task_id`'s claim after its submission failed, so nobody coalesces into it."""
+        try:
+            await self.redis.release(self.key(prompt, priority), task_id)
+        except Exception as e:
+            # The claim expires with the coalescing window anyway.
+            logger.warning(f"Could not release coalescing claim of {task_id}: {e}")
+
+    async def resolve(self, task_id: str) -> str:
+        """The task whose events `task_id` should stream (itself unless it is a follower)."""
+        try:
+            return await self.redis.redis.get(f"task_alias:{task_id}") or task_id
+        except Exception as e:
+            logger.warning(f"Could not resolve task alias for {task_id}: {e}")
+            return task_id
+
+
+# Global instance
+task_coalescer = TaskCoalescer(redis_client)
+REGISTRY.register_stats("agentic_coalescer", task_coalescer.stats, "Coalesced task submissions")
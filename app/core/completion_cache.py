@@ -0,0 +1,189 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048"))
+# Upper bound on cached completion text (UTF-8 bytes) per process.
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Near-duplicate tier: serve a temperature>0 call from a cached completion whose prompt
+# fingerprint (64-bit SimHash) is within LLM_CACHE_NEAR_DUPLICATE_BITS bits.
+LLM_CACHE_NEAR_DUPLICATE = os.getenv("LLM_CACHE_NEAR_DUPLICATE", "false").lower() == "true"
+LLM_CACHE_NEAR_DUPLICATE_BITS = int(os.getenv("LLM_CACHE_NEAR_DUPLICATE_BITS", "3"))
+
+SIMHASH_BITS = 64
+# The fingerprint is indexed in bands; a match within N differing bits must agree on
+# at least one of N+1 bands (pigeonhole), so lookups only scan that band's bucket.
+# Bands narrower than 8 bits would make buckets too coarse, so N is capped at _MAX_BANDS - 1.
+_MAX_BANDS = 8
+_WORD = re.compile(r"\w+")
+
+
+def simhash(text: str) -> int:
+    """
+    64-bit SimHash over character 4-grams of `text`, after lower-casing and dropping
+    punctuation, so case/spacing/punctuation differences cost nothing and small edits few bits.
+    """
+    normalized = " ".join(_WORD.findall(text.lower()))
+    shingles = {normalized[i:i + 4] for i in range(max(1, len(normalized) - 3))}
+    weights = [0] * SIMHASH_BITS
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(SIMHASH_BITS) if weights[bit] > 0)
+
+
+class _Entry:
+    __slots__ = ("chunks", "size", "expires_at", "scope", "fingerprint")
+
+    def __init__(self, chunks: List[str], expires_at: float, scope: Optional[str], fingerprint: Optional[int]):
+        self.chunks = chunks
+        self.size = sum(len(chunk.encode("utf-8")) for chunk in chunks)
+        self.expires_at = expires_at
+        self.scope = scope
+        self.fingerprint = fingerprint
+
+
+class CompletionCache:
+    """
+    In-process cache of LLM completions, in front of the shared call path (`app/core/llm.py`).
+
+    - Exact tier: key = hash of (model, messages, temperature, other call options).
+    - Near-duplicate tier (opt-in, temperature>0 only): same model and options, and a prompt
+      SimHash within `max_distance` bits of a cached one. Sampling at temperature>0 already
+      varies the answer, so a near-identical prompt's completion is an acceptable substitute;
+      temperature 0 calls are only ever served exactly.
+
+    Completions are stored as the chunks they were produced in, so a cached streamed
+    completion can be replayed chunk by chunk. Memory is bounded by entry count and total
+    bytes (LRU eviction); entries expire after `ttl` seconds.
+    """
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES, max_bytes: int = LLM_CACHE_MAX_BYTES,
+                 ttl: float = LLM_CACHE_TTL_SECONDS, near_duplicate: bool = LLM_CACHE_NEAR_DUPLICATE,
+                 max_distance: int = LLM_CACHE_NEAR_DUPLICATE_BITS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.near_duplicate = near_duplicate
+        if not 0 <= max_distance < _MAX_BANDS:
+            clamped = min(max(max_distance, 0), _MAX_BANDS - 1)
+            logger.warning(f"LLM_CACHE_NEAR_DUPLICATE_BITS={max_distance} is outside 0-{_MAX_BANDS - 1}; using {clamped}.")
+            max_distance = clamped
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        # (scope, band number, band value) -> keys
+        self._band_index: Dict[tuple, Set[str]] = {}
+        self.stats = {
+            "exact_hits": 0,
+            "near_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+        }
+
+    @staticmethod
+    def key(model: str, messages: list, temperature: float, options: dict) -> str:
+        raw = json.dumps([model, messages, temperature, options], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _scope(model: str, options: dict) -> str:
+        return hashlib.sha256(json.dumps([model, options], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _prompt_text(messages: list) -> str:
+        return "\n".join(f"{m.get('role', '')}: {m.get('content', '')}" for m in messages)
+
+    def get(self, model: str, messages: list, temperature: float, options: dict) -> Optional[List[str]]:
+        """Returns the cached chunks for this call, or None."""
+        key = self.key(model, messages, temperature, options)
+        entry = self._live(key)
+        if entry is not None:
+            self.stats["exact_hits"] += 1
+            return entry.chunks
+
+        if self.near_duplicate and temperature > 0:
+            scope = self._scope(model, options)
+            fingerprint = simhash(self._prompt_text(messages))
+            for candidate in self._candidates(scope, fingerprint):
+                entry = self._live(candidate)
+                if entry is not None and bin(entry.fingerprint ^ fingerprint).count("1") <= self.max_distance:
+                    self.stats["near_hits"] += 1
+                    return entry.chunks
+
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, model: str, messages: list, temperature: float, options: dict, chunks: List[str]):
+        key = self.key(model, messages, temperature, options)
+        scope = fingerprint = None
+        if self.near_duplicate and temperature > 0:
+            scope = self._scope(model, options)
+            fingerprint = simhash(self._prompt_text(messages))
+
+        entry = _Entry(list(chunks), time.time() + self.ttl, scope, fingerprint)
+        if entry.size > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = entry
+        self._bytes += entry.size
+        if fingerprint is not None:
+            for band in self._bands(fingerprint):
+                self._band_index.setdefault((scope, *band), set()).add(key)
+        self.stats["stores"] += 1
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.stats["evictions"] += 1
+
+    def _live(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.time():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _bands(self, fingerprint: int):
+        width = SIMHASH_BITS // self.bands
+        mask = (1 << width) - 1
+        return [(band, fingerprint >> (band * width) & mask) for band in range(self.bands)]
+
+    def _candidates(self, scope: str, fingerprint: int) -> Set[str]:
+        keys: Set[str] = set()
+        for band in self._bands(fingerprint):
+            keys.update(self._band_index.get((scope, *band), ()))
+        return keys
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry.size
+        if entry.fingerprint is not None:
+            for band in self._bands(entry.fingerprint):
+                bucket = self._band_index.get((entry.scope, *band))
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._band_index[(entry.scope, *band)]
+
+
+# Global instance
+completion_cache = CompletionCache()
+REGISTRY.register_stats("agentic_completion_cache", completion_cache.stats, "LLM completion cache")
@@ -5,21 +5,22 @@ from typing import Optional
 logger = logging.getLogger(__name__)
 
 try:
-    from groq import Groq
+    import httpx
+    from groq import AsyncGroq, DefaultAsyncHttpxClient
 except ImportError:
-    Groq = None # Handle case where package isn't installed yet (resilience)
+    AsyncGroq = None # Handle case where package isn't installed yet (resilience)
 
-def get_groq_client() -> Optional['Groq']:
-    """
-    Attempts to return a Groq client.
-    Returns None if:
-    - The API key is missing.
-    - The 'groq' library is not installed.
-    - Initialization fails for any reason.
-    
-    This function NEVER raises an exception, ensuring infrastructure safety.
-    """
-    if Groq is None:
+# Connection pool shared by every LLM call in the process (planner + all workers).
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "100"))
+GROQ_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("GROQ_MAX_KEEPALIVE_CONNECTIONS", "20"))
+GROQ_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("GROQ_KEEPALIVE_EXPIRY_SECONDS", "30"))
+GROQ_TIMEOUT_SECONDS = float(os.getenv("GROQ_TIMEOUT_SECONDS", "60"))
+
+_client: Optional['AsyncGroq'] = None
+_initialized = False
+
+def _create_client() -> Optional['AsyncGroq']:
+    if AsyncGroq is None:
         logger.debug("Groq library not installed or import failed.")
         return None
 
@@ -34,8 +35,44 @@ def get_groq_client() -> Optional['Groq']:
         return None
 
     try:
-        client = Groq(api_key=api_key)
+        http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=GROQ_MAX_CONNECTIONS,
+                max_keepalive_connections=GROQ_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=GROQ_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+        )
+        client = AsyncGroq(api_key=api_key, http_client=http_client, timeout=GROQ_TIMEOUT_SECONDS)
+        logger.info(f"🧠 Groq async client ready (pool: {GROQ_MAX_CONNECTIONS} connections, {GROQ_MAX_KEEPALIVE_CONNECTIONS} keep-alive)")
         return client
     except Exception as e:
         logger.error(f"Failed to initialize Groq client: {e}. Falling back to deterministic instra-structure.")
         return None
+
+def get_groq_client() -> Optional['AsyncGroq']:
+    """
+    Returns the process-wide async Groq client (created on first use, normally at startup).
+    Returns None if:
+    - USE_GROQ is not enabled or the API key is missing.
+    - The 'groq' library is not installed.
+    - Initialization fails for any reason.
+
+    This function NEVER raises an exception, ensuring infrastructure safety.
+    All callers share one keep-alive connection pool; calls must be awaited.
+    """
+    global _client, _initialized
+    if not _initialized:
+        _client = _create_client()
+        _initialized = True
+    return _client
+
+async def close_groq_client():
+    """Closes the shared client and its connection pool (called on shutdown)."""
+    global _client, _initialized
+    if _client is not None:
+        try:
+            await _client.close()
+        except Exception as e:
+            logger.warning(f"Error closing Groq client: {e}")
+    _client = None
+    _initialized = False
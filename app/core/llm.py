@@ -0,0 +1,111 @@
+import time
+import logging
+from typing import AsyncIterator, List
+from .groq_client import get_groq_client
+from .completion_cache import LLM_CACHE_ENABLED, completion_cache
+from .rate_limiter import estimate_tokens, llm_rate_limiter
+from .tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+def _client():
+    groq = get_groq_client()
+    if groq is None:
+        raise RuntimeError("LLM client is not available")
+    return groq
+
+
+async def complete(messages: List[dict], model: str, temperature: float = 0.0, cache: bool = True, **options) -> str:
+    """
+    Shared non-streaming call path for every agent: returns the completion text.
+    Served from the completion cache when possible (pass cache=False to always call the model).
+    Model calls first wait for cluster-wide rate-limit capacity (see LLMRateLimiter).
+    Raises like the underlying client; callers keep their own fallbacks.
+    """
+    async with tracer.span("llm.complete", model=model) as span:
+        use_cache = cache and LLM_CACHE_ENABLED
+        if use_cache:
+            chunks = completion_cache.get(model, messages, temperature, options)
+            if chunks is not None:
+                logger.debug(f"LLM cache hit ({model})")
+                if span is not None:
+                    span.set(cached=True)
+                return "".join(chunks)
+
+        client = _client()
+        estimated = estimate_tokens(messages, options.get("max_tokens"))
+        async with tracer.span("llm.rate_limit"):
+            await llm_rate_limiter.acquire(model, estimated)
+        chat_completion = await client.chat.completions.create(
+            messages=messages,
+            model=model,
+            temperature=temperature,
+            **options,
+        )
+        text = chat_completion.choices[0].message.content
+        usage = getattr(chat_completion, "usage", None)
+        if usage is not None and getattr(usage, "total_tokens", None):
+            await llm_rate_limiter.reconcile(model, estimated, usage.total_tokens)
+            if span is not None:
+                span.set(total_tokens=usage.total_tokens)
+
+        if use_cache and text:
+            completion_cache.put(model, messages, temperature, options, [text])
+        return text
+
+
+async def stream(messages: List[dict], model: str, temperature: float = 0.0, cache: bool = True, **options) -> AsyncIterator[str]:
+    """
+    Shared streaming call path: yields content tokens as they arrive.
+    A cached completion is replayed as its original chunks; a stream is only cached once it
+    has finished, so a failure mid-stream never leaves a truncated entry behind.
+    """
+    # Not made current: the caller's own work runs between our yields.
+    span = tracer.start("llm.stream", model=model)
+    error = None
+    try:
+        use_cache = cache and LLM_CACHE_ENABLED
+        if use_cache:
+            chunks = completion_cache.get(model, messages, temperature, options)
+            if chunks is not None:
+                logger.debug(f"LLM cache hit ({model}), replaying {len(chunks)} chunks")
+                if span is not None:
+                    span.set(cached=True)
+                for chunk in chunks:
+                    yield chunk
+                return
+
+        client = _client()
+        estimated = estimate_tokens(messages, options.get("max_tokens"))
+        async with tracer.span("llm.rate_limit"):
+            await llm_rate_limiter.acquire(model, estimated)
+        response = await client.chat.completions.create(
+            messages=messages,
+            model=model,
+            temperature=temperature,
+            stream=True,
+            **options,
+        )
+        received = []
+        async for chunk in response:
+            content = chunk.choices[0].delta.content
+            if content:
+                if not received and span is not None:
+                    span.set(first_token_ms=round((time.time_ns() - span.start_ns) / 1e6, 3))
+                received.append(content)
+                yield content
+
+        # Streams carry no usage here; count what was actually generated instead of the budget.
+        await llm_rate_limiter.reconcile(model, estimated, estimate_tokens(messages, max_tokens=sum(len(c) for c in received) // 4 or 1))
+
+        if use_cache and received:
+            completion_cache.put(model, messages, temperature, options, received)
+    except GeneratorExit:
+        # The caller stopped reading early; not a failure of the call.
+        raise
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        tracer.finish(span, error)
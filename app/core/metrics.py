@@ -0,0 +1,223 @@
+import time
+import asyncio
+import logging
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; covers a cache hit (ms) up to a slow multi-step task (minutes).
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), registry: Optional["Registry"] = None):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonic count, e.g. `retries.inc(agent="writer")`."""
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(value)}" for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    """Current value; either set explicitly or read from `function` at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, *args, function: Optional[Callable[[], float]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function = function
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def clear(self):
+        self._values = {}
+
+    def render(self) -> List[str]:
+        if self._function is not None:
+            try:
+                self._values[()] = self._function()
+            except Exception as e:
+                logger.warning(f"Gauge {self.name} failed: {e}")
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(value)}" for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observations (seconds). Each observation is one bisect and two additions
+    into per-label bucket counts; cumulative buckets are only computed when scraped.
+    """
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts..., +Inf count], sum
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            self._sums[key] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self._sums[key] += value
+
+    def time(self, **labels) -> "_Timer":
+        """`with histogram.time(agent="writer"): ...` observes the block's duration."""
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, counts in list(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(self._sums[key])}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class _Stats:
+    """Exposes an existing `stats` dict of counters as `<prefix>_<key>_total`."""
+    def __init__(self, prefix: str, stats: dict, help: str):
+        self.prefix = prefix
+        self.stats = stats
+        self.help = help
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, value in list(self.stats.items()):
+            if isinstance(value, (int, float)):
+                name = f"{self.prefix}_{key}_total"
+                lines += [f"# HELP {name} {self.help} ({key})", f"# TYPE {name} counter", f"{name} {_number(value)}"]
+        return lines
+
+
+class Registry:
+    """
+    Process-local metrics, rendered in the Prometheus text format when scraped.
+
+    Architecture Note:
+    - Recording is a dict update on the event loop's thread: no locks, no I/O, no allocation
+      beyond the first observation of a label set.
+    - Anything that costs a Redis round trip (queue depth, pending entries) is a collector that
+      only runs when /metrics is scraped.
+    - Each process has its own registry; scrape every API and worker process
+      (see `python -m app.worker --metrics-port`).
+    """
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Callable] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def register_stats(self, prefix: str, stats: dict, help: str):
+        self._metrics.append(_Stats(prefix, stats, help))
+
+    def register_collector(self, collector: Callable):
+        """`collector` (sync or async) refreshes gauges right before a scrape."""
+        self._collectors.append(collector)
+
+    async def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                result = collector()
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.warning(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+
+        lines = []
+        for metric in self._metrics:
+            samples = metric.render()
+            if isinstance(metric, _Stats):
+                lines += samples
+            elif samples:
+                lines += metric.header() + samples
+        return "\n".join(lines) + "\n"
+
+
+# Global instance
+REGISTRY = Registry()
+
+# --- Stage latencies ---
+planner_latency = Histogram("agentic_planner_duration_seconds", "Time to produce a task plan", ["source"])
+queue_wait = Histogram("agentic_queue_wait_seconds", "Time a step waited in its agent queue", ["agent", "priority"])
+step_duration = Histogram("agentic_step_duration_seconds", "process_step duration", ["agent", "outcome"])
+time_to_first_output = Histogram("agentic_time_to_first_output_seconds", "Task submission to first PARTIAL_OUTPUT")
+task_duration = Histogram("agentic_task_duration_seconds", "Task submission to end of orchestration", ["outcome"])
+
+# --- Counters ---
+retries = Counter("agentic_retries_total", "Steps scheduled for retry", ["agent", "error"])
+dead_letters = Counter("agentic_dead_letters_total", "Steps moved to a dead-letter stream", ["agent"])
+groq_fallbacks = Counter("agentic_groq_fallbacks_total", "Deterministic fallbacks taken after a Groq failure", ["agent"])
+events_published = Counter("agentic_events_published_total", "Events published to task streams", ["type"])
+
+# --- Gauges (refreshed at scrape time) ---
+queue_depth = Gauge("agentic_queue_depth", "Entries not yet delivered to the consumer group", ["queue"])
+queue_pending = Gauge("agentic_queue_pending", "Entries delivered but not acknowledged", ["queue"])
@@ -1,75 +1,192 @@
+import os
+import time
 import logging
-import asyncio
-from ..models.task import TaskPlan, StepStatus
+from typing import Dict, List, Optional
+from ..models.task import TaskPlan, Step, StepStatus, Priority
 from ..models.events import Event, EventType, EventSource
 from ..queue.redis_client import redis_client
+from ..queue.lanes import queue_name
+from ..streaming.hub import step_hub
 from ..agents.planner import PlannerAgent
+from . import metrics
+from .rate_limiter import RATE_LIMIT_ERRORS
+from .tracing import tracer, traceparent
 
 logger = logging.getLogger(__name__)
 
+# Give up on a task if no step completes for this long (a dispatched step is stuck or lost).
+STEP_TIMEOUT_SECONDS = float(os.getenv("ORCHESTRATOR_STEP_TIMEOUT_SECONDS", "1800"))
+
 class Orchestrator:
     def __init__(self):
         self.planner = PlannerAgent()
 
-    async def process_task(self, task_id: str, task_input: str):
+    async def process_task(self, task_id: str, task_input: str, priority: Priority = Priority.STANDARD, submitted_at: Optional[float] = None,
+                           retry_count: int = 0):
         """
         Orchestrates the entire lifecycle of a task.
-        
+
         Architecture Note:
-        - This method acts as a "Fire-and-Forget" dispatcher.
-        - Steps are pushed to Redis Streams (queues).
-        - Workers consume these independently and asynchronously.
-        - No blocking wait for step completion here.
-        
-        1. Calls Planner to get steps.
-        2. Dispatches steps to appropriate queues.
+        - The plan is a DAG: each step lists the steps it `depends_on`.
+        - Steps are pushed to Redis Streams (queues) as soon as their prerequisites complete;
+          independent steps are dispatched together and run in parallel.
+        - Workers report completion on `task_steps:{task_id}`, which we watch through the
+          shared step hub, so no time is spent on fixed sleeps between steps.
+        - Every step goes to its agent's `priority` lane.
+        - `submitted_at` (epoch seconds, default now) travels with the steps, so stage latencies
+          (time to first output, task duration) are measured from the submission.
+        - The plan and the dispatched steps are recorded in `task_state:{task_id}`. A submission
+          reclaimed after its orchestrator died resumes from there and from `task_steps`, so
+          nothing is planned, announced or dispatched twice. Finished tasks are skipped.
+
+        1. Calls Planner to get steps (or loads the stored plan).
+        2. Dispatches ready steps to appropriate queues until the whole plan has completed.
+
+        Failures end the task with a terminal ERROR event. Only LLM rate-limit errors from
+        planning propagate, so the caller can plan the task again later (`retry_count` > 0).
         """
-        logger.info(f"Orchestrator processing task {task_id}")
+        submitted_at = submitted_at or time.time()
+        active, state, finished = await redis_client.get_task_state(task_id)
+        if not active:
+            # Finished (or reaped) while its submission was pending, e.g. before a reclaim.
+            logger.info(f"Orchestrator skipping task {task_id}: no longer active")
+            return
+        logger.info(f"Orchestrator {'resuming' if state.get('plan') else 'processing'} task {task_id}")
 
         try:
             # 1. Planning Phase
-            plan = await self.planner.plan(task_id, task_input)
+            if state.get("plan"):
+                plan = TaskPlan.parse_raw(state["plan"])
+            else:
+                async with tracer.span("planner.plan"):
+                    plan = await self.planner.plan(task_id, task_input, announce=not retry_count)
+                await redis_client.batch().store_plan(task_id, plan.json()).execute()
 
-            # 2. Execution Phase (Dispatching)
-            for step in plan.steps:
-                await self._dispatch_step(task_id, step)
-                # In a real system, we'd wait for completion here or use a state machine.
-                # For Phase 2, we just dispatch and verify the flow.
-                await asyncio.sleep(0.5) 
+            # 2. Execution Phase (Dispatching in dependency order)
+            completed = await self._run_plan(task_id, plan, priority, submitted_at, state, finished)
 
-            # 3. Completion (Dispatching Complete)
-            logger.info(f"Task {task_id}: All steps dispatched.")
-            # We do NOT emit DONE here because workers are still running asynchronously.
-            # The last worker (Writer) will emit the DONE event.
+            # 3. Completion
+            # We do NOT emit DONE here: the last worker (Writer) emits it with its output.
+            metrics.task_duration.observe(time.time() - submitted_at, outcome="completed" if completed else "failed")
 
+        except RATE_LIMIT_ERRORS:
+            # Planning ran out of LLM capacity before anything was dispatched: not a task failure.
+            raise
         except Exception as e:
+            metrics.task_duration.observe(time.time() - submitted_at, outcome="error")
             logger.error(f"Orchestration failed for task {task_id}: {e}")
             await redis_client.publish_event(task_id, Event(
                 type=EventType.ERROR,
                 source=EventSource.SYSTEM,
                 message=f"System error: {str(e)}"
-            ))
+            ), terminal=True)
+
+    async def _run_plan(self, task_id: str, plan: TaskPlan, priority: Priority = Priority.STANDARD, submitted_at: Optional[float] = None,
+                        state: Optional[dict] = None, finished: Optional[List[tuple]] = None) -> bool:
+        """
+        Dispatches every step whose prerequisites have completed, then waits for the next
+        completion event. Returns True once all steps completed, False as soon as one of them
+        failed for good (the failing worker has already published the terminal ERROR).
+
+        `state` and `finished` (from get_task_state) restore a resumed task before anything is
+        dispatched: steps already dispatched are in progress, and completions recorded so far
+        apply to them only. Live reads continue after the last of those completions.
+        """
+        steps: Dict[int, Step] = {step.id: step for step in plan.steps}
+        for step in steps.values():
+            if (state or {}).get(f"dispatched:{step.id}"):
+                step.status = StepStatus.IN_PROGRESS
+        last_id = "0-0"
+        for last_id, data in finished or []:
+            if self._step_finished(task_id, steps, data) == StepStatus.FAILED:
+                return False
+        # Subscribing before the first dispatch means no completion can be missed.
+        subscription = await step_hub.subscribe(task_id, last_id)
+        try:
+            deadline = time.monotonic() + STEP_TIMEOUT_SECONDS
+            while True:
+                ready = [
+                    step for step in steps.values()
+                    if step.status == StepStatus.PENDING
+                    and all(steps[dep].status == StepStatus.COMPLETED for dep in step.depends_on if dep in steps)
+                ]
+                if ready:
+                    await self._dispatch_steps(task_id, ready, priority, submitted_at)
+
+                running = [step.id for step in steps.values() if step.status == StepStatus.IN_PROGRESS]
+                if not running:
+                    blocked = [step.id for step in steps.values() if step.status == StepStatus.PENDING]
+                    if blocked:
+                        raise ValueError(f"Steps {blocked} have unsatisfiable dependencies")
+                    logger.info(f"Task {task_id}: All {len(steps)} steps completed.")
+                    return True
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Steps {running} did not complete within {STEP_TIMEOUT_SECONDS}s")
+
+                for _, data in await subscription.next_batch(timeout=remaining):
+                    status = self._step_finished(task_id, steps, data)
+                    if status == StepStatus.FAILED:
+                        return False
+                    if status == StepStatus.COMPLETED:
+                        deadline = time.monotonic() + STEP_TIMEOUT_SECONDS
+        finally:
+            step_hub.unsubscribe(subscription)
+
+    @staticmethod
+    def _step_finished(task_id: str, steps: Dict[int, Step], data: dict) -> Optional[StepStatus]:
+        """Applies one `task_steps` entry to the step it names; returns the new status, or None if ignored."""
+        step = steps.get(int(data.get("step_id", 0)))
+        # Duplicates (a redelivered step finishing twice) are ignored.
+        if step is None or step.status != StepStatus.IN_PROGRESS:
+            return None
+        if data.get("status") == StepStatus.COMPLETED.value:
+            step.status = StepStatus.COMPLETED
+            logger.info(f"Task {task_id}: Step {step.id} completed.")
+        else:
+            step.status = StepStatus.FAILED
+            logger.warning(f"Task {task_id}: Step {step.id} failed; not dispatching its dependents.")
+        return step.status
 
-    async def _dispatch_step(self, task_id: str, step):
+    async def _dispatch_steps(self, task_id: str, steps: List[Step], priority: Priority = Priority.STANDARD, submitted_at: Optional[float] = None):
         """
-        Dispatches a single step to its agent's Redis stream.
+        Dispatches steps to their agents' Redis streams (the lane for `priority`).
         """
-        # Publish to user stream that we are dispatching
-        await redis_client.publish_event(task_id, Event(
-            type=EventType.STATUS,
-            source=EventSource.SYSTEM, # Marked as System/Orchestrator
-            message=f"Step {step.id}: Dispatching '{step.title}' to {step.assigned_agent.value}"
-        ))
-
-        # Push to specific agent queue (Redis Stream)
-        # e.g. "queue:retriever"
-        agent_queue = f"queue:{step.assigned_agent.value}"
-        
-        # We put the task_id and step details in the queue
-        await redis_client.redis.xadd(agent_queue, {
-            "task_id": task_id,
-            "step_id": step.id,
-            "instruction": step.description
-        })
-
-        logger.info(f"Dispatched step {step.id} to {agent_queue}")
+        async with tracer.span("orchestrator.dispatch", steps=",".join(str(step.id) for step in steps)):
+            await self._enqueue_steps(task_id, steps, priority, submitted_at)
+
+        for step in steps:
+            step.status = StepStatus.IN_PROGRESS
+            logger.info(f"Dispatched step {step.id} to {queue_name(step.assigned_agent, priority.value)}")
+
+    async def _enqueue_steps(self, task_id: str, steps: List[Step], priority: Priority, submitted_at: Optional[float]):
+        # Publish to user stream that we are dispatching and push to the specific agent
+        # queues (Redis Streams, e.g. "queue:retriever") in one atomic round trip.
+        batch = redis_client.batch(transaction=True)
+        enqueued_at = f"{time.time():.6f}"
+        submitted_at = f"{submitted_at:.6f}" if submitted_at else enqueued_at
+        # Workers continue the task's trace under the dispatch span.
+        context = traceparent()
+        for step in steps:
+            agent_queue = queue_name(step.assigned_agent, priority.value)
+            batch.publish_event(task_id, Event(
+                type=EventType.STATUS,
+                source=EventSource.SYSTEM, # Marked as System/Orchestrator
+                message=f"Step {step.id}: Dispatching '{step.title}' to {step.assigned_agent.value}"
+            ))
+
+            # We put the task_id and step details in the queue
+            fields = {
+                "task_id": task_id,
+                "step_id": step.id,
+                "instruction": step.description,
+                "priority": priority.value,
+                "enqueued_at": enqueued_at,
+                "submitted_at": submitted_at
+            }
+            if context:
+                fields["traceparent"] = context
+            batch.enqueue(agent_queue, fields)
+        batch.steps_dispatched(task_id, [step.id for step in steps])
+        await batch.execute()
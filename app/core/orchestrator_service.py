@@ -0,0 +1,137 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Optional
+from .orchestrator import Orchestrator
+from .tracing import tracer
+from . import metrics
+from .rate_limiter import RATE_LIMIT_ERRORS
+from ..models.events import Event, EventType, EventSource
+from ..models.task import Priority
+from ..queue.redis_client import RedisClient, redis_client
+from ..queue.consumer import GroupConsumer, PoisonMessageError
+from ..queue.retry_scheduler import RetryScheduler, retry_scheduler, policy_for, retry_delay
+
+logger = logging.getLogger(__name__)
+
+# Submitted tasks waiting for an orchestrator (written by POST /task).
+ORCHESTRATOR_QUEUE = "queue:orchestrator"
+ORCHESTRATOR_GROUP = "group:orchestrator"
+# Tasks orchestrated at once per process. Orchestration mostly waits on workers, so this can be high.
+ORCHESTRATOR_CONCURRENCY = int(os.getenv("ORCHESTRATOR_CONCURRENCY", "64"))
+# Submissions whose orchestrator died are picked up by another one after this long.
+ORCHESTRATOR_VISIBILITY_TIMEOUT_MS = int(os.getenv("ORCHESTRATOR_VISIBILITY_TIMEOUT_MS", "60000"))
+RECLAIM_INTERVAL_SECONDS = float(os.getenv("WORKER_RECLAIM_INTERVAL_SECONDS", "15"))
+# A submission that keeps dying (or erroring before its orchestration ends) fails its task after this many deliveries.
+ORCHESTRATOR_MAX_DELIVERIES = int(os.getenv("ORCHESTRATOR_MAX_DELIVERIES", "5"))
+
+
+class OrchestratorService(GroupConsumer):
+    """
+    Runs the Orchestrator as a queue consumer, so orchestration can live in its own
+    processes (see app/worker.py) instead of in the API's background tasks.
+
+    It reads `queue:orchestrator` with the same consumer-group loop as the agent workers
+    (GroupConsumer): up to `concurrency` tasks in flight, pending entries refreshed by a
+    heartbeat while they run, and a submission acknowledged only when its orchestration
+    has finished. A submission left pending by a dead process is reclaimed
+    and resumes from its stored state (see Orchestrator.process_task).
+
+    A plan that hits an LLM rate limit is parked in the retry scheduler with the rate-limit
+    backoff (or the provider's retry-after). A submission delivered more than
+    ORCHESTRATOR_MAX_DELIVERIES times, or out of rate-limit retries, ends its task with a
+    terminal ERROR and goes to `dead_letter:orchestrator`.
+    """
+    def __init__(self, redis: RedisClient = redis_client, concurrency: Optional[int] = None, scheduler: Optional[RetryScheduler] = None):
+        self.orchestrator = Orchestrator()
+        self.retry_scheduler = scheduler or retry_scheduler
+        super().__init__(
+            redis,
+            group_name=ORCHESTRATOR_GROUP,
+            queues=[ORCHESTRATOR_QUEUE],
+            concurrency=concurrency or ORCHESTRATOR_CONCURRENCY,
+            log_name="Orchestrator",
+            visibility_timeout_ms=ORCHESTRATOR_VISIBILITY_TIMEOUT_MS,
+            reclaim_interval_seconds=RECLAIM_INTERVAL_SECONDS,
+            max_deliveries=ORCHESTRATOR_MAX_DELIVERIES,
+        )
+
+    @staticmethod
+    def submission(task_id: str, task_input: str, priority: Priority, traceparent: Optional[str] = None) -> dict:
+        """Queue entry for a submitted task (enqueued by the API)."""
+        fields = {
+            "task_id": task_id,
+            "task": task_input,
+            "priority": priority.value,
+            "enqueued_at": f"{time.time():.6f}",
+        }
+        if traceparent:
+            fields["traceparent"] = traceparent
+        return fields
+
+    async def _handle(self, queue: str, msg_id: str, data: dict):
+        try:
+            task_id, task_input = data.get("task_id"), data.get("task")
+            if task_id and task_input:
+                try:
+                    priority = Priority(data.get("priority") or Priority.STANDARD.value)
+                except ValueError:
+                    priority = Priority.STANDARD
+                submitted_at = float(data["enqueued_at"]) if data.get("enqueued_at") else None
+                async with tracer.span("orchestrator.task", task_id=task_id, parent=data.get("traceparent"), priority=priority.value):
+                    if submitted_at:
+                        tracer.record("queue.wait", int(submitted_at * 1e9), queue=ORCHESTRATOR_QUEUE)
+                    # Failures end the task with a terminal ERROR event; only rate limits raise.
+                    await self.orchestrator.process_task(task_id, task_input, priority, submitted_at, int(data.get("retry_count", 0)))
+            else:
+                logger.warning(f"[Orchestrator] Invalid submission in {ORCHESTRATOR_QUEUE}: {data}")
+            await self.redis.ack(ORCHESTRATOR_QUEUE, ORCHESTRATOR_GROUP, msg_id)
+        except asyncio.CancelledError:
+            raise
+        except RATE_LIMIT_ERRORS as e:
+            try:
+                await self._retry_later(msg_id, data, e)
+            except Exception as retry_error:
+                logger.error(f"[Orchestrator] Could not schedule a retry of entry {msg_id}: {retry_error}")
+        except Exception as e:
+            # Left unacknowledged: reclaimed after the visibility timeout, up to ORCHESTRATOR_MAX_DELIVERIES times.
+            logger.error(f"[Orchestrator] Infrastructure error on entry {msg_id}: {e}")
+
+    async def _retry_later(self, msg_id: str, data: dict, error: BaseException):
+        """Parks a rate-limited submission in the retry scheduler (or fails its task), acknowledged in the same transaction."""
+        retry_count = int(data.get("retry_count", 0))
+        retrying = retry_count < policy_for(error).max_retries
+        batch = self.redis.batch(transaction=True)
+        if retrying:
+            delay = retry_delay(error, retry_count)
+            self.retry_scheduler.schedule(batch, ORCHESTRATOR_QUEUE, {**data, "retry_count": retry_count + 1}, delay)
+            logger.warning(f"[Orchestrator] Planning rate limited for task {data.get('task_id')}; retrying in {delay:.1f}s: {error}")
+        else:
+            self._fail_task(batch, data, error)
+        batch.pipe.xack(ORCHESTRATOR_QUEUE, ORCHESTRATOR_GROUP, msg_id)
+        await batch.execute()
+        if retrying:
+            metrics.retries.inc(agent="orchestrator", error=type(error).__name__)
+        else:
+            metrics.dead_letters.inc(agent="orchestrator")
+
+    async def _dead_letter_poison(self, queue: str, msg_id: str, data: dict, error: PoisonMessageError):
+        batch = self.redis.batch(transaction=True)
+        self._fail_task(batch, data, error)
+        batch.pipe.xack(queue, self.group_name, msg_id)
+        await batch.execute()
+        metrics.dead_letters.inc(agent="orchestrator")
+
+    def _fail_task(self, batch, data: dict, error: BaseException):
+        """Adds a terminal ERROR for the submission's task and its `dead_letter:orchestrator` entry to `batch`."""
+        task_id = data.get("task_id")
+        logger.critical(f"[Orchestrator] Giving up on task {task_id}: {error}")
+        if task_id:
+            batch.publish_event(task_id, Event(
+                type=EventType.ERROR,
+                source=EventSource.SYSTEM,
+                message=f"System error: orchestration abandoned. Details: {error}"
+            ), terminal=True)
+        self.retry_scheduler.dead_letter(batch, "orchestrator", data, error)
+
@@ -0,0 +1,112 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import List, Optional
+from ..models.task import Step
+from ..queue.redis_client import RedisClient, redis_client
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+PLAN_CACHE_ENABLED = os.getenv("PLAN_CACHE_ENABLED", "true").lower() == "true"
+PLAN_CACHE_TTL_SECONDS = int(os.getenv("PLAN_CACHE_TTL_SECONDS", "86400"))
+# Entries kept in the in-process tier (LRU); the Redis tier is bounded by its TTL.
+PLAN_CACHE_LOCAL_SIZE = int(os.getenv("PLAN_CACHE_LOCAL_SIZE", "1024"))
+# Bump whenever the planner prompt or plan parsing changes, so stale plans are never served.
+PLAN_CACHE_VERSION = "2"
+
+
+def normalize_prompt(text: str) -> str:
+    """Case- and whitespace-insensitive form of a prompt, so trivially different requests share a key."""
+    return " ".join(text.lower().split())
+
+
+class PlanCache:
+    """
+    Two-tier cache of planner output (the steps of a TaskPlan).
+
+    1. In-process LRU (PLAN_CACHE_LOCAL_SIZE entries): a hit costs a dict lookup.
+    2. Redis (`plan_cache:{hash}`, PLAN_CACHE_TTL_SECONDS): shared by every replica.
+
+    Keys hash the normalized prompt with the planner model and PLAN_CACHE_VERSION. Both tiers
+    expire entries after the TTL. Redis failures count as misses; the planner just plans.
+    """
+    def __init__(self, redis: RedisClient, max_entries: int = PLAN_CACHE_LOCAL_SIZE, ttl: int = PLAN_CACHE_TTL_SECONDS):
+        self.redis = redis
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (expires_at, step dicts)
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+        self.stats = {
+            "local_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "stores": 0,
+        }
+
+    @staticmethod
+    def key(prompt: str, model: str) -> str:
+        digest = hashlib.sha256(f"{PLAN_CACHE_VERSION}\0{model}\0{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+        return f"plan_cache:{digest}"
+
+    async def get(self, prompt: str, model: str) -> Optional[List[Step]]:
+        key = self.key(prompt, model)
+
+        entry = self._local.get(key)
+        if entry is not None:
+            expires_at, items = entry
+            if expires_at > time.time():
+                self._local.move_to_end(key)
+                self.stats["local_hits"] += 1
+                return self._steps(items)
+            del self._local[key]
+
+        try:
+            raw = await self.redis.redis.get(key)
+        except Exception as e:
+            logger.warning(f"Plan cache lookup failed: {e}")
+            raw = None
+
+        if raw:
+            try:
+                items = json.loads(raw)
+                steps = self._steps(items)
+            except Exception as e:
+                logger.warning(f"Ignoring malformed cached plan {key}: {e}")
+            else:
+                self._remember(key, items)
+                self.stats["redis_hits"] += 1
+                return steps
+
+        self.stats["misses"] += 1
+        return None
+
+    async def put(self, prompt: str, model: str, steps: List[Step]):
+        key = self.key(prompt, model)
+        # Only the plan itself; per-task state (status, result) is not cached.
+        items = [step.dict(include={"id", "title", "description", "assigned_agent", "depends_on"}) for step in steps]
+        self._remember(key, items)
+        self.stats["stores"] += 1
+        try:
+            await self.redis.redis.set(key, json.dumps(items), ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Plan cache store failed: {e}")
+
+    def _remember(self, key: str, items: list):
+        self._local[key] = (time.time() + self.ttl, items)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    @staticmethod
+    def _steps(items: list) -> List[Step]:
+        # Fresh objects every time: the orchestrator mutates step status.
+        return [Step(**item) for item in items]
+
+
+# Global instance
+plan_cache = PlanCache(redis_client)
+REGISTRY.register_stats("agentic_plan_cache", plan_cache.stats, "Planner cache")
@@ -0,0 +1,205 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+from ..queue.redis_client import RedisClient, redis_client
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Per-model limits shared by every worker and replica: "model=RPM/TPM,..." (0 = unlimited).
+# An empty value (the default) disables rate limiting; set it to your account's limits, e.g.
+# "llama-3.3-70b-versatile=30/12000,llama-3.1-8b-instant=30/6000".
+LLM_RATE_LIMITS = os.getenv("LLM_RATE_LIMITS", "")
+# Longest a caller waits for capacity before giving up with LLMRateLimitError.
+MAX_WAIT_SECONDS = float(os.getenv("LLM_RATE_LIMIT_MAX_WAIT_SECONDS", "60"))
+# Completion tokens assumed when a call sets no max_tokens (corrected from usage afterwards).
+DEFAULT_COMPLETION_TOKENS = int(os.getenv("LLM_RATE_LIMIT_DEFAULT_COMPLETION_TOKENS", "512"))
+
+# Two token buckets (requests, tokens) refilled continuously at RPM/TPM per minute, using
+# the server clock so all replicas agree. Grants and deducts only if both have capacity;
+# otherwise returns the milliseconds until they will.
+ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local function level(key, capacity)
+    local state = redis.call('HMGET', key, 'level', 'ts')
+    local lvl, ts = tonumber(state[1]), tonumber(state[2])
+    if lvl == nil or ts == nil then return capacity end
+    return math.min(capacity, lvl + (now - ts) * capacity / 60000)
+end
+local rpm, tpm, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local wait = 0
+local req, tok = 0, 0
+if rpm > 0 then
+    req = level(KEYS[1], rpm)
+    if req < 1 then wait = math.max(wait, (1 - req) * 60000 / rpm) end
+end
+if tpm > 0 then
+    tok = level(KEYS[2], tpm)
+    if tok < cost then wait = math.max(wait, (cost - tok) * 60000 / tpm) end
+end
+if wait > 0 then return math.ceil(wait) end
+if rpm > 0 then
+    redis.call('HSET', KEYS[1], 'level', req - 1, 'ts', now)
+    redis.call('PEXPIRE', KEYS[1], 120000)
+end
+if tpm > 0 then
+    redis.call('HSET', KEYS[2], 'level', tok - cost, 'ts', now)
+    redis.call('PEXPIRE', KEYS[2], 120000)
+end
+return 0
+"""
+
+
+class LLMRateLimitError(Exception):
+    """No LLM capacity within MAX_WAIT_SECONDS (retried like a provider RateLimitError)."""
+
+
+try:
+    from groq import RateLimitError
+except ImportError:
+    RateLimitError = None
+
+# Out of LLM capacity, not broken: agents re-raise these from their fallbacks so the step is
+# retried with the rate-limit backoff instead of completing with fallback output.
+RATE_LIMIT_ERRORS = (LLMRateLimitError,) + ((RateLimitError,) if RateLimitError else ())
+
+
+def _parse_limits(spec: str) -> Dict[str, Tuple[int, int]]:
+    limits = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        model, _, values = item.partition("=")
+        rpm, _, tpm = values.partition("/")
+        try:
+            limits[model.strip()] = (int(rpm or 0), int(tpm or 0))
+        except ValueError:
+            logger.warning(f"Ignoring invalid LLM_RATE_LIMITS entry: {item!r}")
+    return limits
+
+
+def estimate_tokens(messages: List[dict], max_tokens: Optional[int] = None) -> int:
+    """Rough request size: ~4 characters per prompt token, plus the completion budget."""
+    prompt_chars = sum(len(str(m.get("content", ""))) for m in messages)
+    return prompt_chars // 4 + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+class _LocalBuckets:
+    """Same algorithm in-process, used when the Redis script cannot run (e.g. no EVAL support)."""
+    def __init__(self):
+        self._state: Dict[str, Tuple[float, float]] = {}
+
+    def _level(self, key: str, capacity: int, now: float) -> float:
+        level, ts = self._state.get(key, (capacity, now))
+        return min(capacity, level + (now - ts) * capacity / 60)
+
+    def acquire(self, model: str, rpm: int, tpm: int, cost: int) -> float:
+        now = time.monotonic()
+        req = self._level(f"{model}:requests", rpm, now) if rpm else 0
+        tok = self._level(f"{model}:tokens", tpm, now) if tpm else 0
+        wait = 0.0
+        if rpm and req < 1:
+            wait = max(wait, (1 - req) * 60 / rpm)
+        if tpm and tok < cost:
+            wait = max(wait, (cost - tok) * 60 / tpm)
+        if wait > 0:
+            return wait
+        if rpm:
+            self._state[f"{model}:requests"] = (req - 1, now)
+        if tpm:
+            self._state[f"{model}:tokens"] = (tok - cost, now)
+        return 0.0
+
+    def adjust(self, model: str, tpm: int, delta: int):
+        now = time.monotonic()
+        self._state[f"{model}:tokens"] = (self._level(f"{model}:tokens", tpm, now) - delta, now)
+
+
+class LLMRateLimiter:
+    """
+    Cluster-wide requests-per-minute and tokens-per-minute limits per model.
+
+    `acquire()` reserves one request and an estimated token count in Redis token buckets
+    (`ratelimit:{model}:requests` / `ratelimit:{model}:tokens`, updated atomically by a Lua
+    script) and, when capacity is short, sleeps exactly until it will be available instead
+    of letting the provider reject the call. `reconcile()` corrects the token bucket with the
+    real usage once the call is done. If the script cannot run, limits are enforced per process.
+    """
+    def __init__(self, redis: RedisClient, limits: Optional[Dict[str, Tuple[int, int]]] = None):
+        self.redis = redis
+        self.limits = _parse_limits(LLM_RATE_LIMITS) if limits is None else limits
+        self._script = None
+        # Whether the last reservation went through Redis (False: the per-process fallback).
+        self._shared = True
+        self._local = _LocalBuckets()
+        self._warned_at = 0.0
+        self.stats = {
+            "acquired": 0,
+            "waited": 0,
+            "wait_seconds": 0.0,
+            "timeouts": 0,
+        }
+
+    async def acquire(self, model: str, tokens: int):
+        """Waits until `model` has capacity for one request of `tokens` tokens, then reserves it."""
+        limit = self.limits.get(model)
+        if not limit:
+            return
+        rpm, tpm = limit
+        # A request larger than a full minute's budget could never fit; let it drain the bucket.
+        cost = min(tokens, tpm) if tpm else 0
+
+        started = time.monotonic()
+        while True:
+            wait = await self._try_acquire(model, rpm, tpm, cost)
+            if wait <= 0:
+                break
+            waited = time.monotonic() - started
+            if waited + wait > MAX_WAIT_SECONDS:
+                self.stats["timeouts"] += 1
+                raise LLMRateLimitError(f"No capacity for {model} within {MAX_WAIT_SECONDS}s")
+            await asyncio.sleep(wait)
+
+        self.stats["acquired"] += 1
+        waited = time.monotonic() - started
+        if waited > 0.001:
+            self.stats["waited"] += 1
+            self.stats["wait_seconds"] += waited
+            logger.info(f"⏳ Waited {waited:.2f}s for {model} rate-limit capacity")
+
+    async def reconcile(self, model: str, estimated: int, actual: int):
+        """Returns over-reserved tokens to the bucket (or charges the shortfall)."""
+        limit = self.limits.get(model)
+        if not limit or not limit[1] or actual == estimated:
+            return
+        delta = actual - estimated
+        if self._shared:
+            try:
+                await self.redis.redis.hincrbyfloat(f"ratelimit:{model}:tokens", "level", -delta)
+                return
+            except Exception:
+                pass
+        self._local.adjust(model, limit[1], delta)
+
+    async def _try_acquire(self, model: str, rpm: int, tpm: int, cost: int) -> float:
+        """Seconds to wait before capacity is available (0 = granted)."""
+        try:
+            if self._script is None:
+                self._script = self.redis.redis.register_script(ACQUIRE_SCRIPT)
+            wait_ms = await self._script(keys=[f"ratelimit:{model}:requests", f"ratelimit:{model}:tokens"], args=[rpm, tpm, cost])
+            self._shared = True
+            return int(wait_ms) / 1000
+        except Exception as e:
+            self._shared = False
+            if time.monotonic() - self._warned_at > 60:
+                self._warned_at = time.monotonic()
+                logger.warning(f"Shared LLM rate limiter unavailable ({e}); enforcing limits per process.")
+            return self._local.acquire(model, rpm, tpm, cost)
+
+
+# Global instance
+llm_rate_limiter = LLMRateLimiter(redis_client)
+REGISTRY.register_stats("agentic_llm_rate_limiter", llm_rate_limiter.stats, "LLM rate limiter")
@@ -0,0 +1,273 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import secrets
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+# Newest spans kept per task in `task_trace:{task_id}` (token publishes add up on long answers).
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "2000"))
+# Optional OTLP/JSON export: every flushed batch is appended to this file as one
+# ExportTraceServiceRequest per line (a stand-in for a collector; empty disables it).
+OTLP_EXPORT_FILE = os.getenv("OTLP_EXPORT_FILE", "")
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "agentic-ai-system")
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "task_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], task_id: str, start_ns: Optional[int] = None, **attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.task_id = task_id
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def traceparent(self) -> str:
+        """W3C trace context header value, carried in queue message fields."""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+# The span the current asyncio task is in (each request / queue entry runs in its own task).
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str]]:
+    """(trace_id, parent span_id) from a traceparent header, or None if absent/invalid."""
+    parts = (value or "").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+def traceparent() -> Optional[str]:
+    """traceparent of the current span, to propagate in a queue message (None outside a trace)."""
+    span = _current.get()
+    return span.traceparent if span is not None else None
+
+
+class Tracer:
+    """
+    Lightweight per-task tracing.
+
+    Architecture Note:
+    - A trace starts in `POST /task` and its context travels as a W3C `traceparent` field on
+      every queue message (queue:orchestrator, queue:{agent}), so the orchestrator and the
+      workers continue the same trace in whatever process consumes the message.
+    - Finished spans are buffered in memory and flushed to `task_trace:{task_id}` (a Redis
+      list, one JSON span per item) in one pipelined round trip when the process's local root
+      span for that task ends (a submission, an orchestration, a processed step).
+    - Spans never propagate errors: a failed flush is logged and dropped.
+    """
+    def __init__(self):
+        self._buffer: Dict[str, List[Span]] = {}
+        # Local root spans still open per task; their end triggers the flush.
+        self._open_roots: Dict[str, int] = {}
+
+    def span(self, name: str, task_id: Optional[str] = None, parent: Optional[str] = None, root: bool = False, **attributes) -> "_SpanScope":
+        """
+        `async with tracer.span("llm.complete", model=...) as span:` times the block as a child
+        of the current span. Pass `parent` (a traceparent from a message) to continue a remote
+        trace, or `root=True` to start a new one; otherwise, outside a trace this is a no-op.
+        """
+        return _SpanScope(self, name, task_id, parent, root, attributes)
+
+    def start(self, name: str, start_ns: Optional[int] = None, **attributes) -> Optional[Span]:
+        """
+        Child span of the current span that is *not* made current, for work that cannot sit in
+        one `async with` block (e.g. a stream consumed by the caller). End it with `finish()`.
+        """
+        current = _current.get()
+        if not TRACING_ENABLED or current is None:
+            return None
+        return Span(name, current.trace_id, current.span_id, current.task_id, start_ns, **attributes)
+
+    def finish(self, span: Optional[Span], error: Optional[BaseException] = None):
+        if span is None:
+            return
+        span.end_ns = time.time_ns()
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        self._buffer.setdefault(span.task_id, []).append(span)
+
+    def record(self, name: str, start_ns: int, end_ns: Optional[int] = None, **attributes):
+        """Records an already finished interval (e.g. time spent waiting in a queue)."""
+        span = self.start(name, start_ns, **attributes)
+        if span is not None:
+            self.finish(span)
+            span.end_ns = end_ns or span.end_ns
+
+    async def flush(self, task_id: str):
+        spans = self._buffer.pop(task_id, None)
+        if not spans:
+            return
+        # Imported here: the Redis client itself is traced.
+        from ..queue.redis_client import redis_client, TASK_EVENTS_TTL_SECONDS
+        key = f"task_trace:{task_id}"
+        try:
+            pipe = redis_client.redis.pipeline(transaction=False)
+            pipe.rpush(key, *[json.dumps(span.to_dict()) for span in spans])
+            pipe.ltrim(key, -TRACE_MAX_SPANS, -1)
+            pipe.expire(key, TASK_EVENTS_TTL_SECONDS)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to flush {len(spans)} spans for task {task_id}: {e}")
+        if OTLP_EXPORT_FILE:
+            try:
+                await asyncio.to_thread(_append_line, OTLP_EXPORT_FILE, json.dumps(to_otlp(spans)))
+            except Exception as e:
+                logger.warning(f"OTLP export to {OTLP_EXPORT_FILE} failed: {e}")
+
+    async def timeline(self, task_id: str) -> Optional[dict]:
+        """Waterfall of a task's spans (offsets/durations in ms, depth from the span tree), or None."""
+        from ..queue.redis_client import redis_client
+        items = await redis_client.redis.lrange(f"task_trace:{task_id}", 0, -1)
+        if not items:
+            return None
+        spans = sorted((json.loads(item) for item in items), key=lambda s: s["start_ns"])
+        by_id = {span["span_id"]: span for span in spans}
+
+        def depth(span: dict) -> int:
+            level, parent = 0, by_id.get(span["parent_id"])
+            while parent is not None and level < 64:
+                level, parent = level + 1, by_id.get(parent["parent_id"])
+            return level
+
+        started = spans[0]["start_ns"]
+        finished = max(span["end_ns"] or span["start_ns"] for span in spans)
+        return {
+            "task_id": task_id,
+            "trace_id": spans[0]["trace_id"],
+            "duration_ms": round((finished - started) / 1e6, 3),
+            "spans": [{
+                "name": span["name"],
+                "span_id": span["span_id"],
+                "parent_id": span["parent_id"],
+                "depth": depth(span),
+                "start_offset_ms": round((span["start_ns"] - started) / 1e6, 3),
+                "duration_ms": round(((span["end_ns"] or span["start_ns"]) - span["start_ns"]) / 1e6, 3),
+                "attributes": span["attributes"],
+                "error": span["error"],
+            } for span in spans],
+        }
+
+
+class _SpanScope:
+    def __init__(self, tracer: Tracer, name: str, task_id: Optional[str], parent: Optional[str], root: bool, attributes: dict):
+        self.tracer = tracer
+        self.name = name
+        self.task_id = task_id
+        self.parent = parent
+        self.root = root
+        self.attributes = attributes
+        self.span: Optional[Span] = None
+        self.local_root = False
+        self._token = None
+
+    async def __aenter__(self) -> Optional[Span]:
+        if not TRACING_ENABLED:
+            return None
+        current = _current.get()
+        remote = parse_traceparent(self.parent)
+        if remote is not None and self.task_id:
+            trace_id, parent_id = remote
+            self.local_root = True
+        elif current is not None:
+            trace_id, parent_id = current.trace_id, current.span_id
+            self.task_id = self.task_id or current.task_id
+        elif self.root and self.task_id:
+            trace_id, parent_id = secrets.token_hex(16), None
+            self.local_root = True
+        else:
+            return None
+
+        self.span = Span(self.name, trace_id, parent_id, self.task_id, **self.attributes)
+        self._token = _current.set(self.span)
+        if self.local_root:
+            self.tracer._open_roots[self.task_id] = self.tracer._open_roots.get(self.task_id, 0) + 1
+        return self.span
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.span is None:
+            return False
+        _current.reset(self._token)
+        self.tracer.finish(self.span, exc)
+        task_id = self.task_id
+        if self.local_root:
+            remaining = self.tracer._open_roots.get(task_id, 1) - 1
+            if remaining > 0:
+                self.tracer._open_roots[task_id] = remaining
+            else:
+                self.tracer._open_roots.pop(task_id, None)
+        if self.local_root or task_id not in self.tracer._open_roots:
+            # A local root ended (or a straggler finished after the last one): ship the spans.
+            await self.tracer.flush(task_id)
+        return False
+
+
+def _append_line(path: str, line: str):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans: List[Span]) -> dict:
+    """Spans as an OTLP/JSON ExportTraceServiceRequest (accepted by OpenTelemetry collectors)."""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{
+                "scope": {"name": "app.core.tracing"},
+                "spans": [{
+                    "traceId": span.trace_id,
+                    "spanId": span.span_id,
+                    "parentSpanId": span.parent_id or "",
+                    "name": span.name,
+                    "kind": 1,
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns or span.start_ns),
+                    "attributes": [{"key": "task.id", "value": {"stringValue": span.task_id}}]
+                                  + [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+                    "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+                } for span in spans],
+            }],
+        }],
+    }
+
+
+# Global instance
+tracer = Tracer()
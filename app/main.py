@@ -1,8 +1,10 @@
+import os
 import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .api.routes import router
 from .queue.redis_client import redis_client
+from .worker import ALL_SERVICES, build_services, start_services, stop_services
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -22,50 +24,33 @@ app.add_middleware(
 # Include Router
 app.include_router(router)
 
-import asyncio
-from .agents import RetrieverWorker, AnalyzerWorker, WriterWorker
+# "all": this process also runs the orchestrator, agent workers and maintenance loops.
+# "api": HTTP only; run them with `python -m app.worker` (scaled separately).
+APP_MODE = os.getenv("APP_MODE", "all").lower()
 
-# Global worker tasks
+# Global services and their tasks
 worker_tasks = []
 workers = []
 
 @app.on_event("startup")
 async def startup_event():
-    logger.info("Application starting up...")
-    
-    # Check Redis Connection
-    is_connected = await redis_client.check_connection()
-    if not is_connected:
-        logger.warning("⚠️ Redis connection failed. Workers might loop with errors.")
+    logger.info(f"Application starting up (APP_MODE={APP_MODE})...")
 
-    # Initialize Workers
-    retriever = RetrieverWorker()
-    analyzer = AnalyzerWorker()
-    writer = WriterWorker()
-    workers.extend([retriever, analyzer, writer])
+    if APP_MODE == "api":
+        # Submissions wait in queue:orchestrator until a worker process picks them up
+        if not await redis_client.check_connection():
+            logger.warning("⚠️ Redis connection failed. Tasks cannot be submitted.")
+        return
 
-    # Start Workers as Background Tasks
-    for worker in workers:
-        task = asyncio.create_task(worker.run())
-        worker_tasks.append(task)
+    # Initialize the orchestrator service, workers and maintenance loops, then start them
+    workers.extend(build_services(ALL_SERVICES))
+    worker_tasks.extend(await start_services(workers))
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Application shutting down...")
-    
-    # Stop workers
-    for worker in workers:
-        worker.stop()
-    
-    # Cancel tasks
-    for task in worker_tasks:
-        task.cancel()
-        try:
-            await task
-        except asyncio.CancelledError:
-            pass
-            
-    await redis_client.close()
+    # Stop services, cancel their tasks and close the shared clients
+    await stop_services(workers, worker_tasks)
 
 @app.get("/")
 async def root():
@@ -13,11 +13,18 @@ class AgentType(str, Enum):
     ANALYZER = "analyzer"
     WRITER = "writer"
 
+class Priority(str, Enum):
+    INTERACTIVE = "interactive"
+    STANDARD = "standard"
+    BATCH = "batch"
+
 class Step(BaseModel):
     id: int
     title: str
     description: str
     assigned_agent: AgentType
+    # Ids of steps that must complete before this one is dispatched.
+    depends_on: List[int] = []
     status: StepStatus = StepStatus.PENDING
     result: Optional[str] = None
 
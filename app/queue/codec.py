@@ -0,0 +1,160 @@
+import os
+import json
+import zlib
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from ..models.events import Event, EventType, EventSource
+
+logger = logging.getLogger(__name__)
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None  # Optional: only needed for EVENT_CODEC=msgpack (and to read such entries)
+
+# Codec for newly published events: "json" (Event.json(), forwarded to SSE as is) or "msgpack".
+EVENT_CODEC = os.getenv("EVENT_CODEC", "json").lower()
+# msgpack: messages longer than this (bytes) are zlib-compressed; 0 disables compression.
+EVENT_COMPRESS_THRESHOLD = int(os.getenv("EVENT_COMPRESS_THRESHOLD", "1024"))
+EVENT_COMPRESS_LEVEL = int(os.getenv("EVENT_COMPRESS_LEVEL", "1"))
+
+# Wire tags. Append only: entries written with these values stay in streams for the retention TTL.
+TYPE_TAGS = {EventType.STATUS: 0, EventType.PARTIAL_OUTPUT: 1, EventType.ERROR: 2, EventType.DONE: 3}
+SOURCE_TAGS = {
+    EventSource.SYSTEM: 0,
+    EventSource.PLANNER: 1,
+    EventSource.RETRIEVER: 2,
+    EventSource.ANALYZER: 3,
+    EventSource.WRITER: 4,
+}
+TYPES_BY_TAG = {tag: value for value, tag in TYPE_TAGS.items()}
+SOURCES_BY_TAG = {tag: value for value, tag in SOURCE_TAGS.items()}
+
+FLAG_ZLIB = 1
+
+
+def _timestamp_ns(timestamp: str):
+    """Event.timestamp (naive local ISO string) as epoch nanoseconds, or the string itself if not ISO."""
+    try:
+        return round(datetime.fromisoformat(timestamp).timestamp() * 1_000_000) * 1000
+    except (TypeError, ValueError):
+        return timestamp
+
+
+def _timestamp_iso(value) -> str:
+    if isinstance(value, str):
+        return value
+    seconds, nanos = divmod(value, 1_000_000_000)
+    return (datetime.fromtimestamp(seconds) + timedelta(microseconds=nanos // 1000)).isoformat()
+
+
+class JsonCodec:
+    """
+    The original format: the Event.json() string in `payload`. SSE forwards it without parsing,
+    so this stays the cheapest option end to end when every event goes straight to a browser.
+    """
+    name = "json"
+
+    def encode(self, event: Event) -> str:
+        return event.json()
+
+    def decode(self, payload: str) -> Event:
+        return Event.parse_raw(payload)
+
+    def to_json(self, payload: str) -> str:
+        return payload
+
+
+class MsgpackCodec:
+    """
+    Compact binary format: a msgpack array [version, flags, type tag, source tag, epoch-ns
+    timestamp, message]. A token chunk shrinks from ~130 bytes of JSON to ~20; messages above
+    `compress_threshold` bytes (search results, reports) are stored zlib-compressed.
+
+    The client decodes responses as UTF-8 with surrogateescape, so the packed bytes are
+    carried through Redis as a str and come back byte for byte.
+    """
+    name = "msgpack"
+    version = 1
+
+    def __init__(self, compress_threshold: int = EVENT_COMPRESS_THRESHOLD, compress_level: int = EVENT_COMPRESS_LEVEL):
+        if msgpack is None:
+            raise RuntimeError("msgpack is not installed. Run `pip install msgpack`.")
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+
+    def encode(self, event: Event) -> str:
+        flags = 0
+        message = event.message.encode("utf-8", "surrogatepass")
+        if self.compress_threshold and len(message) > self.compress_threshold:
+            message = zlib.compress(message, self.compress_level)
+            flags |= FLAG_ZLIB
+        packed = msgpack.packb([
+            self.version,
+            flags,
+            TYPE_TAGS[event.type],
+            SOURCE_TAGS[event.source],
+            _timestamp_ns(event.timestamp),
+            message,
+        ], use_bin_type=True)
+        return packed.decode("utf-8", "surrogateescape")
+
+    def _fields(self, payload: str) -> Tuple[EventType, EventSource, str, str]:
+        items = msgpack.unpackb(payload.encode("utf-8", "surrogateescape"), raw=False)
+        version, flags, type_tag, source_tag, timestamp, message = items[:6]
+        if version > self.version:
+            raise ValueError(f"msgpack event version {version} is newer than this reader ({self.version})")
+        if flags & FLAG_ZLIB:
+            message = zlib.decompress(message)
+        return TYPES_BY_TAG[type_tag], SOURCES_BY_TAG[source_tag], message.decode("utf-8", "surrogatepass"), _timestamp_iso(timestamp)
+
+    def decode(self, payload: str) -> Event:
+        event_type, source, message, timestamp = self._fields(payload)
+        return Event(type=event_type, source=source, message=message, timestamp=timestamp)
+
+    def to_json(self, payload: str) -> str:
+        # Byte for byte what Event.json() returns, without building a model per event.
+        event_type, source, message, timestamp = self._fields(payload)
+        return json.dumps({"type": event_type.value, "source": source.value, "message": message, "timestamp": timestamp},
+                          separators=(",", ":"), ensure_ascii=False)
+
+
+CODECS = {JsonCodec.name: JsonCodec, MsgpackCodec.name: MsgpackCodec}
+_instances: Dict[str, object] = {}
+
+
+def get_codec(name: Optional[str] = None):
+    """The codec called `name` (default EVENT_CODEC). Unknown or unavailable codecs fall back to JSON."""
+    name = (name or EVENT_CODEC).lower()
+    codec = _instances.get(name)
+    if codec is None:
+        try:
+            codec = CODECS[name]()
+        except KeyError:
+            logger.warning(f"Unknown event codec '{name}'; using json.")
+            codec = get_codec(JsonCodec.name)
+        except RuntimeError as e:
+            logger.warning(f"Event codec '{name}' unavailable ({e}); using json.")
+            codec = get_codec(JsonCodec.name)
+        _instances[name] = codec
+    return codec
+
+
+def _reader(fields: dict):
+    # Entries without a `codec` field predate the codec layer and are JSON.
+    name = fields.get("codec") or JsonCodec.name
+    codec = _instances.get(name)
+    if codec is None:
+        codec = _instances[name] = CODECS[name]()
+    return codec
+
+
+def decode_event(fields: dict) -> Event:
+    """Event from a task_events stream entry written by any codec."""
+    return _reader(fields).decode(fields["payload"])
+
+
+def event_json(fields: dict) -> str:
+    """Event.json() document for a task_events stream entry written by any codec (SSE data)."""
+    return _reader(fields).to_json(fields["payload"])
@@ -0,0 +1,203 @@
+import os
+import time
+import socket
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+from .redis_client import RedisClient
+
+logger = logging.getLogger(__name__)
+
+
+class PoisonMessageError(RuntimeError):
+    """A queue entry was delivered more than its consumer's max_deliveries without ever finishing."""
+
+
+class GroupConsumer(ABC):
+    """
+    Consumer-group read loop shared by the agent workers (BaseWorker) and the orchestrator
+    service. Subclasses implement `_handle` (and `_dead_letter_poison` if they cap deliveries).
+
+    Architecture Note:
+    - Each process is one consumer (`consumer_name`) in `group_name`, reading `queues`.
+    - Up to `concurrency` entries run at once. A slot is taken before reading, and each read
+      asks for exactly as many entries as there are free slots.
+    - Entries this consumer took before a restart (same consumer name) are resumed first.
+    - A heartbeat task resets the idle time of in-flight entries, independent of free slots,
+      so a long-running entry is never mistaken for an abandoned one.
+    - Entries idle for `visibility_timeout_ms` (their consumer died) are reclaimed into the
+      slot the loop holds. Entries delivered more than `max_deliveries` times go to
+      `_dead_letter_poison` instead of being run again.
+    """
+    def __init__(self, redis: RedisClient, group_name: str, queues: List[str], concurrency: int, log_name: str,
+                 visibility_timeout_ms: int, reclaim_interval_seconds: float, max_deliveries: Optional[int] = None):
+        self.redis = redis
+        self.group_name = group_name
+        self.queues = queues
+        self.concurrency = concurrency
+        self.log_name = log_name
+        self.visibility_timeout_ms = visibility_timeout_ms
+        self.reclaim_interval_seconds = reclaim_interval_seconds
+        self.max_deliveries = max_deliveries
+        self.consumer_name = os.getenv("WORKER_CONSUMER_NAME") or f"{socket.gethostname()}-{os.getpid()}"
+        self.is_running = False
+        # Bounded in-flight pool: (queue, msg_id) -> asyncio.Task
+        self._in_flight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def heartbeat_interval(self) -> float:
+        """How often in-flight entries are touched: well inside the visibility timeout."""
+        return min(self.reclaim_interval_seconds, self.visibility_timeout_ms / 3000)
+
+    async def run(self):
+        self.is_running = True
+        self._slots = asyncio.Semaphore(self.concurrency)
+        logger.info(f"[{self.log_name}] Listening on {', '.join(self.queues)} as {self.group_name}/{self.consumer_name} (concurrency={self.concurrency})")
+
+        await self._safe_ensure_group()
+
+        pending_ids = {queue: "0" for queue in self.queues}
+        next_reclaim = time.monotonic() + self.reclaim_interval_seconds
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            while self.is_running:
+                # Wait for a free slot before pulling more work off the queue.
+                await self._slots.acquire()
+                try:
+                    # The slot we hold is not in _in_flight yet, so this is always >= 1.
+                    free = self.concurrency - len(self._in_flight)
+                    messages = None
+                    if time.monotonic() >= next_reclaim:
+                        next_reclaim = time.monotonic() + self.reclaim_interval_seconds
+                        messages = await self.reclaim_stale(free)
+                    if not messages:
+                        messages = await self._read(free, pending_ids)
+
+                except Exception as e:
+                    self._slots.release()
+                    logger.error(f"[{self.log_name}] Infrastructure error: {e}")
+                    if "NOGROUP" in str(e) or "no such key" in str(e):
+                        # Queue or group was deleted underneath us (e.g. FLUSHALL); recreate it.
+                        await self._safe_ensure_group()
+                    await asyncio.sleep(1)
+                    continue
+
+                if not messages:
+                    self._slots.release()
+                    continue
+
+                for i, (queue, msg_id, data) in enumerate(messages):
+                    if i > 0:
+                        # Reads never return more than `free` entries, so this does not wait.
+                        await self._slots.acquire()
+                    self._spawn(queue, msg_id, data)
+        finally:
+            heartbeat.cancel()
+            # Unfinished entries stay pending in the group and are reclaimed by another consumer.
+            for task in list(self._in_flight.values()):
+                task.cancel()
+
+    async def _read(self, free: int, pending_ids: Dict[str, str]) -> List[tuple]:
+        """
+        Next entries to run, as (queue, msg_id, data): this consumer's own pending entries
+        first, then the first queue in `_read_order()` that has work. When every queue is
+        empty, one blocking wait covers all of them and they are read again, so at most
+        `free` entries are taken.
+        """
+        for queue, pending_id in list(pending_ids.items()):
+            messages = await self.redis.read_group(queue, self.group_name, self.consumer_name, count=free, block=None, last_id=pending_id)
+            if messages:
+                pending_ids[queue] = messages[-1][0]
+                return [(queue, msg_id, data) for msg_id, data in messages]
+            del pending_ids[queue]
+
+        messages = await self._read_queues(free)
+        if not messages and await self.redis.wait_for_entries(self.queues, self.group_name, block=2000):
+            messages = await self._read_queues(free)
+        return messages
+
+    async def _read_queues(self, free: int) -> List[tuple]:
+        for queue in self._read_order():
+            messages = await self.redis.read_group(queue, self.group_name, self.consumer_name, count=free, block=None)
+            if messages:
+                self._served(queue)
+                return [(queue, msg_id, data) for msg_id, data in messages]
+        return []
+
+    def _read_order(self) -> List[str]:
+        """Queues in the order they are tried (override to prioritize)."""
+        return self.queues
+
+    def _served(self, queue: str):
+        """Called after a read from `queue` returned entries."""
+
+    def _spawn(self, queue: str, msg_id: str, data: dict):
+        """Runs one entry in the in-flight pool. The caller must already hold a slot."""
+        self._in_flight[(queue, msg_id)] = asyncio.create_task(self._run_entry(queue, msg_id, data))
+
+    async def _run_entry(self, queue: str, msg_id: str, data: dict):
+        try:
+            await self._handle(queue, msg_id, data)
+        finally:
+            self._in_flight.pop((queue, msg_id), None)
+            self._slots.release()
+
+    @abstractmethod
+    async def _handle(self, queue: str, msg_id: str, data: dict):
+        """Processes one entry and acknowledges it; an entry left unacknowledged is redelivered."""
+
+    async def _heartbeat(self):
+        """Touches this consumer's in-flight entries periodically, independent of free slots."""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval())
+            try:
+                await self.touch_in_flight()
+            except Exception as e:
+                logger.warning(f"[{self.log_name}] Could not refresh in-flight entries: {e}")
+
+    async def touch_in_flight(self):
+        """Resets the idle time of every entry being processed, so other replicas leave them alone."""
+        for queue in self.queues:
+            own = [msg_id for entry_queue, msg_id in list(self._in_flight) if entry_queue == queue]
+            if own and await self.redis.touch_pending(queue, self.group_name, self.consumer_name, *own) < len(own):
+                logger.warning(f"[{self.log_name}] Some in-flight entries on {queue} were reclaimed by another consumer")
+
+    async def reclaim_stale(self, free: int) -> List[tuple]:
+        """
+        Claims up to `free` entries left pending by dead consumers (in `queues` order) and
+        returns them as (queue, msg_id, data) for the run loop to start like freshly read ones;
+        `free` counts the slot the loop already holds.
+        """
+        reclaimed = []
+        for queue in self.queues:
+            wanted = free - len(reclaimed)
+            if wanted <= 0:
+                break
+
+            claimed = await self.redis.claim_stale(queue, self.group_name, self.consumer_name, self.visibility_timeout_ms, count=wanted)
+            for msg_id, data, times_delivered in claimed:
+                if (queue, msg_id) in self._in_flight:
+                    continue
+                if self.max_deliveries is not None and times_delivered > self.max_deliveries:
+                    logger.critical(f"[{self.log_name}] Giving up on {msg_id} from {queue} after {times_delivered} deliveries (poison message): {data}")
+                    await self._dead_letter_poison(queue, msg_id, data, PoisonMessageError(f"Entry kept failing its consumer ({times_delivered} deliveries)"))
+                    continue
+
+                logger.warning(f"[{self.log_name}] Reclaimed stalled entry {msg_id} from {queue} (delivery {times_delivered})")
+                reclaimed.append((queue, msg_id, data))
+        return reclaimed
+
+    async def _dead_letter_poison(self, queue: str, msg_id: str, data: dict, error: PoisonMessageError):
+        """Ends an entry that keeps killing its consumer and acknowledges it (required with max_deliveries)."""
+        raise NotImplementedError
+
+    async def _safe_ensure_group(self):
+        for queue in self.queues:
+            try:
+                await self.redis.ensure_consumer_group(queue, self.group_name)
+            except Exception as e:
+                logger.error(f"[{self.log_name}] Could not recreate consumer group on {queue}: {e}")
+
+    def stop(self):
+        self.is_running = False
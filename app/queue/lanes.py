@@ -0,0 +1,71 @@
+import os
+import logging
+from typing import Dict, List, Optional
+from ..models.task import AgentType, Priority
+
+logger = logging.getLogger(__name__)
+
+# Relative share of worker slots each lane gets while several have work waiting.
+LANE_WEIGHTS = os.getenv("LANE_WEIGHTS", "interactive=6,standard=3,batch=1")
+
+
+def _parse_weights(spec: str) -> Dict[Priority, int]:
+    weights = {priority: 1 for priority in Priority}
+    for item in spec.split(","):
+        name, _, value = item.partition("=")
+        try:
+            weights[Priority(name.strip().lower())] = max(1, int(value))
+        except ValueError:
+            logger.warning(f"Ignoring invalid LANE_WEIGHTS entry: {item!r}")
+    return weights
+
+
+WEIGHTS = _parse_weights(LANE_WEIGHTS)
+
+
+def queue_name(agent_type: AgentType, priority: Optional[str] = None) -> str:
+    """
+    Work queue of one agent lane. The standard lane keeps the original `queue:{agent}` name,
+    so entries queued before lanes existed are still consumed.
+    """
+    try:
+        priority = Priority(priority) if priority else Priority.STANDARD
+    except ValueError:
+        priority = Priority.STANDARD
+    if priority == Priority.STANDARD:
+        return f"queue:{agent_type.value}"
+    return f"queue:{agent_type.value}:{priority.value}"
+
+
+class Lane:
+    def __init__(self, agent_type: AgentType, priority: Priority):
+        self.priority = priority
+        self.queue = queue_name(agent_type, priority.value)
+        self.weight = WEIGHTS[priority]
+        self.credit = 0
+
+
+def lanes_for(agent_type: AgentType) -> List[Lane]:
+    """An agent's lanes, heaviest first."""
+    return sorted((Lane(agent_type, priority) for priority in Priority), key=lambda lane: -lane.weight)
+
+
+class LaneSelector:
+    """
+    Smooth weighted round robin over lanes: over time each busy lane is served in proportion
+    to its weight, and a light lane is never starved. Credit is capped, so a lane that was
+    idle for a while cannot claim a long burst when work arrives.
+    """
+    def __init__(self, lanes: List[Lane]):
+        self.lanes = lanes
+        self.total = sum(lane.weight for lane in lanes)
+
+    def order(self) -> List[Lane]:
+        """Lanes to try, best claim first (does not change state; call served() after reading)."""
+        return sorted(self.lanes, key=lambda lane: -(lane.credit + lane.weight))
+
+    def served(self, lane: Lane):
+        for other in self.lanes:
+            other.credit = min(self.total, other.credit + other.weight)
+        lane.credit -= self.total
+
@@ -0,0 +1,129 @@
+import os
+import time
+import asyncio
+import logging
+from typing import List, Optional
+from .redis_client import RedisClient, RedisBatch
+from ..models.events import Event, EventType, EventSource
+from ..core.metrics import time_to_first_output
+
+logger = logging.getLogger(__name__)
+
+# Coalescing window for PARTIAL_OUTPUT tokens: a chunk is published when either limit is hit.
+# Set TOKEN_FLUSH_INTERVAL_MS=0 to publish every token as its own event (legacy behaviour).
+FLUSH_INTERVAL_MS = float(os.getenv("TOKEN_FLUSH_INTERVAL_MS", "30"))
+FLUSH_BYTES = int(os.getenv("TOKEN_FLUSH_BYTES", "256"))
+
+
+class PartialOutputBuffer:
+    """
+    Buffered publisher for PARTIAL_OUTPUT events.
+
+    Tokens are appended to an in-memory buffer and published as one event once
+    `flush_bytes` have accumulated or `flush_interval_ms` has passed since the first
+    buffered token, whichever comes first. Publishing is serialized, so chunks reach
+    the task stream in token order.
+
+    Use as an async context manager: leaving the block (normally or via an exception)
+    flushes whatever is left, so the tail of the output always precedes DONE/ERROR.
+
+    If `started_at` (epoch seconds the task was submitted) is given, the delay until the first
+    chunk is recorded as the task's time to first output.
+    """
+    def __init__(self, redis: RedisClient, task_id: str, source: EventSource,
+                 flush_interval_ms: float = FLUSH_INTERVAL_MS, flush_bytes: int = FLUSH_BYTES,
+                 started_at: Optional[float] = None):
+        self.redis = redis
+        self.started_at = started_at
+        self.task_id = task_id
+        self.source = source
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_bytes = flush_bytes
+        self.enabled = flush_interval_ms > 0 and flush_bytes > 1
+
+        self._parts: List[str] = []
+        self._size = 0
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        self._error: Optional[BaseException] = None
+
+    async def add(self, token: str):
+        if not token:
+            return
+        self._raise_pending_error()
+
+        if not self.enabled:
+            await self._publish(token)
+            return
+
+        self._parts.append(token)
+        self._size += len(token.encode("utf-8"))
+        if self._size >= self.flush_bytes:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def flush(self, batch: Optional[RedisBatch] = None):
+        """
+        Publishes buffered tokens now. If `batch` is given, the final chunk is added to it
+        instead, so it can share a round trip with e.g. the DONE event (caller executes it).
+        """
+        if self._timer is not None:
+            # Still sleeping (it clears itself before flushing), so cancelling is safe.
+            self._timer.cancel()
+            self._timer = None
+        await self._flush_now(batch)
+        self._raise_pending_error()
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        self._timer = None
+        try:
+            await self._flush_now()
+        except Exception as e:
+            # Surfaced on the next add()/flush() so the caller's error handling sees it.
+            self._error = e
+
+    async def _flush_now(self, batch: Optional[RedisBatch] = None):
+        # Holding the lock also waits out an in-progress timer flush, keeping chunks ordered.
+        async with self._lock:
+            if not self._parts:
+                return
+            message = "".join(self._parts)
+            self._parts = []
+            self._size = 0
+            if batch is not None:
+                batch.publish_event(self.task_id, self._event(message))
+            else:
+                await self._publish(message)
+
+    def _event(self, message: str) -> Event:
+        if self.started_at is not None:
+            time_to_first_output.observe(max(0.0, time.time() - self.started_at))
+            self.started_at = None
+        return Event(
+            type=EventType.PARTIAL_OUTPUT,
+            source=self.source,
+            message=message
+        )
+
+    async def _publish(self, message: str):
+        await self.redis.publish_event(self.task_id, self._event(message))
+
+    def _raise_pending_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            await self.flush()
+        except Exception as e:
+            if exc is None:
+                raise
+            # Don't mask the original failure with a flush failure.
+            logger.error(f"❌ Failed to flush partial output for task {self.task_id}: {e}")
+        return False
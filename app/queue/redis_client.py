@@ -1,10 +1,14 @@
 import os
 import json
+import time
 import logging
 import asyncio
 import redis.asyncio as redis
-from typing import List, Optional
-from ..models.events import Event
+from typing import List, Optional, Tuple
+from ..models.events import Event, EventType
+from .codec import JsonCodec, get_codec
+from ..core.metrics import events_published
+from ..core.tracing import tracer
 from dotenv import load_dotenv
 
 # Only load .env if environment variables are missing (Local Dev)
@@ -18,17 +22,51 @@ logger = logging.getLogger(__name__)
 # Fallback to localhost if not set, but we will validate connectivity.
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
 
+# Retention: finished task streams stay replayable (SSE reconnects) for this long, then expire.
+TASK_EVENTS_TTL_SECONDS = int(os.getenv("TASK_EVENTS_TTL_SECONDS", "3600"))
+# Approximate cap on each agent queue stream (XADD ... MAXLEN ~). Must exceed the worst backlog.
+AGENT_QUEUE_MAXLEN = int(os.getenv("AGENT_QUEUE_MAXLEN", "10000"))
+# task_id -> submit time, for tasks that have not published DONE / a terminal ERROR yet.
+ACTIVE_TASKS_KEY = "tasks:active"
+# task_id -> expiry time, for finished tasks whose streams carry a TTL.
+EXPIRING_TASKS_KEY = "tasks:expiring"
+
+# Deletes a lock/claim key only if it still holds the caller's token.
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+# Resets the idle time of pending entries only while `consumer` still owns them, so a
+# heartbeat never takes back an entry another consumer has reclaimed in the meantime.
+# ARGV: group, consumer, then the entry ids. Returns how many were touched.
+TOUCH_PENDING_SCRIPT = """
+local touched = 0
+for i = 3, #ARGV do
+    local entry = redis.call('XPENDING', KEYS[1], ARGV[1], ARGV[i], ARGV[i], 1)[1]
+    if entry and entry[2] == ARGV[2] then
+        redis.call('XCLAIM', KEYS[1], ARGV[1], ARGV[2], 0, ARGV[i], 'JUSTID')
+        touched = touched + 1
+    end
+end
+return touched
+"""
+
 class RedisClient:
-    def __init__(self):
+    def __init__(self, codec=None):
         # Case-insensitive environment check
         self.use_fake = os.getenv("USE_FAKE_REDIS", "false").lower() == "true"
         self.redis = None
+        # Encoding of newly published events (see app/queue/codec.py); readers accept every codec.
+        self.codec = codec or get_codec()
+        self._release_script = None
+        self._touch_script = None
         
         if self.use_fake:
             try:
                 import fakeredis.aioredis
                 logger.warning("⚠️ USING FAKE REDIS (IN-MEMORY) - FOR TESTING ONLY ⚠️")
-                self.redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+                self.redis = fakeredis.aioredis.FakeRedis(decode_responses=True, encoding_errors="surrogateescape")
             except ImportError:
                 logger.error("fakeredis not installed but USE_FAKE_REDIS=true. Run `pip install fakeredis`.")
                 raise
@@ -40,6 +78,8 @@ class RedisClient:
                     REDIS_URL, 
                     encoding="utf-8", 
                     decode_responses=True,
+                    # Binary event payloads (msgpack codec) round-trip through str unchanged
+                    encoding_errors="surrogateescape",
                     health_check_interval=30 # Keep-alive
                 )
             except Exception as e:
@@ -65,24 +105,48 @@ class RedisClient:
             # Ideally, startup logic should call this and decide to crash or not.
             return False
 
-    async def publish_event(self, task_id: str, event: Event):
+    def event_fields(self, event: Event, terminal: bool = False) -> dict:
+        """
+        Stream entry fields for an event.
+        The event is encoded by the client's codec into a single 'payload' field to avoid field
+        explosion and ensure schema consistency; non-JSON payloads name their codec in 'codec'.
+        'type' is duplicated as its own field so readers (SSE) can route without decoding the payload.
+        Terminal events (the last one a task will ever publish) are flagged with 'terminal'.
+        """
+        fields = {"payload": self.codec.encode(event), "type": event.type.value}
+        if self.codec.name != JsonCodec.name:
+            fields["codec"] = self.codec.name
+        if terminal:
+            fields["terminal"] = "1"
+        return fields
+
+    @staticmethod
+    def log_published(stream_key: str, event: Event):
+        # Token chunks are too frequent for INFO; everything else stays visible.
+        events_published.inc(type=event.type.value)
+        log = logger.debug if event.type == EventType.PARTIAL_OUTPUT else logger.info
+        log(f"📤 Published to {stream_key}: [{event.type}] {event.message[:50]}...")
+
+    async def publish_event(self, task_id: str, event: Event, terminal: Optional[bool] = None):
         """
         Publishes an event to the task's Redis Stream.
         Ensures payload is JSON-serializable and logs the action.
+        For several writes at once, use `batch()` to save round trips.
+
+        A terminal event (DONE by default; pass terminal=True for a fatal ERROR) also starts
+        the retention TTL on the task's keys.
         """
         stream_key = f"task_events:{task_id}"
+        if terminal is None:
+            terminal = event.type == EventType.DONE
+        if terminal:
+            await self.batch(transaction=True).publish_event(task_id, event, terminal=True).execute()
+            return
         
         try:
-            # Validate payload serialization
-            # Event.json() returns a string. Redis Streams XADD takes a dict {field: value}.
-            # We wrap it in 'payload' to avoid field explosion and ensure schema consistency.
-            payload_str = event.json()
-            
-            # Additional safety: ensure it's valid JSON (Pydantic does this, but defensive coding)
-            # json.loads(payload_str) 
-
-            await self.redis.xadd(stream_key, {"payload": payload_str})
-            logger.info(f"📤 Published to {stream_key}: [{event.type}] {event.message[:50]}...")
+            async with tracer.span("redis.publish", event_type=event.type.value):
+                await self.redis.xadd(stream_key, self.event_fields(event))
+            self.log_published(stream_key, event)
             
         except Exception as e:
             logger.error(f"❌ Failed to publish event to {stream_key}: {e}")
@@ -90,6 +154,42 @@ class RedisClient:
             # For this agentic system, logging is critical.
             raise e
 
+    async def get_context(self, task_id: str, *sources: str) -> List[tuple]:
+        """
+        Returns the materialized outputs of upstream agents for a task as (source, text)
+        pairs in step order, restricted to `sources` if given. One HGETALL, no event parsing.
+        """
+        entries = await self.redis.hgetall(f"task_context:{task_id}")
+        context = []
+        for field, text in entries.items():
+            source, _, step_id = field.partition(":")
+            if sources and source not in sources:
+                continue
+            context.append((int(step_id) if step_id.isdigit() else 0, source, text))
+        context.sort(key=lambda item: item[:2])
+        return [(source, text) for _, source, text in context]
+
+    async def get_task_state(self, task_id: str) -> Tuple[bool, dict, List[tuple]]:
+        """
+        What an orchestrator needs to resume a task, in one round trip: whether it is still
+        in `tasks:active`, its `task_state:{task_id}` hash (stored plan, dispatched steps) and
+        its step completions so far as (stream_id, fields).
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zscore(ACTIVE_TASKS_KEY, task_id)
+        pipe.hgetall(f"task_state:{task_id}")
+        pipe.xrange(f"task_steps:{task_id}")
+        active, state, finished = await pipe.execute()
+        return active is not None, state, finished
+
+    def batch(self, transaction: bool = False) -> "RedisBatch":
+        """
+        Starts a pipelined batch of event publishes / queue writes, sent in one round trip
+        by `execute()`. With transaction=True the batch is wrapped in MULTI/EXEC so readers
+        see all of it or none of it.
+        """
+        return RedisBatch(self, transaction=transaction)
+
     async def read_events(self, task_id: str, last_id: str = "0-0", block: int = 5000, count: int = 100) -> List[tuple]:
         """
         Reads new events from the stream.
@@ -119,6 +219,115 @@ class RedisClient:
             logger.error(f"❌ Unexpected error reading stream {stream_key}: {e}")
             return []
 
+    async def ensure_consumer_group(self, stream_key: str, group: str):
+        """
+        Creates the consumer group for a work queue (and the stream itself) if missing.
+        Starting at "0" means steps queued before the group existed are still delivered once.
+        """
+        try:
+            await self.redis.xgroup_create(stream_key, group, id="0", mkstream=True)
+            logger.info(f"👥 Created consumer group '{group}' on {stream_key}")
+        except redis.ResponseError as e:
+            # BUSYGROUP: another replica (or a previous run) already created it.
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def read_group(self, stream_key: str, group: str, consumer: str, count: int = 1, block: int = 2000, last_id: str = ">") -> List[tuple]:
+        """
+        Reads entries for `consumer` via XREADGROUP.
+        last_id=">" returns never-delivered entries; "0" re-reads this consumer's own pending entries.
+        Returns a list of (msg_id, data). Errors propagate so the caller can back off.
+        """
+        streams = await self.redis.xreadgroup(group, consumer, {stream_key: last_id}, count=count, block=block)
+        if not streams:
+            return []
+        _, messages = streams[0]
+        # Pending entries that were trimmed/deleted come back as (id, None); nothing to process.
+        return [(msg_id, data) for msg_id, data in messages if data]
+
+    async def wait_for_entries(self, stream_keys: List[str], group: str, block: int = 2000) -> bool:
+        """
+        Blocks until any of several queues sharing a group name (e.g. an agent's lanes) has an
+        entry the group has not delivered yet, or `block` ms pass. Nothing is claimed: the caller
+        reads afterwards with read_group, so it never receives more entries than it asked for.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for key in stream_keys:
+            pipe.xinfo_groups(key)
+        # XREAD from each group's last-delivered-id; "$" if the group is missing (only new entries).
+        positions = {
+            key: next((g["last-delivered-id"] for g in groups if g["name"] == group), "$")
+            for key, groups in zip(stream_keys, await pipe.execute())
+        }
+        return bool(await self.redis.xread(positions, count=1, block=block))
+
+    async def ack(self, stream_key: str, group: str, *msg_ids: str) -> int:
+        """Acknowledges processed entries so they leave the group's pending list."""
+        if not msg_ids:
+            return 0
+        return await self.redis.xack(stream_key, group, *msg_ids)
+
+    async def claim_stale(self, stream_key: str, group: str, consumer: str, min_idle_ms: int, count: int = 10) -> List[tuple]:
+        """
+        Transfers pending entries idle for longer than `min_idle_ms` (i.e. their consumer
+        died or hung) to `consumer`, XAUTOCLAIM-style.
+        Returns a list of (msg_id, data, times_delivered).
+        """
+        claimed = []
+        start_id = "0-0"
+        while len(claimed) < count:
+            result = await self.redis.xautoclaim(
+                stream_key, group, consumer,
+                min_idle_time=min_idle_ms, start_id=start_id, count=count - len(claimed)
+            )
+            next_id, messages = result[0], result[1]
+            claimed.extend((msg_id, data) for msg_id, data in messages if data)
+            if next_id == "0-0":
+                break
+            start_id = next_id
+
+        if not claimed:
+            return []
+
+        # XAUTOCLAIM does not report delivery counts; fetch them so callers can spot poison messages.
+        pending = await self.redis.xpending_range(stream_key, group, min=claimed[0][0], max=claimed[-1][0], count=len(claimed) * 2, consumername=consumer)
+        deliveries = {p["message_id"]: p["times_delivered"] for p in pending}
+        return [(msg_id, data, deliveries.get(msg_id, 1)) for msg_id, data in claimed]
+
+    async def touch_pending(self, stream_key: str, group: str, consumer: str, *msg_ids: str) -> int:
+        """
+        Resets the idle time of entries this consumer is still working on (XCLAIM ... JUSTID),
+        skipping any that another consumer has reclaimed. Returns how many were touched.
+        """
+        if not msg_ids:
+            return 0
+        try:
+            if self._touch_script is None:
+                self._touch_script = self.redis.register_script(TOUCH_PENDING_SCRIPT)
+            return int(await self._touch_script(keys=[stream_key], args=[group, consumer, *msg_ids]))
+        except redis.ResponseError:
+            # No EVAL: check ownership first (an entry reclaimed in between is still taken back).
+            pipe = self.redis.pipeline(transaction=False)
+            for msg_id in msg_ids:
+                pipe.xpending_range(stream_key, group, min=msg_id, max=msg_id, count=1)
+            owned = [msg_id for msg_id, entries in zip(msg_ids, await pipe.execute())
+                     if entries and entries[0]["consumer"] == consumer]
+            if owned:
+                await self.redis.xclaim(stream_key, group, consumer, min_idle_time=0, message_ids=owned, justid=True)
+            return len(owned)
+
+    async def release(self, key: str, token: str) -> bool:
+        """Deletes `key` if its value is still `token` (a lock or claim we took with SET NX)."""
+        try:
+            if self._release_script is None:
+                self._release_script = self.redis.register_script(RELEASE_SCRIPT)
+            return bool(await self._release_script(keys=[key], args=[token]))
+        except redis.ResponseError:
+            # No EVAL: check and delete in two steps (a lock could expire and be retaken in between).
+            if await self.redis.get(key) != token:
+                return False
+            return bool(await self.redis.delete(key))
+
     async def get_stream_length(self, task_id: str) -> int:
         """Helper to check stream depth (for validation)."""
         stream_key = f"task_events:{task_id}"
@@ -132,6 +341,99 @@ class RedisClient:
             await self.redis.close()
             logger.info("🔌 Redis Client Closed.")
 
+class RedisBatch:
+    """
+    Collects writes on a Redis pipeline and sends them in a single round trip.
+
+        batch = redis_client.batch(transaction=True)
+        batch.publish_event(task_id, event)
+        batch.enqueue("queue:writer", {...})
+        await batch.execute()
+
+    Other modules can queue extra commands on `batch.pipe` (e.g. ZADD for retries).
+    """
+    def __init__(self, client: RedisClient, transaction: bool = False):
+        self.client = client
+        self.pipe = client.redis.pipeline(transaction=transaction)
+        self._published: List[tuple] = []
+
+    def publish_event(self, task_id: str, event: Event, terminal: Optional[bool] = None) -> "RedisBatch":
+        stream_key = f"task_events:{task_id}"
+        if terminal is None:
+            terminal = event.type == EventType.DONE
+        self.pipe.xadd(stream_key, self.client.event_fields(event, terminal))
+        self._published.append((stream_key, event))
+        if terminal:
+            self.finish_task(task_id)
+        return self
+
+    def enqueue(self, queue_name: str, fields: dict) -> "RedisBatch":
+        self.pipe.xadd(queue_name, fields, maxlen=AGENT_QUEUE_MAXLEN, approximate=True)
+        return self
+
+    def store_context(self, task_id: str, source: str, step_id: str, text: str) -> "RedisBatch":
+        """
+        Materializes an agent's output into the task's context hash (`task_context:{task_id}`,
+        field `{source}:{step_id}`). Keyed by step, so a retried step overwrites instead of duplicating.
+        """
+        self.pipe.hset(f"task_context:{task_id}", f"{source}:{step_id}", text)
+        return self
+
+    def step_finished(self, task_id: str, step_id: str, status: str) -> "RedisBatch":
+        """
+        Records that a step finished ("completed" or "failed") on `task_steps:{task_id}`,
+        which the orchestrator watches to dispatch dependent steps.
+        """
+        stream_key = f"task_steps:{task_id}"
+        self.pipe.xadd(stream_key, {"step_id": str(step_id), "status": status})
+        # Refreshed on every write, so the stream can never outlive its task.
+        self.pipe.expire(stream_key, TASK_EVENTS_TTL_SECONDS)
+        return self
+
+    def store_plan(self, task_id: str, plan_json: str) -> "RedisBatch":
+        """Saves a task's plan in `task_state:{task_id}`, so a restarted orchestrator resumes it instead of re-planning."""
+        self.pipe.hset(f"task_state:{task_id}", "plan", plan_json)
+        self.pipe.expire(f"task_state:{task_id}", TASK_EVENTS_TTL_SECONDS)
+        return self
+
+    def steps_dispatched(self, task_id: str, step_ids: List[int]) -> "RedisBatch":
+        """Marks steps as dispatched in `task_state:{task_id}` (write it with the enqueue, in a transaction)."""
+        self.pipe.hset(f"task_state:{task_id}", mapping={f"dispatched:{step_id}": "1" for step_id in step_ids})
+        self.pipe.expire(f"task_state:{task_id}", TASK_EVENTS_TTL_SECONDS)
+        return self
+
+    def track_task(self, task_id: str) -> "RedisBatch":
+        """Registers a new task so the retention janitor can find it if it never finishes."""
+        self.pipe.zadd(ACTIVE_TASKS_KEY, {task_id: time.time()})
+        return self
+
+    def finish_task(self, task_id: str) -> "RedisBatch":
+        """Starts the retention TTL on a task's keys and moves it from active to expiring."""
+        self.pipe.expire(f"task_events:{task_id}", TASK_EVENTS_TTL_SECONDS)
+        self.pipe.expire(f"task_context:{task_id}", TASK_EVENTS_TTL_SECONDS)
+        self.pipe.expire(f"task_state:{task_id}", TASK_EVENTS_TTL_SECONDS)
+        self.pipe.zrem(ACTIVE_TASKS_KEY, task_id)
+        self.pipe.zadd(EXPIRING_TASKS_KEY, {task_id: time.time() + TASK_EVENTS_TTL_SECONDS})
+        return self
+
+    def __len__(self) -> int:
+        return len(self.pipe)
+
+    async def execute(self) -> list:
+        """Sends every queued command; returns their results in order."""
+        size = len(self.pipe)
+        if not size:
+            return []
+        try:
+            async with tracer.span("redis.batch", commands=size, events=len(self._published)):
+                results = await self.pipe.execute()
+        except Exception as e:
+            logger.error(f"❌ Failed to execute Redis batch ({size} commands): {e}")
+            raise e
+        for stream_key, event in self._published:
+            RedisClient.log_published(stream_key, event)
+        return results
+
 # Global instance
 redis_client = RedisClient()
 
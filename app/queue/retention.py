@@ -0,0 +1,115 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+from .redis_client import RedisClient, redis_client, ACTIVE_TASKS_KEY, EXPIRING_TASKS_KEY
+from ..models.events import Event, EventType, EventSource
+from ..core.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+JANITOR_INTERVAL_SECONDS = float(os.getenv("RETENTION_JANITOR_INTERVAL_SECONDS", "60"))
+# Tasks that publish neither DONE nor a terminal ERROR within this window are abandoned.
+ABANDONED_TASK_SECONDS = int(os.getenv("ABANDONED_TASK_SECONDS", "1800"))
+JANITOR_BATCH_SIZE = int(os.getenv("RETENTION_JANITOR_BATCH_SIZE", "500"))
+# Only one janitor sweeps at a time; the lock of one that died mid-sweep expires after this long.
+SWEEP_LOCK_KEY = "retention:sweep_lock"
+SWEEP_LOCK_SECONDS = int(os.getenv("RETENTION_SWEEP_LOCK_SECONDS", "300"))
+
+
+class RetentionJanitor:
+    """
+    Background sweeper for the task-stream lifecycle.
+
+    - Abandoned tasks (still in `tasks:active` after ABANDONED_TASK_SECONDS) get a terminal
+      ERROR event, which starts their TTL like any finished task.
+    - Tasks in `tasks:expiring` whose TTL runs out before the next sweep are measured with
+      MEMORY USAGE just before they go, to account for reclaimed bytes.
+
+    Sweeps are not idempotent: two at once would both publish a terminal ERROR for the same
+    abandoned task and both count the same expiring ones. A janitor therefore sweeps only while
+    it holds `retention:sweep_lock` (SET NX); on the other replicas that sweep is skipped. Each
+    replica's `stats` count only its own sweeps, so their sum is the cluster total.
+    """
+    def __init__(self, redis: RedisClient):
+        self.redis = redis
+        self.is_running = False
+        self.stats = {
+            "tasks_abandoned": 0,
+            "tasks_expired": 0,
+            "bytes_reclaimed": 0,
+        }
+
+    async def sweep(self) -> bool:
+        """Runs one sweep unless another janitor is sweeping; returns whether it ran."""
+        token = uuid.uuid4().hex
+        if not await self.redis.redis.set(SWEEP_LOCK_KEY, token, nx=True, ex=SWEEP_LOCK_SECONDS):
+            return False
+        try:
+            abandoned = await self.expire_abandoned()
+            expired, reclaimed = await self.account_expiring()
+        finally:
+            await self.redis.release(SWEEP_LOCK_KEY, token)
+        if abandoned or expired:
+            logger.info(f"🧹 Retention sweep: {abandoned} abandoned, {expired} expiring (~{reclaimed} bytes reclaimed)")
+        return True
+
+    async def expire_abandoned(self) -> int:
+        cutoff = time.time() - ABANDONED_TASK_SECONDS
+        task_ids = await self.redis.redis.zrangebyscore(ACTIVE_TASKS_KEY, "-inf", cutoff, start=0, num=JANITOR_BATCH_SIZE)
+        if not task_ids:
+            return 0
+
+        batch = self.redis.batch()
+        for task_id in task_ids:
+            batch.publish_event(task_id, Event(
+                type=EventType.ERROR,
+                source=EventSource.SYSTEM,
+                message=f"Task abandoned: no completion within {ABANDONED_TASK_SECONDS}s."
+            ), terminal=True)
+        await batch.execute()
+        self.stats["tasks_abandoned"] += len(task_ids)
+        return len(task_ids)
+
+    async def account_expiring(self):
+        horizon = time.time() + JANITOR_INTERVAL_SECONDS
+        task_ids = await self.redis.redis.zrangebyscore(EXPIRING_TASKS_KEY, "-inf", horizon, start=0, num=JANITOR_BATCH_SIZE)
+        if not task_ids:
+            return 0, 0
+
+        reclaimed = 0
+        for task_id in task_ids:
+            reclaimed += await self._memory_usage(f"task_events:{task_id}")
+            reclaimed += await self._memory_usage(f"task_context:{task_id}")
+            reclaimed += await self._memory_usage(f"task_state:{task_id}")
+        await self.redis.redis.zrem(EXPIRING_TASKS_KEY, *task_ids)
+
+        self.stats["tasks_expired"] += len(task_ids)
+        self.stats["bytes_reclaimed"] += reclaimed
+        return len(task_ids), reclaimed
+
+    async def _memory_usage(self, key: str) -> int:
+        try:
+            return await self.redis.redis.memory_usage(key) or 0
+        except Exception:
+            # Not every backend supports MEMORY USAGE (e.g. fakeredis); count the task anyway.
+            return 0
+
+    async def run(self):
+        self.is_running = True
+        logger.info(f"🧹 Retention janitor started (every {JANITOR_INTERVAL_SECONDS}s, abandon after {ABANDONED_TASK_SECONDS}s)")
+        while self.is_running:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Retention janitor error: {e}")
+            await asyncio.sleep(JANITOR_INTERVAL_SECONDS)
+
+    def stop(self):
+        self.is_running = False
+
+
+# Global instance
+retention_janitor = RetentionJanitor(redis_client)
+REGISTRY.register_stats("agentic_retention", retention_janitor.stats, "Retention janitor")
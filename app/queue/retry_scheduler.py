@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import logging
+from datetime import datetime
+import redis.asyncio as redis
+from .redis_client import RedisClient, RedisBatch, redis_client, AGENT_QUEUE_MAXLEN
+
+logger = logging.getLogger(__name__)
+
+# Sorted set of delayed retries: member = JSON {queue, fields}, score = due time (epoch seconds).
+SCHEDULE_KEY = "retry:scheduled"
+POLL_INTERVAL_SECONDS = float(os.getenv("RETRY_POLL_INTERVAL_SECONDS", "0.25"))
+PROMOTE_BATCH_SIZE = int(os.getenv("RETRY_PROMOTE_BATCH_SIZE", "100"))
+DEAD_LETTER_MAXLEN = int(os.getenv("DEAD_LETTER_MAXLEN", "10000"))
+
+# Re-queues one due entry and only then removes it from the schedule, atomically: a member
+# already taken by another scheduler is skipped, and an entry is never removed unless its
+# XADD went through. ARGV: member, queue MAXLEN, then the entry's field/value pairs.
+PROMOTE_SCRIPT = """
+if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then return 0 end
+redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[2], '*', unpack(ARGV, 3))
+redis.call('ZREM', KEYS[1], ARGV[1])
+return 1
+"""
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with jitter.
+    Delay for attempt n is drawn from [d/2, d] where d = min(max_delay, base_delay * 2**n),
+    so replicas failing at the same moment do not retry in lockstep.
+    """
+    def __init__(self, max_retries: int = 3, base_delay: float = 1.0, max_delay: float = 30.0, jitter: bool = True):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, retry_count: int) -> float:
+        delay = min(self.max_delay, self.base_delay * (2 ** retry_count))
+        if self.jitter:
+            delay = random.uniform(delay / 2, delay)
+        return delay
+
+
+DEFAULT_POLICY = RetryPolicy(
+    max_retries=int(os.getenv("RETRY_MAX_RETRIES", "3")),
+    base_delay=float(os.getenv("RETRY_BASE_DELAY_SECONDS", "1.0")),
+)
+
+# Matched by exception class name (including base classes) so optional SDKs (groq, httpx)
+# don't have to be importable here. First match wins.
+ERROR_POLICIES = [
+    # Provider throttling: back off hard, it will clear.
+    (("RateLimitError", "LLMRateLimitError"), RetryPolicy(max_retries=5, base_delay=5.0, max_delay=60.0)),
+    # Transient network trouble: retry a bit more, but quickly.
+    (("APITimeoutError", "APIConnectionError", "TimeoutError", "ConnectionError"), RetryPolicy(max_retries=4, base_delay=1.0, max_delay=15.0)),
+    # Deterministic failures: retrying the same input cannot succeed.
+    (("ValidationError", "ValueError", "KeyError"), RetryPolicy(max_retries=0)),
+]
+
+
+def policy_for(error: BaseException) -> RetryPolicy:
+    names = {cls.__name__ for cls in type(error).__mro__}
+    for error_names, policy in ERROR_POLICIES:
+        if names.intersection(error_names):
+            return policy
+    return DEFAULT_POLICY
+
+
+def retry_delay(error: BaseException, retry_count: int) -> float:
+    """Backoff before the next attempt: the error's policy delay, or the provider's retry-after if longer."""
+    delay = policy_for(error).delay(retry_count)
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return max(delay, float(headers.get("retry-after") or 0))
+    except (TypeError, ValueError):
+        # An HTTP-date retry-after; the policy delay will do.
+        return delay
+
+
+class RetryScheduler:
+    """
+    Delayed-retry subsystem.
+    Failed steps are parked in a Redis sorted set keyed by due time; `run()` promotes due
+    entries back onto their agent queue. Workers never sleep on a failure.
+    """
+    def __init__(self, redis: RedisClient):
+        self.redis = redis
+        self.is_running = False
+        self._script = None
+        self._warned_at = 0.0
+
+    def schedule(self, batch: RedisBatch, queue_name: str, fields: dict, delay: float):
+        """Adds a ZADD to `batch` that parks `fields` for re-delivery to `queue_name` in `delay` seconds."""
+        member = json.dumps({
+            "queue": queue_name,
+            "fields": fields,
+            # Keeps members unique even if the same step fails twice with identical fields.
+            "id": uuid.uuid4().hex,
+        })
+        batch.pipe.zadd(SCHEDULE_KEY, {member: time.time() + delay})
+
+    def dead_letter(self, batch: RedisBatch, agent: str, fields: dict, error: BaseException):
+        """Adds an XADD to `batch` recording a step that exhausted its retries on `dead_letter:{agent}`."""
+        entry = dict(fields)
+        entry.update({
+            "error": str(error),
+            "error_type": type(error).__name__,
+            "failed_at": datetime.now().isoformat(),
+        })
+        batch.pipe.xadd(f"dead_letter:{agent}", entry, maxlen=DEAD_LETTER_MAXLEN, approximate=True)
+
+    async def promote_due(self) -> int:
+        """
+        Moves due retries back to their queues. Returns the number promoted.
+        Each entry is claimed and re-queued atomically by PROMOTE_SCRIPT (all entries in one
+        pipelined round trip), so concurrent schedulers on several replicas never promote the
+        same entry twice, and a crash or error mid-promotion never loses one.
+        """
+        due = await self.redis.redis.zrangebyscore(SCHEDULE_KEY, "-inf", time.time(), start=0, num=PROMOTE_BATCH_SIZE)
+        if not due:
+            return 0
+
+        items = []
+        for member in due:
+            try:
+                item = json.loads(member)
+                fields = item["fields"]
+                if "enqueued_at" in fields:
+                    # Queue-wait stats measure time in the queue, not the backoff.
+                    fields["enqueued_at"] = f"{time.time():.6f}"
+                items.append((member, item["queue"], fields))
+            except Exception as e:
+                logger.error(f"❌ Dropping malformed scheduled retry {member[:100]}: {e}")
+                await self.redis.redis.zrem(SCHEDULE_KEY, member)
+
+        try:
+            if self._script is None:
+                self._script = self.redis.redis.register_script(PROMOTE_SCRIPT)
+            pipe = self.redis.redis.pipeline(transaction=False)
+            for member, queue, fields in items:
+                args = [member, AGENT_QUEUE_MAXLEN]
+                for key, value in fields.items():
+                    args += [key, value]
+                await self._script(keys=[SCHEDULE_KEY, queue], args=args, client=pipe)
+            results = await pipe.execute(raise_on_error=False)
+        except Exception as e:
+            if time.monotonic() - self._warned_at > 60:
+                self._warned_at = time.monotonic()
+                logger.warning(f"Promotion script unavailable ({e}); promoting with WATCH/MULTI.")
+            results = [await self._promote_watched(*item) for item in items]
+
+        promoted = 0
+        for (member, queue, _), result in zip(items, results):
+            if isinstance(result, Exception):
+                # Still scheduled: the script checks and re-queues before it removes the entry.
+                logger.error(f"❌ Could not promote scheduled retry to {queue}: {result}")
+            else:
+                promoted += int(result)
+        return promoted
+
+    async def _promote_watched(self, member: str, queue: str, fields: dict):
+        """PROMOTE_SCRIPT without EVAL: an optimistic transaction per entry (0 if another scheduler won)."""
+        try:
+            async with self.redis.redis.pipeline(transaction=True) as pipe:
+                await pipe.watch(SCHEDULE_KEY)
+                if await pipe.zscore(SCHEDULE_KEY, member) is None:
+                    return 0
+                pipe.multi()
+                pipe.xadd(queue, fields, maxlen=AGENT_QUEUE_MAXLEN, approximate=True)
+                pipe.zrem(SCHEDULE_KEY, member)
+                await pipe.execute()
+                return 1
+        except redis.WatchError:
+            # The schedule changed underneath us; whatever is still due is retried next poll.
+            return 0
+        except Exception as e:
+            return e
+
+    async def run(self):
+        self.is_running = True
+        logger.info(f"⏱️ Retry scheduler started (polling {SCHEDULE_KEY} every {POLL_INTERVAL_SECONDS}s)")
+        while self.is_running:
+            try:
+                promoted = await self.promote_due()
+                if promoted:
+                    logger.info(f"⏱️ Promoted {promoted} scheduled retries")
+                    # More may be due already; don't wait a full interval.
+                    if promoted >= PROMOTE_BATCH_SIZE:
+                        continue
+            except Exception as e:
+                logger.error(f"Retry scheduler error: {e}")
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+    def stop(self):
+        self.is_running = False
+
+
+# Global instance
+retry_scheduler = RetryScheduler(redis_client)
@@ -0,0 +1,197 @@
+import os
+import asyncio
+import logging
+import zlib
+from typing import Dict, List, Optional, Set
+from ..queue.redis_client import RedisClient, redis_client
+
+logger = logging.getLogger(__name__)
+
+# Number of reader loops (= blocking Redis connections) per process, regardless of viewer count.
+HUB_SHARDS = int(os.getenv("SSE_HUB_SHARDS", "1"))
+# Newly watched tasks join the multi-key XREAD when the current one returns, so keep this short.
+HUB_BLOCK_MS = int(os.getenv("SSE_HUB_BLOCK_MS", "500"))
+HUB_READ_COUNT = int(os.getenv("SSE_HUB_READ_COUNT", "500"))
+# Batches buffered per subscriber before it is considered lagging and re-reads from Redis.
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("SSE_SUBSCRIBER_QUEUE_SIZE", "1000"))
+BACKFILL_PAGE_SIZE = 500
+
+
+def stream_id_key(stream_id: str) -> tuple:
+    """Sortable form of a Redis stream ID ("<ms>-<seq>")."""
+    ms, _, seq = stream_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+class Subscription:
+    """
+    One viewer of one task. Yields (msg_id, data) entries in stream order: first the
+    backlog after `last_id` (read directly with XRANGE), then live entries fanned out by the hub.
+    """
+    def __init__(self, hub: "StreamHub", task_id: str, last_id: str = "0-0"):
+        self.hub = hub
+        self.task_id = task_id
+        self.last_id = last_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.lagged = False
+        self._needs_backfill = True
+
+    def deliver(self, messages: List[tuple]):
+        try:
+            self.queue.put_nowait(messages)
+        except asyncio.QueueFull:
+            # Too slow to keep up; it will catch up straight from the stream instead.
+            self.lagged = True
+
+    async def backfill(self) -> List[tuple]:
+        """Reads everything after last_id that is already in the stream."""
+        stream_key = self.hub.stream_key(self.task_id)
+        entries = []
+        start = self.last_id
+        while True:
+            page = await self.hub.redis.redis.xrange(stream_key, min=f"({start}", max="+", count=BACKFILL_PAGE_SIZE)
+            entries.extend(page)
+            if len(page) < BACKFILL_PAGE_SIZE:
+                return entries
+            start = page[-1][0]
+
+    def _fresh(self, messages: List[tuple]) -> List[tuple]:
+        """Drops entries at or before last_id (already delivered via backfill) and advances last_id."""
+        last = stream_id_key(self.last_id)
+        fresh = [(msg_id, data) for msg_id, data in messages if stream_id_key(msg_id) > last]
+        if fresh:
+            self.last_id = fresh[-1][0]
+        return fresh
+
+    async def next_batch(self, timeout: Optional[float] = None) -> List[tuple]:
+        """
+        Returns the next entries for this viewer (possibly empty on timeout).
+        The first call returns the backlog.
+        """
+        if self._needs_backfill or self.lagged:
+            if self.lagged:
+                # Whatever was dropped (and queued) is re-read from the stream below.
+                self.lagged = False
+                while not self.queue.empty():
+                    self.queue.get_nowait()
+            self._needs_backfill = False
+            fresh = self._fresh(await self.backfill())
+            if fresh:
+                return fresh
+
+        try:
+            messages = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        return self._fresh(messages)
+
+
+class _TaskFeed:
+    """Shared read position of one task stream and everyone watching it."""
+    def __init__(self, cursor: str):
+        self.cursor = cursor
+        self.subscribers: Set[Subscription] = set()
+
+
+class StreamHub:
+    """
+    In-process multiplexer for per-task streams (`{key_prefix}{task_id}`).
+
+    Instead of one blocking XREAD per SSE connection, a few reader loops (HUB_SHARDS) each
+    issue one multi-key XREAD covering every task watched in this process and fan the entries
+    out to per-subscriber asyncio queues. Several viewers of the same task share one read.
+    """
+    def __init__(self, redis: RedisClient, shards: int = HUB_SHARDS, key_prefix: str = "task_events:"):
+        self.redis = redis
+        self.shards = max(1, shards)
+        self.key_prefix = key_prefix
+        self._feeds: List[Dict[str, _TaskFeed]] = [{} for _ in range(self.shards)]
+        self._wake: List[Optional[asyncio.Event]] = [None] * self.shards
+        self._readers: List[asyncio.Task] = []
+
+    def stream_key(self, task_id: str) -> str:
+        return f"{self.key_prefix}{task_id}"
+
+    def _shard(self, task_id: str) -> int:
+        return zlib.crc32(task_id.encode()) % self.shards
+
+    async def subscribe(self, task_id: str, last_id: str = "0-0") -> Subscription:
+        self._ensure_started()
+        shard = self._shard(task_id)
+        feeds = self._feeds[shard]
+
+        feed = feeds.get(task_id)
+        if feed is None:
+            # Live reads start at the current tail; anything older comes from the subscriber's backfill.
+            tail = await self.redis.redis.xrevrange(self.stream_key(task_id), count=1)
+            cursor = tail[0][0] if tail else "0-0"
+            # Another subscriber may have created the feed while we awaited.
+            feed = feeds.setdefault(task_id, _TaskFeed(cursor))
+            self._wake[shard].set()
+
+        subscription = Subscription(self, task_id, last_id)
+        feed.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        feeds = self._feeds[self._shard(subscription.task_id)]
+        feed = feeds.get(subscription.task_id)
+        if feed is None:
+            return
+        feed.subscribers.discard(subscription)
+        if not feed.subscribers:
+            del feeds[subscription.task_id]
+
+    def _ensure_started(self):
+        if self._readers:
+            return
+        for shard in range(self.shards):
+            self._wake[shard] = asyncio.Event()
+            self._readers.append(asyncio.create_task(self._read_loop(shard)))
+        logger.info(f"📡 Stream hub for {self.key_prefix}* started with {self.shards} reader(s)")
+
+    async def _read_loop(self, shard: int):
+        feeds = self._feeds[shard]
+        wake = self._wake[shard]
+        while True:
+            if not feeds:
+                wake.clear()
+                await wake.wait()
+                continue
+
+            try:
+                streams = await self.redis.redis.xread(
+                    {self.stream_key(task_id): feed.cursor for task_id, feed in feeds.items()},
+                    count=HUB_READ_COUNT,
+                    block=HUB_BLOCK_MS
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Stream hub reader {shard} error: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            for stream_key, messages in streams or []:
+                feed = feeds.get(stream_key[len(self.key_prefix):])
+                if feed is None or not messages:
+                    continue
+                feed.cursor = messages[-1][0]
+                for subscription in list(feed.subscribers):
+                    subscription.deliver(messages)
+
+    async def close(self):
+        for reader in self._readers:
+            reader.cancel()
+        for reader in self._readers:
+            try:
+                await reader
+            except asyncio.CancelledError:
+                pass
+        self._readers = []
+
+
+# Global instances
+stream_hub = StreamHub(redis_client)
+# Step completions (`task_steps:{task_id}`), watched by the orchestrator's scheduler.
+step_hub = StreamHub(redis_client, key_prefix="task_steps:")
@@ -1,59 +1,184 @@
-import asyncio
+import os
+import time
 import logging
 import json
 from sse_starlette.sse import ServerSentEvent
-from ..queue.redis_client import redis_client
-from ..models.events import Event, EventType
+from .hub import stream_hub
+from ..models.events import Event, EventType, EventSource
+from ..queue.codec import decode_event, event_json
+from ..core.metrics import REGISTRY, Gauge
+from ..queue.redis_client import ACTIVE_TASKS_KEY
 
 logger = logging.getLogger(__name__)
 
-async def event_generator(task_id: str):
+# Debug option: re-validate and re-serialize every event instead of passing stored payloads through.
+STRICT_VALIDATION = os.getenv("SSE_STRICT_VALIDATION", "false").lower() == "true"
+# An SSE comment is sent after this long without events, keeping proxies from cutting the connection.
+HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+# A stream that sees no new events for this long is closed (the client may reconnect with Last-Event-ID).
+IDLE_TIMEOUT_SECONDS = float(os.getenv("SSE_IDLE_TIMEOUT_SECONDS", "300"))
+
+# Open/closed stream counters, plus why streams closed.
+stats = {
+    "streams_opened": 0,
+    "streams_closed": 0,
+    "closed_done": 0,
+    "closed_terminal": 0,
+    "closed_finished": 0,
+    "closed_idle": 0,
+    "closed_unknown_task": 0,
+    "closed_client": 0,
+}
+
+def open_streams() -> int:
+    return stats["streams_opened"] - stats["streams_closed"]
+
+REGISTRY.register_stats("agentic_sse", stats, "SSE streams")
+Gauge("agentic_sse_open_streams", "SSE streams currently open", function=open_streams)
+
+def _event_type(data: dict, payload_json: str) -> str:
+    """Event type from the stream entry's 'type' field; entries written before it existed are peeked (JSON only)."""
+    event_type = data.get("type")
+    if event_type is None:
+        event_type = json.loads(payload_json).get("type")
+    return event_type
+
+def _closing_events(task_id: str, message: str, reason: str):
+    """
+    Ends a stream the task itself did not end: a terminal ERROR event for the viewer,
+    then a `close` event telling clients not to reconnect.
+    """
+    event = Event(type=EventType.ERROR, source=EventSource.SYSTEM, message=message)
+    yield ServerSentEvent(data=event.json(), event="message")
+    yield ServerSentEvent(data=json.dumps({"task_id": task_id, "reason": reason}), event="close")
+
+async def _task_exists(task_id: str) -> bool:
+    try:
+        return bool(await stream_hub.redis.redis.exists(f"task_events:{task_id}"))
+    except Exception as e:
+        # Can't tell; keep the stream open rather than end a live task on a Redis blip.
+        logger.warning(f"Could not check stream for task {task_id}: {e}")
+        return True
+
+async def _already_finished(task_id: str, last_id: str) -> bool:
+    """
+    True when a resuming client has seen everything of a task that is no longer active:
+    nothing after `last_id` and no more events coming (e.g. reconnect after a terminal ERROR).
+    """
+    if last_id in ("0", "0-0"):
+        return False
+    try:
+        pipe = stream_hub.redis.redis.pipeline(transaction=False)
+        pipe.zscore(ACTIVE_TASKS_KEY, task_id)
+        pipe.xrange(f"task_events:{task_id}", min=f"({last_id}", max="+", count=1)
+        active, newer = await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not check whether task {task_id} finished: {e}")
+        return False
+    return active is None and not newer
+
+async def event_generator(task_id: str, last_id: str = "0-0"):
     """
     Async generator for SSE.
-    Listens to Redis Stream and yields SSE events.
+    Subscribes to the task's Redis Stream through the process-wide stream hub
+    (one multi-key XREAD shared by all viewers) and yields SSE events.
+
+    Each SSE event carries its Redis stream entry ID as `id:`, so a reconnecting client that
+    sends it back (Last-Event-ID) resumes after `last_id` instead of replaying the whole task.
+
+    JSON payloads are forwarded exactly as stored (they were produced by Event.json() on publish);
+    entries written by another codec (see app/queue/codec.py) are converted to the same JSON.
+    Set SSE_STRICT_VALIDATION=true to re-validate every event through the model instead.
+
+    The stream always ends: on DONE or another terminal event, after IDLE_TIMEOUT_SECONDS
+    without events, as soon as the task's stream key is missing (unknown task, or its
+    retention TTL has passed), or right away when a client resumes past the last event of a
+    task that has already finished. A comment heartbeat is sent every HEARTBEAT_SECONDS of silence.
     """
-    last_id = "0-0"
-    
-    # We yield an initial comment to keep connection alive or signal start if needed
-    # yield ServerSentEvent(comment="Connected to stream")
-
-    while True:
-        # Read from Redis
-        # We use a blocking read (handled inside read_events via xread block)
-        # to avoid tight loops.
-        messages = await redis_client.read_events(task_id, last_id=last_id, block=2000)
-        
-        if not messages:
-            # If no new messages, we can yield a comment to keep connection alive (heartbeat)
-            # or just continue waiting.
-            # yield ServerSentEvent(comment="heartbeat")
-            # For now, we just continue loop to check again or handle shutdown
-            await asyncio.sleep(0.1) 
-            continue
-
-        for msg_id, data in messages:
-            last_id = msg_id
-            payload_json = data.get("payload")
-            
-            if payload_json:
-                try:
-                    # Parse JSON to validate/ensure it's correct
-                    # We pass the raw JSON string as the data for the SSE
-                    event_data = Event.parse_raw(payload_json)
-                    
-                    yield ServerSentEvent(
-                        data=event_data.json(),
-                        event="message" # standard event name
-                    )
-
-                    # Stop streaming if DONE event received
-                    if event_data.type == EventType.DONE:
-                        logger.info(f"Task {task_id} done. Closing stream.")
-                        return 
+    stats["streams_opened"] += 1
+    close_reason = "client"
+    subscription = None
+
+    try:
+        if not await _task_exists(task_id):
+            close_reason = "unknown_task"
+            logger.info(f"Task {task_id} has no event stream (unknown or expired). Closing stream.")
+            for sse in _closing_events(task_id, "Unknown or expired task.", close_reason):
+                yield sse
+            return
+
+        if await _already_finished(task_id, last_id):
+            close_reason = "finished"
+            logger.info(f"Task {task_id} already finished and nothing follows {last_id}. Closing stream.")
+            yield ServerSentEvent(data=json.dumps({"task_id": task_id, "reason": close_reason}), event="close")
+            return
+
+        subscription = await stream_hub.subscribe(task_id, last_id)
+        last_activity = time.monotonic()
+
+        while True:
+            # Backlog first, then live entries as the hub fans them out.
+            messages = await subscription.next_batch(timeout=HEARTBEAT_SECONDS)
+
+            if not messages:
+                if not await _task_exists(task_id):
+                    close_reason = "unknown_task"
+                    logger.info(f"Event stream of task {task_id} is gone (expired). Closing stream.")
+                    for sse in _closing_events(task_id, "Task expired before completing.", close_reason):
+                        yield sse
+                    return
+                if time.monotonic() - last_activity >= IDLE_TIMEOUT_SECONDS:
+                    close_reason = "idle"
+                    logger.info(f"Task {task_id} idle for {IDLE_TIMEOUT_SECONDS}s. Closing stream.")
+                    for sse in _closing_events(task_id, f"No progress for {int(IDLE_TIMEOUT_SECONDS)}s. Stream closed.", close_reason):
+                        yield sse
+                    return
+                yield ServerSentEvent(comment="heartbeat")
+                continue
+
+            last_activity = time.monotonic()
+            for msg_id, data in messages:
+                if data.get("payload"):
+                    try:
+                        if STRICT_VALIDATION:
+                            # Decode through the model to validate/ensure it's correct
+                            event_data = decode_event(data)
+                            payload_json = event_data.json()
+                            event_type = event_data.type.value
+                        else:
+                            # JSON entries are passed through as the SSE data without parsing
+                            payload_json = event_json(data)
+                            event_type = _event_type(data, payload_json)
                         
-                except Exception as e:
-                    logger.error(f"Error parsing event {msg_id}: {e}")
-                    yield ServerSentEvent(
-                        data=json.dumps({"error": "Failed to parse event"}),
-                        event="error"
-                    )
+                        yield ServerSentEvent(
+                            data=payload_json,
+                            event="message", # standard event name
+                            id=msg_id
+                        )
+
+                        # Stop streaming if DONE event received
+                        if event_type == EventType.DONE.value:
+                            close_reason = "done"
+                            logger.info(f"Task {task_id} done. Closing stream.")
+                            return 
+
+                        # A fatal ERROR (dead-lettered step, abandoned task): nothing will follow.
+                        if data.get("terminal"):
+                            close_reason = "terminal"
+                            logger.info(f"Task {task_id} failed. Closing stream.")
+                            yield ServerSentEvent(data=json.dumps({"task_id": task_id, "reason": close_reason}), event="close")
+                            return
+                            
+                    except Exception as e:
+                        logger.error(f"Error parsing event {msg_id}: {e}")
+                        yield ServerSentEvent(
+                            data=json.dumps({"error": "Failed to parse event"}),
+                            event="error",
+                            id=msg_id
+                        )
+    finally:
+        if subscription is not None:
+            stream_hub.unsubscribe(subscription)
+        stats["streams_closed"] += 1
+        stats[f"closed_{close_reason}"] += 1
+        logger.debug(f"SSE stream for {task_id} closed ({close_reason}); {open_streams()} open")
@@ -0,0 +1,241 @@
+"""
+Standalone worker process: runs agent workers and/or the orchestrator service without the API.
+
+    python -m app.worker --agents writer,analyzer --processes 4 --concurrency 32
+
+With --processes > 1 a small supervisor forks that many worker processes and restarts any
+that crash. Each process is a separate event loop (and a separate Redis/Groq connection
+pool), so CPU-bound work such as JSON encoding and SSE fan-out is spread over several cores.
+"""
+import os
+import sys
+import time
+import signal
+import socket
+import asyncio
+import logging
+import argparse
+import multiprocessing
+from typing import List, Optional
+from .models.task import AgentType
+from .queue.redis_client import redis_client
+from .queue.retry_scheduler import retry_scheduler
+from .queue.retention import retention_janitor
+from .streaming.hub import stream_hub, step_hub
+from .core.groq_client import get_groq_client, close_groq_client
+from .core.orchestrator_service import OrchestratorService
+from .core.metrics import REGISTRY, CONTENT_TYPE
+from .agents import RetrieverWorker, AnalyzerWorker, WriterWorker
+
+logger = logging.getLogger(__name__)
+
+ORCHESTRATOR = "orchestrator"
+WORKER_CLASSES = {
+    AgentType.RETRIEVER.value: RetrieverWorker,
+    AgentType.ANALYZER.value: AnalyzerWorker,
+    AgentType.WRITER.value: WriterWorker,
+}
+ALL_SERVICES = [ORCHESTRATOR] + list(WORKER_CLASSES)
+# Crashed processes are restarted after min(2**restarts, MAX_RESTART_BACKOFF_SECONDS) seconds.
+MAX_RESTART_BACKOFF_SECONDS = 30
+# A process that ran this long before dying starts its backoff from scratch.
+HEALTHY_UPTIME_SECONDS = 60
+
+
+def build_services(names: List[str], concurrency: Optional[int] = None, maintenance: bool = True) -> list:
+    """
+    Creates the long-running services of one process. Every service has `run()` and `stop()`.
+    `concurrency` overrides the per-agent worker concurrency; maintenance adds the retry
+    scheduler and retention janitor (one copy per deployment is enough).
+    """
+    services = []
+    for name in names:
+        if name == ORCHESTRATOR:
+            services.append(OrchestratorService())
+        else:
+            services.append(WORKER_CLASSES[name](concurrency))
+    if maintenance:
+        # Delayed retries are promoted back onto the agent queues by the scheduler
+        services.append(retry_scheduler)
+        # Finished/abandoned task streams are expired by the retention janitor
+        services.append(retention_janitor)
+    return services
+
+
+async def start_services(services: list) -> List[asyncio.Task]:
+    """Checks the shared connections, then starts every service as a background task."""
+    is_connected = await redis_client.check_connection()
+    if not is_connected:
+        logger.warning("⚠️ Redis connection failed. Workers might loop with errors.")
+
+    # Create the shared LLM client (and its connection pool) once, up front
+    if get_groq_client() is None:
+        logger.info("Groq disabled or unavailable. Agents will use deterministic fallbacks.")
+
+    return [asyncio.create_task(service.run()) for service in services]
+
+
+async def stop_services(services: list, tasks: List[asyncio.Task]):
+    """
+    Stops and cancels the services, then closes the shared clients.
+    Steps that were in flight stay pending in their queues and are resumed by this consumer
+    after a restart (or reclaimed by another one).
+    """
+    for service in services:
+        service.stop()
+    for task in tasks:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    await stream_hub.close()
+    await step_hub.close()
+    await close_groq_client()
+    await redis_client.close()
+
+
+async def _serve_metrics(port: int):
+    """Minimal HTTP endpoint answering every request with this process's metrics."""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = (await REGISTRY.render()).encode()
+            head = f"HTTP/1.1 200 OK\r\nContent-Type: {CONTENT_TYPE}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+            writer.write(head.encode() + body)
+            await writer.drain()
+        except Exception:
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "0.0.0.0", port)
+    logger.info(f"📈 Serving metrics on :{port}")
+    return server
+
+
+async def serve(services: list, metrics_port: int = 0):
+    """Runs the services until SIGTERM / SIGINT (and serves metrics if `metrics_port` is set)."""
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+
+    tasks = await start_services(services)
+    metrics_server = await _serve_metrics(metrics_port) if metrics_port else None
+    logger.info(f"Worker process {os.getpid()} running {len(services)} services")
+    await stopping.wait()
+    logger.info(f"Worker process {os.getpid()} shutting down...")
+    if metrics_server is not None:
+        metrics_server.close()
+    await stop_services(services, tasks)
+
+
+def run_process(index: int, names: List[str], concurrency: Optional[int], maintenance: bool, metrics_port: int = 0):
+    """Entry point of one worker process (index 0 runs the maintenance loops)."""
+    # A stable consumer name per slot lets a restarted process resume its own pending
+    # entries immediately instead of waiting for another consumer to reclaim them.
+    base_name = os.getenv("WORKER_CONSUMER_NAME") or f"{socket.gethostname()}-{os.getppid()}"
+    os.environ["WORKER_CONSUMER_NAME"] = f"{base_name}-{index}"
+    # Each process has its own metrics: process i serves on metrics_port + i.
+    asyncio.run(serve(build_services(names, concurrency, maintenance and index == 0), metrics_port + index if metrics_port else 0))
+
+
+def supervise(processes: int, names: List[str], concurrency: Optional[int], maintenance: bool, metrics_port: int = 0):
+    """Forks `processes` worker processes and keeps them running until SIGTERM / SIGINT."""
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+    children: List[Optional[multiprocessing.Process]] = [None] * processes
+    started_at = [0.0] * processes
+    restarts = [0] * processes
+    restart_at = [0.0] * processes
+    stopping = False
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    def start(index: int):
+        process = context.Process(target=run_process, args=(index, names, concurrency, maintenance, metrics_port), name=f"worker-{index}")
+        process.start()
+        children[index] = process
+        started_at[index] = time.monotonic()
+        logger.info(f"Started worker process {index} (pid {process.pid})")
+
+    for index in range(processes):
+        start(index)
+
+    while not stopping:
+        time.sleep(0.5)
+        now = time.monotonic()
+        for index, process in enumerate(children):
+            if process is None or process.is_alive() or stopping:
+                continue
+            if not restart_at[index]:
+                # Just noticed the crash: schedule the restart with backoff.
+                if now - started_at[index] >= HEALTHY_UPTIME_SECONDS:
+                    restarts[index] = 0
+                delay = min(2 ** restarts[index], MAX_RESTART_BACKOFF_SECONDS)
+                restarts[index] += 1
+                restart_at[index] = now + delay
+                logger.error(f"Worker process {index} (pid {process.pid}) exited with code {process.exitcode}; restarting in {delay}s")
+            elif now >= restart_at[index]:
+                restart_at[index] = 0.0
+                start(index)
+
+    logger.info("Stopping worker processes...")
+    for process in children:
+        if process is not None and process.is_alive():
+            process.terminate()
+    for process in children:
+        if process is None:
+            continue
+        process.join(timeout=15)
+        if process.is_alive():
+            logger.warning(f"Worker process pid {process.pid} did not stop in time; killing it")
+            process.kill()
+            process.join()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m app.worker", description="Run agent workers and the orchestrator without the API.")
+    parser.add_argument("--agents", default=",".join(ALL_SERVICES),
+                        help=f"Comma-separated services to run: {', '.join(ALL_SERVICES)} (default: all)")
+    parser.add_argument("--processes", type=int, default=int(os.getenv("WORKER_PROCESSES", "1")),
+                        help="Worker processes to fork (default: WORKER_PROCESSES or 1)")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="In-flight steps per agent worker (default: WORKER_CONCURRENCY / <AGENT>_WORKER_CONCURRENCY)")
+    parser.add_argument("--no-maintenance", action="store_true",
+                        help="Do not run the retry scheduler and retention janitor here")
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("WORKER_METRICS_PORT", "0")),
+                        help="Serve Prometheus metrics on this port (+ process index); 0 disables (default: WORKER_METRICS_PORT)")
+    args = parser.parse_args(argv)
+
+    args.agents = [name.strip().lower() for name in args.agents.split(",") if name.strip()]
+    unknown = [name for name in args.agents if name not in ALL_SERVICES]
+    if unknown or not args.agents:
+        parser.error(f"unknown service(s) {unknown}; choose from {', '.join(ALL_SERVICES)}")
+    if args.processes < 1:
+        parser.error("--processes must be at least 1")
+    if args.concurrency is not None and args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    return args
+
+
+def main(argv: Optional[List[str]] = None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(name)s %(levelname)s %(message)s")
+    args = parse_args(argv)
+    maintenance = not args.no_maintenance
+    logger.info(f"Worker starting: services={','.join(args.agents)} processes={args.processes} concurrency={args.concurrency or 'default'}")
+
+    if args.processes == 1:
+        asyncio.run(serve(build_services(args.agents, args.concurrency, maintenance), args.metrics_port))
+    else:
+        supervise(args.processes, args.agents, args.concurrency, maintenance, args.metrics_port)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,429 @@
+"""
+End-to-end load test: drives N concurrent tasks through POST /task and GET /stream/{task_id}
+against the app running in this process (ASGI, no network), with fakeredis or a local Redis.
+
+    python tests/benchmark.py --tasks 200 --concurrency 20 --output bench.json
+    python tests/benchmark.py --baseline bench.json            # exit 1 on regression
+    python tests/benchmark.py --prompts prompts.jsonl          # replay a recorded prompt mix
+
+Reports tasks/sec, p50/p95/p99 time to first token (first PARTIAL_OUTPUT) and to DONE, and
+Redis commands / round trips per task, as JSON.
+
+Prompt mix files have one JSON object per line: {"task": "...", "priority": "interactive",
+"weight": 3, "at": 1.25}. `weight` (default 1) sets how often a prompt is drawn; if every line
+has `at` (seconds from the start of the recording) the tasks are replayed open-loop at those
+times (scaled by --speed) instead of closed-loop with --concurrency. Plain text lines are
+prompts with weight 1.
+
+By default agents run their deterministic fallbacks (no LLM). --stub-llm PROFILE starts
+tests/stub_llm.py (seeded with --seed) and points the agents at it; --llm-url points them at
+any other OpenAI-compatible server.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import socket
+import argparse
+import logging
+import subprocess
+import urllib.request
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+DEFAULT_PROMPTS = [
+    {"task": "Research agentic AI systems and summarize the key ideas", "weight": 4},
+    {"task": "Compare Redis Streams with Kafka for task queues", "weight": 2},
+    {"task": "Explain quantum computing to a high-school student", "weight": 2},
+    {"task": "Write a short report on vector databases", "weight": 1, "priority": "batch"},
+    {"task": "What is retrieval-augmented generation?", "weight": 1, "priority": "interactive"},
+]
+
+# Lower is better for everything we compare, except throughput.
+HIGHER_IS_BETTER = {"tasks_per_sec"}
+
+
+def configure_environment(args):
+    """Must run before the app is imported (its modules read configuration at import time)."""
+    if args.redis_url:
+        os.environ["REDIS_URL"] = args.redis_url
+        os.environ["USE_FAKE_REDIS"] = "false"
+    else:
+        os.environ.setdefault("USE_FAKE_REDIS", "true")
+    if args.llm_url:
+        os.environ["USE_GROQ"] = "true"
+        os.environ["GROQ_BASE_URL"] = args.llm_url
+        os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    else:
+        os.environ["USE_GROQ"] = "false"
+    # Measure the system, not the demo pauses or the per-client / provider budgets.
+    os.environ.setdefault("PLANNER_FALLBACK_DELAY_SECONDS", "0")
+    os.environ.setdefault("ADMISSION_CLIENT_RATE_PER_SECOND", "0")
+    os.environ.setdefault("LLM_RATE_LIMITS", "")
+    os.environ.setdefault("APP_MODE", "all")
+
+
+def start_stub_llm(profile, seed):
+    """Runs tests/stub_llm.py on a free port in its own process; returns (process, base URL)."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_llm.py")
+    process = subprocess.Popen([sys.executable, script, "--profile", profile, "--port", str(port), "--seed", str(seed)])
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Stub LLM exited with code {process.returncode}")
+        try:
+            urllib.request.urlopen(f"{url}/stats", timeout=1).close()
+            return process, url
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise SystemExit("Stub LLM did not start within 15s")
+
+
+def stub_llm_stats(url):
+    with urllib.request.urlopen(f"{url}/stats", timeout=5) as response:
+        return json.load(response)
+
+
+def load_prompts(path):
+    if not path:
+        return DEFAULT_PROMPTS
+    prompts = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                entry = json.loads(line)
+            else:
+                entry = {"task": line}
+            if entry.get("task"):
+                prompts.append(entry)
+    if not prompts:
+        raise SystemExit(f"No prompts found in {path}")
+    return prompts
+
+
+def build_schedule(prompts, count, seed, speed):
+    """[(start offset in seconds or None, prompt entry)] for `count` tasks."""
+    if all("at" in entry for entry in prompts):
+        # Open-loop replay of the recording, repeated until `count` tasks.
+        ordered = sorted(prompts, key=lambda e: float(e["at"]))
+        span = float(ordered[-1]["at"]) - float(ordered[0]["at"]) + 1
+        schedule = []
+        for i in range(count):
+            entry = ordered[i % len(ordered)]
+            at = (float(entry["at"]) - float(ordered[0]["at"]) + (i // len(ordered)) * span) / speed
+            schedule.append((at, entry))
+        return schedule
+    rng = random.Random(seed)
+    weights = [float(entry.get("weight", 1)) for entry in prompts]
+    return [(None, entry) for entry in rng.choices(prompts, weights=weights, k=count)]
+
+
+def _is_empty_read(result) -> bool:
+    """True for an XREAD/XREADGROUP reply without entries ([[stream, []], ...], {} or None)."""
+    if not result:
+        return True
+    streams = result.values() if isinstance(result, dict) else [item[1] for item in result]
+    return not any(streams)
+
+
+class RedisCounter:
+    """
+    Counts commands and round trips issued by this process's Redis client.
+    Stream reads that return nothing are idle consumers waiting for work, not per-task cost;
+    they are counted separately (fakeredis does not block on XREADGROUP, so idle workers poll).
+    """
+    def __init__(self, client):
+        self.commands = 0
+        self.round_trips = 0
+        self.idle_polls = 0
+        self._client = client
+        self._execute_command = client.execute_command
+        pipeline_class = type(client.pipeline())
+        self._pipeline_class = pipeline_class
+        self._pipeline_execute = pipeline_class.execute
+        counter = self
+
+        async def execute_command(*args, **kwargs):
+            result = await counter._execute_command(*args, **kwargs)
+            if args and args[0] in ("XREAD", "XREADGROUP") and _is_empty_read(result):
+                counter.idle_polls += 1
+            else:
+                counter.commands += 1
+                counter.round_trips += 1
+            return result
+
+        async def pipeline_execute(pipe, *args, **kwargs):
+            counter.commands += len(pipe.command_stack)
+            counter.round_trips += 1
+            return await counter._pipeline_execute(pipe, *args, **kwargs)
+
+        client.execute_command = execute_command
+        pipeline_class.execute = pipeline_execute
+
+    def snapshot(self):
+        return self.commands, self.round_trips
+
+    def restore(self):
+        self._client.execute_command = self._execute_command
+        self._pipeline_class.execute = self._pipeline_execute
+
+
+async def stream_events(app, task_id, on_event):
+    """
+    Reads /stream/{task_id} by calling the ASGI app directly, so events are seen as they are
+    sent (httpx's ASGI transport buffers the whole response). Returns when the stream ends.
+    """
+    disconnected = asyncio.Event()
+    buffer = ""
+    event_type = None
+
+    async def receive():
+        if not receive.sent:
+            receive.sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+    receive.sent = False
+
+    async def send(message):
+        nonlocal buffer, event_type
+        if message["type"] == "http.response.start":
+            if message["status"] != 200:
+                raise RuntimeError(f"stream returned HTTP {message['status']}")
+            return
+        if message["type"] != "http.response.body":
+            return
+        buffer += message.get("body", b"").decode("utf-8")
+        while "\n" in buffer:
+            line, buffer = buffer.split("\n", 1)
+            line = line.rstrip("\r")
+            if line.startswith("event:"):
+                event_type = line[6:].strip()
+            elif line.startswith("data:"):
+                data = line[5:].strip()
+                if event_type == "close":
+                    on_event("close", data)
+                else:
+                    try:
+                        on_event(json.loads(data).get("type"), data)
+                    except ValueError:
+                        pass
+            elif not line:
+                event_type = None
+        if not message.get("more_body", False):
+            disconnected.set()
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": f"/stream/{task_id}", "raw_path": f"/stream/{task_id}".encode(),
+        "query_string": b"", "root_path": "", "headers": [(b"accept", b"text/event-stream")],
+        "client": ("127.0.0.1", 0), "server": ("benchmark", 80),
+    }
+    try:
+        await app(scope, receive, send)
+    finally:
+        disconnected.set()
+
+
+async def run_task(app, client, entry, timeout):
+    """Submits one task and follows its stream. Returns a result dict."""
+    result = {"ok": False, "ttft": None, "done": None, "status": None}
+    payload = {"task": entry["task"]}
+    if entry.get("priority"):
+        payload["priority"] = entry["priority"]
+
+    started = time.perf_counter()
+    response = await client.post("/task", json=payload)
+    result["status"] = response.status_code
+    if response.status_code != 200:
+        return result
+    task_id = response.json()["task_id"]
+
+    def on_event(event_type, data):
+        now = time.perf_counter() - started
+        if event_type == "partial_output" and result["ttft"] is None:
+            result["ttft"] = now
+        elif event_type == "done":
+            result["done"] = now
+            result["ok"] = True
+
+    try:
+        await asyncio.wait_for(stream_events(app, task_id, on_event), timeout)
+    except asyncio.TimeoutError:
+        result["timeout"] = True
+    return result
+
+
+def percentiles(values):
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values) * 1000, 2),
+        "p50": round(pick(0.50) * 1000, 2),
+        "p95": round(pick(0.95) * 1000, 2),
+        "p99": round(pick(0.99) * 1000, 2),
+    }
+
+
+async def benchmark(args):
+    configure_environment(args)
+    import httpx
+    from app.main import app
+    from app.queue.redis_client import redis_client
+
+    # The app configures INFO logging on import; per-event lines would dominate the run.
+    logging.getLogger().setLevel(logging.WARNING)
+
+    prompts = load_prompts(args.prompts)
+    schedule = build_schedule(prompts, args.tasks, args.seed, args.speed)
+    open_loop = schedule[0][0] is not None
+
+    results = []
+    # Runs the app's startup/shutdown handlers (workers, orchestrator, maintenance).
+    async with app.router.lifespan_context(app):
+        counter = RedisCounter(redis_client.redis)
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=args.timeout) as client:
+                # One warm-up task so connection setup and group creation are not measured.
+                await run_task(app, client, {"task": "warm-up"}, args.timeout)
+                commands_before, round_trips_before = counter.snapshot()
+                started = time.perf_counter()
+
+                if open_loop:
+                    async def delayed(at, entry):
+                        await asyncio.sleep(max(0.0, at - (time.perf_counter() - started)))
+                        return await run_task(app, client, entry, args.timeout)
+                    results = await asyncio.gather(*(delayed(at, entry) for at, entry in schedule))
+                else:
+                    slots = asyncio.Semaphore(args.concurrency)
+
+                    async def bounded(entry):
+                        async with slots:
+                            return await run_task(app, client, entry, args.timeout)
+                    results = await asyncio.gather(*(bounded(entry) for _, entry in schedule))
+
+                wall = time.perf_counter() - started
+                commands, round_trips = counter.snapshot()
+                idle_polls = counter.idle_polls
+        finally:
+            counter.restore()
+
+    completed = [r for r in results if r["ok"]]
+    return {
+        "config": {
+            "tasks": args.tasks,
+            "concurrency": None if open_loop else args.concurrency,
+            "mode": "replay" if open_loop else "closed-loop",
+            "prompts": args.prompts or "built-in",
+            "redis": "redis" if args.redis_url else "fakeredis",
+            "llm": f"stub:{args.stub_llm}" if args.stub_llm else args.llm_url or "fallback",
+            "seed": args.seed,
+        },
+        "completed": len(completed),
+        "failed": sum(1 for r in results if r["status"] == 200 and not r["ok"]),
+        "rejected": sum(1 for r in results if r["status"] == 429),
+        "wall_seconds": round(wall, 3),
+        "tasks_per_sec": round(len(completed) / wall, 3) if wall > 0 else 0.0,
+        "ttft_ms": percentiles([r["ttft"] for r in completed if r["ttft"] is not None]),
+        "done_ms": percentiles([r["done"] for r in completed]),
+        "redis": {
+            "commands_per_task": round((commands - commands_before) / max(1, len(results)), 1),
+            "round_trips_per_task": round((round_trips - round_trips_before) / max(1, len(results)), 1),
+            "idle_polls": idle_polls,
+        },
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Relative change of each tracked metric vs the baseline; regressions beyond `tolerance`."""
+    def tracked(data):
+        values = {"tasks_per_sec": data.get("tasks_per_sec")}
+        for group in ("ttft_ms", "done_ms"):
+            for key in ("p50", "p95", "p99"):
+                values[f"{group}.{key}"] = data.get(group, {}).get(key)
+        for key in ("commands_per_task", "round_trips_per_task"):
+            # idle_polls depends on wall time and the Redis backend, so it is informational only.
+            values[f"redis.{key}"] = data.get("redis", {}).get(key)
+        return values
+
+    current, previous = tracked(report), tracked(baseline)
+    changes, regressions = {}, []
+    for name, value in current.items():
+        before = previous.get(name)
+        if value is None or not before:
+            continue
+        change = (value - before) / before
+        changes[name] = {"baseline": before, "current": value, "change": round(change, 4)}
+        worse = -change if name in HIGHER_IS_BETTER else change
+        if worse > tolerance:
+            regressions.append(name)
+    return {"tolerance": tolerance, "metrics": changes, "regressions": regressions}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end throughput/latency benchmark (in-process ASGI).")
+    parser.add_argument("--tasks", type=int, default=50, help="Tasks to run (default 50)")
+    parser.add_argument("--concurrency", type=int, default=10, help="Tasks in flight at once, closed-loop mode (default 10)")
+    parser.add_argument("--prompts", help="Prompt mix to replay (JSON lines or plain text)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed-up for recordings with `at` times")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for drawing prompts from the mix")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-task timeout in seconds")
+    parser.add_argument("--redis-url", help="Use this Redis instead of fakeredis")
+    parser.add_argument("--llm-url", help="OpenAI-compatible base URL for the agents (default: deterministic fallbacks)")
+    parser.add_argument("--stub-llm", metavar="PROFILE", help="Run tests/stub_llm.py with this profile and use it as the LLM")
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout only)")
+    parser.add_argument("--baseline", help="Previous report to compare against; exits 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression vs the baseline (default 0.15)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    stub = None
+    if args.stub_llm:
+        stub, args.llm_url = start_stub_llm(args.stub_llm, args.seed)
+    try:
+        report = asyncio.run(benchmark(args))
+        if stub is not None:
+            report["stub_llm"] = stub_llm_stats(args.llm_url)
+    finally:
+        if stub is not None:
+            stub.terminate()
+            stub.wait(timeout=10)
+
+    failed = False
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f), args.tolerance)
+        failed = bool(report["comparison"]["regressions"])
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+    print(f"{'❌' if failed else '✅'} {report['completed']}/{args.tasks} tasks, {report['tasks_per_sec']} tasks/s, "
+          f"TTFT p95 {report['ttft_ms'].get('p95')} ms, DONE p95 {report['done_ms'].get('p95')} ms", file=sys.stderr)
+    if failed:
+        print(f"❌ Regressions vs {args.baseline}: {', '.join(report['comparison']['regressions'])}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""
+Event codec micro-benchmark: bytes per stream entry and encode/decode cost for each codec
+in app/queue/codec.py, on events shaped like the ones the agents publish.
+
+    python tests/codec_benchmark.py
+    python tests/codec_benchmark.py --iterations 50000 --threshold 512 --output codecs.json
+
+Per codec and event kind it reports:
+- bytes: the XADD field names + values as sent to Redis (payload, type, codec, ...)
+- encode_us: RedisClient.event_fields (what every publish pays)
+- decode_us: stream entry -> Event (model validation included)
+- sse_us: stream entry -> SSE data (JSON passes through; other codecs are converted)
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+# The client is only used to build stream entries; no connection is opened.
+os.environ.setdefault("USE_FAKE_REDIS", "true")
+
+from app.models.events import Event, EventType, EventSource
+from app.queue import codec as codecs
+from app.queue.redis_client import RedisClient
+
+
+def sample_events():
+    """One event per kind the agents publish, with deterministic text."""
+    rng = random.Random(7)
+    words = ("agent system redis stream latency token model plan result analysis report "
+             "retrieval pipeline worker the a of and to in is for with").split()
+
+    def text(count):
+        return " ".join(rng.choice(words) for _ in range(count))
+
+    snippets = "\n\n".join(
+        f"{i}. {text(6).title()}\nhttps://example.com/{rng.randrange(10**6)}\n{text(60)}" for i in range(1, 6)
+    )
+    return {
+        "token": Event(type=EventType.PARTIAL_OUTPUT, source=EventSource.WRITER, message="streaming "),
+        "status": Event(type=EventType.STATUS, source=EventSource.ANALYZER, message="Analyzing retrieved data..."),
+        "search_results": Event(type=EventType.STATUS, source=EventSource.RETRIEVER, message=f"Search Results:\n{snippets}"),
+        "report": Event(type=EventType.PARTIAL_OUTPUT, source=EventSource.WRITER, message=text(3000)),
+        "done": Event(type=EventType.DONE, source=EventSource.WRITER, message="Task completed successfully."),
+    }
+
+
+def entry_bytes(fields):
+    return sum(len(k.encode()) + len(v.encode("utf-8", "surrogateescape")) for k, v in fields.items())
+
+
+def per_call_us(fn, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return round((time.perf_counter() - started) / iterations * 1e6, 2)
+
+
+def measure(codec, events, iterations):
+    client = RedisClient(codec)
+    results = {}
+    for kind, event in events.items():
+        fields = client.event_fields(event)
+        assert codecs.decode_event(fields) == event, f"{codec.name} does not round-trip {kind}"
+        results[kind] = {
+            "bytes": entry_bytes(fields),
+            "encode_us": per_call_us(lambda: client.event_fields(event), iterations),
+            "decode_us": per_call_us(lambda: codecs.decode_event(fields), iterations),
+            "sse_us": per_call_us(lambda: codecs.event_json(fields), iterations),
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bytes per event and encode/decode cost of the event codecs.")
+    parser.add_argument("--iterations", type=int, default=20000, help="Calls per measurement (default 20000)")
+    parser.add_argument("--threshold", type=int, default=codecs.EVENT_COMPRESS_THRESHOLD,
+                        help="msgpack compression threshold in bytes (default: EVENT_COMPRESS_THRESHOLD)")
+    parser.add_argument("--output", help="Also write the JSON report here")
+    args = parser.parse_args(argv)
+
+    events = sample_events()
+    report = {"iterations": args.iterations, "compress_threshold": args.threshold, "codecs": {}}
+    for name, codec_class in codecs.CODECS.items():
+        try:
+            codec = codec_class(compress_threshold=args.threshold) if codec_class is codecs.MsgpackCodec else codec_class()
+        except RuntimeError as e:
+            print(f"⚠️ Skipping {name}: {e}", file=sys.stderr)
+            continue
+        report["codecs"][name] = measure(codec, events, args.iterations)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+    baseline = report["codecs"].get(codecs.JsonCodec.name, {})
+    for name, results in report["codecs"].items():
+        summary = ", ".join(
+            f"{kind} {r['bytes']}B ({r['bytes'] / baseline[kind]['bytes']:.0%})" if kind in baseline else f"{kind} {r['bytes']}B"
+            for kind, r in results.items()
+        )
+        print(f"{name}: {summary}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
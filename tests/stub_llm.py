@@ -0,0 +1,275 @@
+"""
+Local stub of the Groq (OpenAI-compatible) chat completions API, for load tests and profiling
+without the real provider or the agents' hard-coded fallbacks.
+
+    python tests/stub_llm.py --profile groq --port 8100
+    GROQ_BASE_URL=http://127.0.0.1:8100 GROQ_API_KEY=stub USE_GROQ=true uvicorn app.main:app
+
+Serves POST /openai/v1/chat/completions (the path the groq SDK calls; /v1/chat/completions
+for other OpenAI clients), streaming and non-streaming. Each response has a time to first
+token, a tokens/sec rate and a length drawn from a log-normal distribution. Injected server
+errors (500) and rate limits (429 with retry-after) are returned before any tokens are sent.
+Requests that ask for `response_format: json_object` (the planner) get a valid 3-step plan.
+
+Profiles (`--profile`) set the defaults; any --ttft-ms, --tokens-per-sec... flag overrides
+them. Randomness comes from --seed and each request's arrival number, so a run with the same
+seed and request order returns the same latencies, lengths, errors and text.
+
+GET /stats returns request/error/token counters (the benchmark adds them to its report).
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import logging
+import argparse
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+logger = logging.getLogger("stub_llm")
+
+
+class Profile:
+    """Latency, throughput, failure and size characteristics of the simulated provider."""
+    def __init__(self, ttft_ms: float = 0.0, ttft_jitter_ms: float = 0.0, tokens_per_sec: float = 0.0,
+                 tokens: int = 200, tokens_sigma: float = 0.5, max_tokens: int = 2048,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, retry_after_ms: int = 1000):
+        self.ttft_ms = ttft_ms
+        self.ttft_jitter_ms = ttft_jitter_ms
+        # 0 sends every token at once after the first-token delay.
+        self.tokens_per_sec = tokens_per_sec
+        # Median response length; sigma is the log-normal spread (0 = always `tokens`).
+        self.tokens = tokens
+        self.tokens_sigma = tokens_sigma
+        self.max_tokens = max_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after_ms = retry_after_ms
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+
+PROFILES = {
+    # No latency or failures: measures the pipeline's own overhead.
+    "instant": Profile(tokens=50, tokens_sigma=0.0),
+    # Roughly a hosted Llama 3 on Groq: fast first token, very high decode rate.
+    "groq": Profile(ttft_ms=250, ttft_jitter_ms=100, tokens_per_sec=300, tokens=250, error_rate=0.002, rate_limit_rate=0.01),
+    # A typical GPU-served model: slower first token and decode.
+    "typical": Profile(ttft_ms=600, ttft_jitter_ms=300, tokens_per_sec=60, tokens=300, error_rate=0.005, rate_limit_rate=0.01),
+    # An overloaded provider: long queues before the first token.
+    "slow": Profile(ttft_ms=2000, ttft_jitter_ms=1000, tokens_per_sec=20, tokens=400, tokens_sigma=0.7, error_rate=0.01, rate_limit_rate=0.05),
+    # Exercises retries, dead-lettering and fallbacks.
+    "flaky": Profile(ttft_ms=300, ttft_jitter_ms=150, tokens_per_sec=150, tokens=200, error_rate=0.1, rate_limit_rate=0.15, retry_after_ms=500),
+}
+
+WORDS = (
+    "agent system task stream queue latency throughput token model plan step result analysis "
+    "report data redis worker event pipeline cache retry batch partial output signal context "
+    "the a of and to in is for with that on as by this from are it be can which"
+).split()
+
+
+class StubLLM:
+    """Generates simulated chat completions according to a Profile."""
+    def __init__(self, profile: Profile, seed: int = 42):
+        self.profile = profile
+        self.seed = seed
+        self._sequence = 0
+        self.stats = {
+            "requests": 0,
+            "streams": 0,
+            "errors_injected": 0,
+            "rate_limits_injected": 0,
+            "completion_tokens": 0,
+            "in_flight": 0,
+        }
+
+    def _rng(self) -> random.Random:
+        self._sequence += 1
+        return random.Random(f"{self.seed}:{self._sequence}")
+
+    def _ttft(self, rng: random.Random) -> float:
+        p = self.profile
+        return max(0.0, rng.gauss(p.ttft_ms, p.ttft_jitter_ms) if p.ttft_jitter_ms else p.ttft_ms) / 1000
+
+    def _length(self, rng: random.Random, requested: Optional[int]) -> int:
+        p = self.profile
+        length = rng.lognormvariate(math.log(max(1, p.tokens)), p.tokens_sigma) if p.tokens_sigma else p.tokens
+        return max(1, min(int(length), requested or p.max_tokens, p.max_tokens))
+
+    def _tokens(self, rng: random.Random, body: dict) -> list:
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            return [_plan(body)]
+        count = self._length(rng, body.get("max_tokens") or body.get("max_completion_tokens"))
+        words = [rng.choice(WORDS) for _ in range(count)]
+        words[0] = words[0].capitalize()
+        return [word + (" " if i < count - 1 else ".") for i, word in enumerate(words)]
+
+    def _injected_error(self, rng: random.Random) -> Optional[JSONResponse]:
+        draw = rng.random()
+        if draw < self.profile.rate_limit_rate:
+            self.stats["rate_limits_injected"] += 1
+            retry_after = self.profile.retry_after_ms / 1000
+            return JSONResponse(status_code=429, headers={
+                "retry-after": str(max(1, math.ceil(retry_after))),
+                "retry-after-ms": str(self.profile.retry_after_ms),
+            }, content={"error": {
+                "message": f"Rate limit reached (stub). Please try again in {retry_after:.2f}s.",
+                "type": "tokens",
+                "code": "rate_limit_exceeded",
+            }})
+        if draw < self.profile.rate_limit_rate + self.profile.error_rate:
+            self.stats["errors_injected"] += 1
+            return JSONResponse(status_code=500, content={"error": {
+                "message": "Internal server error (stub)",
+                "type": "internal_server_error",
+            }})
+        return None
+
+    async def handle(self, body: dict):
+        self.stats["requests"] += 1
+        rng = self._rng()
+        error = self._injected_error(rng)
+        if error is not None:
+            return error
+
+        model = body.get("model") or "stub"
+        completion_id = f"chatcmpl-stub-{self.seed}-{self._sequence}"
+        created = int(time.time())
+        ttft = self._ttft(rng)
+        tokens = self._tokens(rng, body)
+        prompt_tokens = sum(len(str(m.get("content") or "")) for m in body.get("messages") or []) // 4 + 1
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens), "total_tokens": prompt_tokens + len(tokens)}
+
+        if not body.get("stream"):
+            self.stats["in_flight"] += 1
+            try:
+                await asyncio.sleep(ttft + self._decode_seconds(len(tokens) - 1))
+            finally:
+                self.stats["in_flight"] -= 1
+            self.stats["completion_tokens"] += len(tokens)
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        self.stats["streams"] += 1
+
+        def chunk(delta: dict, finish_reason: Optional[str] = None, **extra) -> str:
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            data.update(extra)
+            return f"data: {json.dumps(data)}\n\n"
+
+        async def events():
+            self.stats["in_flight"] += 1
+            try:
+                await asyncio.sleep(ttft)
+                started = time.perf_counter()
+                yield chunk({"role": "assistant", "content": ""})
+                for i, token in enumerate(tokens):
+                    # Pace against the start time so sleep overshoot does not accumulate.
+                    delay = started + self._decode_seconds(i) - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    self.stats["completion_tokens"] += 1
+                    yield chunk({"content": token})
+                yield chunk({}, "stop", x_groq={"id": completion_id, "usage": usage})
+                yield "data: [DONE]\n\n"
+            finally:
+                self.stats["in_flight"] -= 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    def _decode_seconds(self, tokens: int) -> float:
+        return tokens / self.profile.tokens_per_sec if self.profile.tokens_per_sec > 0 else 0.0
+
+
+def _plan(body: dict) -> str:
+    """A plan in the format the planner asks for, mentioning the user's task."""
+    task = next((m.get("content") for m in reversed(body.get("messages") or []) if m.get("role") == "user"), "the task")
+    return json.dumps({"steps": [
+        {"title": "Research Topic", "description": f"Gather information about: {task}", "assigned_agent": "retriever", "depends_on": []},
+        {"title": "Analyze Findings", "description": "Extract key insights from the research", "assigned_agent": "analyzer", "depends_on": [1]},
+        {"title": "Write Report", "description": "Write the final answer from the analysis", "assigned_agent": "writer", "depends_on": [2]},
+    ]})
+
+
+def create_app(profile: Profile, seed: int = 42) -> FastAPI:
+    stub = StubLLM(profile, seed)
+    app = FastAPI(title="Stub LLM")
+    app.state.stub = stub
+
+    @app.post("/openai/v1/chat/completions")
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        return await stub.handle(await request.json())
+
+    @app.get("/openai/v1/models")
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "stub"}]}
+
+    @app.get("/stats")
+    async def stats():
+        return {"profile": stub.profile.to_dict(), "seed": stub.seed, **stub.stats}
+
+    return app
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Local stub of the Groq/OpenAI chat completions API.")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default=os.getenv("STUB_LLM_PROFILE", "groq"),
+                        help="Latency/failure profile (default: STUB_LLM_PROFILE or groq)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("STUB_LLM_PORT", "8100")))
+    parser.add_argument("--seed", type=int, default=42, help="Seed for latencies, lengths, errors and text")
+    parser.add_argument("--ttft-ms", type=float, help="Mean time to first token")
+    parser.add_argument("--ttft-jitter-ms", type=float, help="Standard deviation of the time to first token")
+    parser.add_argument("--tokens-per-sec", type=float, help="Decode rate after the first token (0 = unpaced)")
+    parser.add_argument("--tokens", type=int, help="Median response length in tokens")
+    parser.add_argument("--tokens-sigma", type=float, help="Log-normal spread of the response length (0 = fixed)")
+    parser.add_argument("--max-tokens", type=int, help="Upper bound on the response length")
+    parser.add_argument("--error-rate", type=float, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, help="Fraction of requests answered with HTTP 429")
+    parser.add_argument("--retry-after-ms", type=int, help="retry-after sent with injected 429s")
+    return parser.parse_args(argv)
+
+
+def build_profile(args: argparse.Namespace) -> Profile:
+    """The selected profile with any explicit overrides applied."""
+    settings = PROFILES[args.profile].to_dict()
+    for key in settings:
+        value = getattr(args, key, None)
+        if value is not None:
+            settings[key] = value
+    return Profile(**settings)
+
+
+def main(argv=None):
+    import uvicorn
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    args = parse_args(argv)
+    profile = build_profile(args)
+    logger.info(f"🤖 Stub LLM '{args.profile}' on http://{args.host}:{args.port} (seed {args.seed}): {profile.to_dict()}")
+    uvicorn.run(create_app(profile, args.seed), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
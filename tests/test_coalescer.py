@@ -0,0 +1,70 @@
+"""
+TaskCoalescer against fakeredis: followers only coalesce into a leader whose submission was
+written, never into one whose submission failed, and only at the same priority.
+
+    python -m pytest -q tests/test_coalescer.py
+"""
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["USE_FAKE_REDIS"] = "true"
+
+from app.core.coalescer import TaskCoalescer
+from app.models.events import Event, EventType, EventSource
+from app.models.task import Priority
+from app.queue.redis_client import RedisClient
+
+
+async def _submit(redis, coalescer, task_id, prompt, priority=Priority.STANDARD, queue="queue:test-coalesce"):
+    """The leader's side of POST /task."""
+    batch = (redis.batch(transaction=True)
+             .publish_event(task_id, Event(type=EventType.STATUS, source=EventSource.SYSTEM, message="Task received."))
+             .enqueue(queue, {"task_id": task_id}))
+    coalescer.lead(batch, task_id, prompt, priority)
+    try:
+        await batch.execute()
+    except Exception:
+        await coalescer.release(task_id, prompt, priority)
+        raise
+
+
+def test_follower_joins_a_written_leader_at_the_same_priority():
+    async def scenario():
+        redis = RedisClient()
+        coalescer = TaskCoalescer(redis)
+        prompt = "Summarize the coalescing test"
+        await redis.redis.delete(coalescer.key(prompt), coalescer.key(prompt, Priority.BATCH))
+        before = await coalescer.claim("follower-0", prompt)
+        await _submit(redis, coalescer, "leader-1", prompt)
+        return (
+            before,
+            await coalescer.claim("follower-1", "  summarize THE coalescing test ", Priority.STANDARD),
+            await redis.redis.exists("task_events:leader-1"),
+            await coalescer.claim("follower-2", prompt, Priority.BATCH),
+            await coalescer.resolve("follower-1"),
+        )
+
+    assert asyncio.run(scenario()) == (None, "leader-1", 1, None, "leader-1")
+
+
+def test_failed_leader_submission_is_never_coalesced_into():
+    async def scenario():
+        redis = RedisClient()
+        coalescer = TaskCoalescer(redis)
+        prompt = "A leader whose submission fails"
+        queue = "queue:test-coalesce-fail"
+        await redis.redis.delete(coalescer.key(prompt))
+        # XADD fails with WRONGTYPE while the queue key holds a string.
+        await redis.redis.set(queue, "not a stream")
+        try:
+            await _submit(redis, coalescer, "leader-2", prompt, queue=queue)
+            failed = False
+        except Exception:
+            failed = True
+        finally:
+            await redis.redis.delete(queue)
+        return failed, await coalescer.claim("follower-3", prompt)
+
+    assert asyncio.run(scenario()) == (True, None)
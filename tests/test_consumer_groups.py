@@ -0,0 +1,219 @@
+"""
+Consumer-group behaviour of the agent workers against fakeredis: in-flight entries are kept
+fresh while every slot is busy, stale entries are reclaimed even with concurrency 1, poison
+entries are dead-lettered, a failed step's retry is acknowledged with its schedule, a consumer
+idle on all lanes takes no more than it can run, and heartbeats never take back entries another
+consumer has reclaimed.
+
+    python -m pytest -q tests/test_consumer_groups.py
+"""
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["USE_FAKE_REDIS"] = "true"
+os.environ["USE_GROQ"] = "false"
+
+from app.agents import base_worker
+from app.agents.base_worker import BaseWorker
+from app.models.task import AgentType
+from app.queue.redis_client import RedisClient
+
+QUEUE = "queue:retriever"
+GROUP = "group:retriever"
+
+
+class SlowWorker(BaseWorker):
+    """Records which consumer ran each step, and when (seconds since the test started)."""
+    def __init__(self, redis, name, concurrency, seconds, calls, started):
+        super().__init__(AgentType.RETRIEVER, redis, concurrency)
+        self.consumer_name = name
+        self.seconds = seconds
+        self.calls = calls
+        self.started = started
+
+    async def process_step(self, task_id, step_id, instruction, retry_count):
+        self.calls.append((self.consumer_name, step_id, round(time.monotonic() - self.started, 2)))
+        await asyncio.sleep(self.seconds)
+
+
+def _configure(monkeypatch, visibility_ms=1000, reclaim_seconds=0.2):
+    monkeypatch.setattr(base_worker, "VISIBILITY_TIMEOUT_MS", visibility_ms)
+    monkeypatch.setattr(base_worker, "RECLAIM_INTERVAL_SECONDS", reclaim_seconds)
+
+
+async def _stop(*runs):
+    for worker, task in runs:
+        worker.stop()
+        task.cancel()
+    await asyncio.gather(*(task for _, task in runs), return_exceptions=True)
+
+
+def test_busy_consumer_keeps_its_entries(monkeypatch):
+    """Steps outlasting the visibility timeout are not taken over while their consumer is alive."""
+    _configure(monkeypatch)
+
+    async def scenario():
+        redis = RedisClient()
+        await redis.ensure_consumer_group(QUEUE, GROUP)
+        for step_id in (1, 2):
+            await redis.redis.xadd(QUEUE, {"task_id": "t1", "step_id": step_id, "instruction": "slow"})
+
+        calls, started = [], time.monotonic()
+        a = SlowWorker(redis, "A", 2, 3.0, calls, started)
+        b = SlowWorker(redis, "B", 2, 3.0, calls, started)
+        runs = [(a, asyncio.create_task(a.run()))]
+        while len(a._in_flight) < 2:
+            await asyncio.sleep(0.05)
+        runs.append((b, asyncio.create_task(b.run())))
+        # Both of A's slots stay busy for 3s, three times the visibility timeout.
+        await asyncio.sleep(3.5)
+        await _stop(*runs)
+        return calls
+
+    calls = asyncio.run(scenario())
+    assert sorted(step for _, step, _ in calls) == ["1", "2"], calls
+    assert all(name == "A" for name, _, _ in calls), calls
+
+
+def test_single_slot_consumer_reclaims_stale_entries(monkeypatch):
+    """With concurrency 1 the slot the loop holds is used for a reclaimed entry."""
+    _configure(monkeypatch)
+
+    async def scenario():
+        redis = RedisClient()
+        await redis.ensure_consumer_group(QUEUE, GROUP)
+        await redis.redis.xadd(QUEUE, {"task_id": "t2", "step_id": 1, "instruction": "orphaned"})
+        # A consumer takes the entry and dies without acknowledging it.
+        assert await redis.read_group(QUEUE, GROUP, "dead", count=1, block=None)
+        await asyncio.sleep(1.1)
+
+        calls, started = [], time.monotonic()
+        worker = SlowWorker(redis, "C", 1, 0.0, calls, started)
+        run = (worker, asyncio.create_task(worker.run()))
+        deadline = time.monotonic() + 5
+        while not calls and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.2)
+        pending = await redis.redis.xpending(QUEUE, GROUP)
+        await _stop(run)
+        return calls, pending
+
+    calls, pending = asyncio.run(scenario())
+    assert [(name, step) for name, step, _ in calls] == [("C", "1")], calls
+    assert pending["pending"] == 0, pending
+
+
+def test_idle_consumer_takes_only_free_slots_across_lanes(monkeypatch):
+    """Work arriving on every lane while the consumer waits is not over-delivered to it."""
+    _configure(monkeypatch, visibility_ms=60000, reclaim_seconds=60)
+
+    async def scenario():
+        redis = RedisClient()
+        calls = []
+        worker = SlowWorker(redis, "E", 1, 3.0, calls, time.monotonic())
+        run = (worker, asyncio.create_task(worker.run()))
+        # Let it reach the blocking wait on the empty lanes.
+        await asyncio.sleep(0.3)
+        for lane in worker.lanes:
+            await redis.redis.xadd(lane.queue, {"task_id": "t4", "step_id": lane.queue, "instruction": "slow"})
+        await asyncio.sleep(0.5)
+        pending = [await redis.redis.xpending(lane.queue, GROUP) for lane in worker.lanes]
+        await _stop(run)
+        return calls, pending
+
+    calls, pending = asyncio.run(scenario())
+    assert len(calls) == 1, calls
+    assert sum(p["pending"] for p in pending) == 1, pending
+
+
+class FailingWorker(BaseWorker):
+    def __init__(self, redis):
+        super().__init__(AgentType.RETRIEVER, redis, 1)
+        self.consumer_name = "F"
+
+    async def process_step(self, task_id, step_id, instruction, retry_count):
+        raise ConnectionError("provider unreachable")
+
+
+def test_retry_is_acknowledged_with_its_schedule(monkeypatch):
+    """No separate XACK after scheduling a retry, so a failure there cannot run the step twice."""
+    _configure(monkeypatch)
+
+    async def scenario():
+        redis = RedisClient()
+        await redis.ensure_consumer_group(QUEUE, GROUP)
+        await redis.redis.delete("retry:scheduled")
+        await redis.redis.xadd(QUEUE, {"task_id": "t5", "step_id": 1, "instruction": "flaky"})
+
+        async def ack_fails(*args):
+            raise ConnectionError("Redis blip")
+        monkeypatch.setattr(redis, "ack", ack_fails)
+        worker = FailingWorker(redis)
+        run = (worker, asyncio.create_task(worker.run()))
+        deadline = time.monotonic() + 5
+        while not await redis.redis.zcard("retry:scheduled") and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.1)
+        await _stop(run)
+        return await redis.redis.zcard("retry:scheduled"), await redis.redis.xpending(QUEUE, GROUP)
+
+    scheduled, pending = asyncio.run(scenario())
+    assert scheduled == 1
+    assert pending["pending"] == 0, pending
+
+
+def test_poison_entry_is_dead_lettered(monkeypatch):
+    """An entry redelivered too often ends its step instead of being silently dropped."""
+    _configure(monkeypatch)
+    monkeypatch.setattr(base_worker, "MAX_DELIVERIES", 1)
+
+    async def scenario():
+        redis = RedisClient()
+        await redis.ensure_consumer_group(QUEUE, GROUP)
+        await redis.redis.xadd(QUEUE, {"task_id": "t3", "step_id": 1, "instruction": "crashes"})
+        assert await redis.read_group(QUEUE, GROUP, "dead", count=1, block=None)
+        await asyncio.sleep(1.1)
+
+        calls = []
+        worker = SlowWorker(redis, "D", 1, 0.0, calls, time.monotonic())
+        run = (worker, asyncio.create_task(worker.run()))
+        deadline = time.monotonic() + 5
+        while not await redis.redis.xlen("dead_letter:retriever") and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        await _stop(run)
+        return (
+            calls,
+            await redis.redis.xrange("dead_letter:retriever"),
+            await redis.redis.xrange("task_steps:t3"),
+            await redis.redis.xrange("task_events:t3"),
+            await redis.redis.xpending(QUEUE, GROUP),
+        )
+
+    calls, dead, steps, events, pending = asyncio.run(scenario())
+    assert calls == []
+    assert [fields["error_type"] for _, fields in dead] == ["PoisonMessageError"]
+    assert [(f["step_id"], f["status"]) for _, f in steps] == [("1", "failed")]
+    assert [(f["type"], f.get("terminal")) for _, f in events] == [("error", "1")]
+    assert pending["pending"] == 0
+
+
+def test_heartbeat_leaves_reclaimed_entries_alone():
+    """A slow consumer's heartbeat only refreshes entries it still owns."""
+    async def scenario():
+        redis = RedisClient()
+        queue, group = "queue:test-touch", "group:test-touch"
+        await redis.redis.delete(queue)
+        await redis.ensure_consumer_group(queue, group)
+        for step_id in (1, 2):
+            await redis.redis.xadd(queue, {"task_id": "t1", "step_id": step_id})
+        (first, _), (second, _) = await redis.read_group(queue, group, "slow", count=2, block=None)
+        # The slow consumer looked dead for a moment; another one took the first entry over.
+        assert [msg_id for msg_id, _, _ in await redis.claim_stale(queue, group, "live", 0, count=1)] == [first]
+        touched = await redis.touch_pending(queue, group, "slow", first, second)
+        owners = {entry["message_id"]: entry["consumer"] for entry in await redis.redis.xpending_range(queue, group, "-", "+", 10)}
+        return touched, owners[first], owners[second]
+
+    assert asyncio.run(scenario()) == (1, "live", "slow")
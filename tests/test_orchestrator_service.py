@@ -0,0 +1,220 @@
+"""
+OrchestratorService against fakeredis: a reclaimed submission resumes its task from the
+stored plan and step completions instead of planning and dispatching it again, submissions
+of finished tasks are dropped, a busy service keeps its submissions fresh, rate-limited plans
+are parked for retry and poison submissions fail their task.
+
+    python -m pytest -q tests/test_orchestrator_service.py
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["USE_FAKE_REDIS"] = "true"
+os.environ["USE_GROQ"] = "false"
+
+from app.core import orchestrator, orchestrator_service
+from app.core.rate_limiter import LLMRateLimitError
+from app.core.orchestrator_service import ORCHESTRATOR_GROUP, ORCHESTRATOR_QUEUE, OrchestratorService
+from app.models.task import AgentType, Priority, Step, TaskPlan
+from app.queue.redis_client import RedisClient
+from app.queue.retry_scheduler import RetryScheduler, SCHEDULE_KEY
+from app.streaming.hub import StreamHub
+
+
+def _plan(task_id):
+    return TaskPlan(task_id=task_id, original_prompt="resume me", steps=[
+        Step(id=1, title="Research", description="research", assigned_agent=AgentType.RETRIEVER),
+        Step(id=2, title="Analyze", description="analyze", assigned_agent=AgentType.ANALYZER, depends_on=[1]),
+        Step(id=3, title="Write", description="write", assigned_agent=AgentType.WRITER, depends_on=[2]),
+    ])
+
+
+def _configure(monkeypatch, redis):
+    monkeypatch.setattr(orchestrator_service, "ORCHESTRATOR_VISIBILITY_TIMEOUT_MS", 1000)
+    monkeypatch.setattr(orchestrator_service, "RECLAIM_INTERVAL_SECONDS", 0.2)
+    monkeypatch.setattr(orchestrator, "redis_client", redis)
+    hub = StreamHub(redis, key_prefix="task_steps:")
+    monkeypatch.setattr(orchestrator, "step_hub", hub)
+    return hub
+
+
+async def _dispatched(redis, agent, task_id):
+    return [fields["step_id"] for _, fields in await redis.redis.xrange(f"queue:{agent}") if fields["task_id"] == task_id]
+
+
+async def _consumed(redis):
+    """Every submission has been delivered and acknowledged."""
+    group = next(g for g in await redis.redis.xinfo_groups(ORCHESTRATOR_QUEUE) if g["name"] == ORCHESTRATOR_GROUP)
+    return group["pending"] == 0 and group["lag"] == 0
+
+
+async def _wait_for(condition, seconds=5.0):
+    deadline = time.monotonic() + seconds
+    while not await condition() and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+
+
+def test_reclaimed_submission_resumes_without_replanning(monkeypatch):
+    """Step 1 finished under a dead orchestrator: only steps 2 and 3 are dispatched, once each."""
+    redis = RedisClient()
+    hub = _configure(monkeypatch, redis)
+
+    async def scenario():
+        task_id = "resume-1"
+        await redis.ensure_consumer_group(ORCHESTRATOR_QUEUE, ORCHESTRATOR_GROUP)
+        await (redis.batch()
+               .track_task(task_id)
+               .store_plan(task_id, _plan(task_id).json())
+               .steps_dispatched(task_id, [1])
+               .step_finished(task_id, 1, "completed")
+               .enqueue(ORCHESTRATOR_QUEUE, OrchestratorService.submission(task_id, "resume me", Priority.STANDARD))
+               .execute())
+        # The orchestrator that took the submission dies; the entry goes stale.
+        assert await redis.read_group(ORCHESTRATOR_QUEUE, ORCHESTRATOR_GROUP, "dead", count=1, block=None)
+        await asyncio.sleep(1.1)
+
+        service = OrchestratorService(redis, concurrency=1)
+        planned = []
+
+        async def plan(*args):
+            planned.append(args)
+            raise AssertionError("re-planned a task with a stored plan")
+        monkeypatch.setattr(service.orchestrator.planner, "plan", plan)
+        run = asyncio.create_task(service.run())
+
+        await _wait_for(lambda: _dispatched(redis, "analyzer", task_id))
+        # Longer than the visibility timeout, with the only slot busy orchestrating.
+        await asyncio.sleep(1.5)
+        idle = [entry["time_since_delivered"] for entry in await redis.redis.xpending_range(ORCHESTRATOR_QUEUE, ORCHESTRATOR_GROUP, "-", "+", 10)]
+        await redis.batch().step_finished(task_id, 2, "completed").execute()
+        await _wait_for(lambda: _dispatched(redis, "writer", task_id))
+        await redis.batch().step_finished(task_id, 3, "completed").execute()
+        await _wait_for(lambda: _consumed(redis))
+
+        result = (
+            planned,
+            idle,
+            await _dispatched(redis, "retriever", task_id),
+            await _dispatched(redis, "analyzer", task_id),
+            await _dispatched(redis, "writer", task_id),
+            (await redis.redis.xpending(ORCHESTRATOR_QUEUE, ORCHESTRATOR_GROUP))["pending"],
+        )
+        service.stop()
+        run.cancel()
+        await asyncio.gather(run, return_exceptions=True)
+        await hub.close()
+        return result
+
+    planned, idle, retriever, analyzer, writer, pending = asyncio.run(scenario())
+    assert planned == []
+    assert len(idle) == 1 and idle[0] < 1000, idle
+    assert (retriever, analyzer, writer) == ([], ["2"], ["3"])
+    assert pending == 0
+
+
+def test_submission_of_finished_task_is_dropped(monkeypatch):
+    """A submission whose task already left tasks:active is acknowledged without orchestration."""
+    redis = RedisClient()
+    hub = _configure(monkeypatch, redis)
+
+    async def scenario():
+        task_id = "finished-1"
+        await redis.ensure_consumer_group(ORCHESTRATOR_QUEUE, ORCHESTRATOR_GROUP)
+        await (redis.batch()
+               .track_task(task_id)
+               .finish_task(task_id)
+               .enqueue(ORCHESTRATOR_QUEUE, OrchestratorService.submission(task_id, "already done", Priority.STANDARD))
+               .execute())
+
+        service = OrchestratorService(redis, concurrency=1)
+        run = asyncio.create_task(service.run())
+        await _wait_for(lambda: _consumed(redis))
+        result = (
+            await redis.redis.xlen(f"task_events:{task_id}"),
+            await _dispatched(redis, "retriever", task_id),
+            (await redis.redis.xpending(ORCHESTRATOR_QUEUE, ORCHESTRATOR_GROUP))["pending"],
+        )
+        service.stop()
+        run.cancel()
+        await asyncio.gather(run, return_exceptions=True)
+        await hub.close()
+        return result
+
+    events, dispatched, pending = asyncio.run(scenario())
+    assert (events, dispatched, pending) == (0, [], 0)
+
+
+def test_rate_limited_plan_is_parked_for_retry(monkeypatch):
+    """A rate-limited plan is acknowledged in the same transaction as its scheduled retry."""
+    redis = RedisClient()
+    hub = _configure(monkeypatch, redis)
+
+    async def scenario():
+        task_id = "rate-limited-1"
+        await redis.redis.delete(SCHEDULE_KEY)
+        await redis.ensure_consumer_group(ORCHESTRATOR_QUEUE, ORCHESTRATOR_GROUP)
+        await (redis.batch()
+               .track_task(task_id)
+               .enqueue(ORCHESTRATOR_QUEUE, OrchestratorService.submission(task_id, "plan me later", Priority.STANDARD))
+               .execute())
+
+        service = OrchestratorService(redis, concurrency=1, scheduler=RetryScheduler(redis))
+        announced = []
+
+        async def plan(task_id, task_input, announce=True):
+            announced.append(announce)
+            raise LLMRateLimitError("no capacity")
+        monkeypatch.setattr(service.orchestrator.planner, "plan", plan)
+        run = asyncio.create_task(service.run())
+        await _wait_for(lambda: _consumed(redis))
+        scheduled = [json.loads(member) for member in await redis.redis.zrange(SCHEDULE_KEY, 0, -1)]
+        service.stop()
+        run.cancel()
+        await asyncio.gather(run, return_exceptions=True)
+        await hub.close()
+        return announced, scheduled
+
+    announced, scheduled = asyncio.run(scenario())
+    assert announced == [True]
+    assert [(member["queue"], member["fields"]["task_id"], member["fields"]["retry_count"]) for member in scheduled] == [
+        (ORCHESTRATOR_QUEUE, "rate-limited-1", 1)]
+
+
+def test_poison_submission_fails_its_task(monkeypatch):
+    """A submission delivered more than ORCHESTRATOR_MAX_DELIVERIES times ends its task and is dead-lettered."""
+    redis = RedisClient()
+    hub = _configure(monkeypatch, redis)
+    monkeypatch.setattr(orchestrator_service, "ORCHESTRATOR_MAX_DELIVERIES", 1)
+
+    async def scenario():
+        task_id = "poison-1"
+        await redis.redis.delete("dead_letter:orchestrator")
+        await redis.ensure_consumer_group(ORCHESTRATOR_QUEUE, ORCHESTRATOR_GROUP)
+        await (redis.batch()
+               .track_task(task_id)
+               .enqueue(ORCHESTRATOR_QUEUE, OrchestratorService.submission(task_id, "crashes its orchestrator", Priority.STANDARD))
+               .execute())
+        # Its first orchestrator died with it.
+        assert await redis.read_group(ORCHESTRATOR_QUEUE, ORCHESTRATOR_GROUP, "dead", count=1, block=None)
+        await asyncio.sleep(1.1)
+
+        service = OrchestratorService(redis, concurrency=1)
+        run = asyncio.create_task(service.run())
+        await _wait_for(lambda: _consumed(redis))
+        events = [fields for _, fields in await redis.redis.xrange(f"task_events:{task_id}")]
+        dead = [fields["task_id"] for _, fields in await redis.redis.xrange("dead_letter:orchestrator")]
+        active = await redis.redis.zscore("tasks:active", task_id)
+        service.stop()
+        run.cancel()
+        await asyncio.gather(run, return_exceptions=True)
+        await hub.close()
+        return events, dead, active
+
+    events, dead, active = asyncio.run(scenario())
+    assert [(fields["type"], fields.get("terminal")) for fields in events] == [("error", "1")], events
+    assert dead == ["poison-1"]
+    assert active is None
@@ -0,0 +1,43 @@
+"""
+RetentionJanitor against fakeredis: janitors sweeping concurrently on several replicas end
+each abandoned task once and count it once.
+
+    python -m pytest -q tests/test_retention.py
+"""
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["USE_FAKE_REDIS"] = "true"
+
+from app.queue import retention
+from app.queue.redis_client import RedisClient, ACTIVE_TASKS_KEY, EXPIRING_TASKS_KEY
+from app.queue.retention import RetentionJanitor, SWEEP_LOCK_KEY
+
+
+def test_concurrent_janitors_abandon_each_task_once(monkeypatch):
+    monkeypatch.setattr(retention, "ABANDONED_TASK_SECONDS", 60)
+
+    async def scenario():
+        redis = RedisClient()
+        task_ids = [f"abandoned-{i}" for i in range(20)]
+        await redis.redis.delete(ACTIVE_TASKS_KEY, EXPIRING_TASKS_KEY, SWEEP_LOCK_KEY, *(f"task_events:{t}" for t in task_ids))
+        await redis.redis.zadd(ACTIVE_TASKS_KEY, {task_id: 0 for task_id in task_ids})
+
+        janitors = [RetentionJanitor(redis) for _ in range(3)]
+        swept = await asyncio.gather(*(janitor.sweep() for janitor in janitors))
+        events = [await redis.redis.xlen(f"task_events:{task_id}") for task_id in task_ids]
+        return (
+            swept,
+            events,
+            sum(janitor.stats["tasks_abandoned"] for janitor in janitors),
+            await redis.redis.zcard(ACTIVE_TASKS_KEY),
+            await redis.redis.exists(SWEEP_LOCK_KEY),
+            await janitors[1].sweep(),
+        )
+
+    swept, events, abandoned, active, locked, swept_again = asyncio.run(scenario())
+    assert swept == [True, False, False]
+    assert events == [1] * 20
+    assert (abandoned, active, locked, swept_again) == (20, 0, 0, True)
@@ -0,0 +1,77 @@
+"""
+RetryScheduler promotion against fakeredis: a promotion that fails or is cancelled part way
+never loses a retry, and concurrent schedulers promote every entry exactly once.
+
+    python -m pytest -q tests/test_retry_scheduler.py
+"""
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["USE_FAKE_REDIS"] = "true"
+
+from app.queue.redis_client import RedisClient
+from app.queue.retry_scheduler import RetryScheduler, SCHEDULE_KEY
+
+
+async def _schedule(redis, scheduler, queue, count):
+    await redis.redis.delete(SCHEDULE_KEY, queue)
+    batch = redis.batch()
+    for step_id in range(count):
+        scheduler.schedule(batch, queue, {"task_id": "t1", "step_id": step_id, "retry_count": 1}, 0)
+    await batch.execute()
+
+
+def test_failed_requeue_keeps_the_retry_scheduled():
+    """The re-queue fails after the entry was picked up: it stays scheduled and is promoted later."""
+    async def scenario():
+        redis = RedisClient()
+        scheduler = RetryScheduler(redis)
+        queue = "queue:test-promote-fail"
+        await _schedule(redis, scheduler, queue, 3)
+        # XADD fails with WRONGTYPE while the key holds a string.
+        await redis.redis.set(queue, "not a stream")
+        failed = (await scheduler.promote_due(), await redis.redis.zcard(SCHEDULE_KEY))
+        await redis.redis.delete(queue)
+        promoted = (await scheduler.promote_due(), await redis.redis.zcard(SCHEDULE_KEY), await redis.redis.xlen(queue))
+        return failed, promoted
+
+    failed, promoted = asyncio.run(scenario())
+    assert failed == (0, 3)
+    assert promoted == (3, 0, 3)
+
+
+def test_cancelled_promotion_loses_nothing():
+    """Cancelling a promotion at any await point leaves each retry either scheduled or queued."""
+    async def scenario():
+        redis = RedisClient()
+        scheduler = RetryScheduler(redis)
+        queue = "queue:test-promote-cancel"
+        outcomes = []
+        for steps in range(8):
+            await _schedule(redis, scheduler, queue, 10)
+            promotion = asyncio.create_task(scheduler.promote_due())
+            for _ in range(steps):
+                await asyncio.sleep(0)
+            promotion.cancel()
+            await asyncio.gather(promotion, return_exceptions=True)
+            outcomes.append(await redis.redis.zcard(SCHEDULE_KEY) + await redis.redis.xlen(queue))
+        return outcomes
+
+    assert asyncio.run(scenario()) == [10] * 8
+
+
+def test_concurrent_schedulers_promote_each_retry_once():
+    async def scenario():
+        redis = RedisClient()
+        schedulers = [RetryScheduler(redis) for _ in range(3)]
+        queue = "queue:test-promote-race"
+        await _schedule(redis, schedulers[0], queue, 50)
+        promoted = await asyncio.gather(*(scheduler.promote_due() for scheduler in schedulers))
+        steps = [fields["step_id"] for _, fields in await redis.redis.xrange(queue)]
+        return sum(promoted), sorted(steps, key=int)
+
+    promoted, steps = asyncio.run(scenario())
+    assert promoted == 50
+    assert steps == [str(i) for i in range(50)]
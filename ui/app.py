@@ -45,6 +45,10 @@ if "stream_completed" not in st.session_state:
 if "final_output" not in st.session_state:
     st.session_state.final_output = ""
 
+# Last SSE event id seen, so reruns/reconnects resume instead of replaying the task
+if "last_event_id" not in st.session_state:
+    st.session_state.last_event_id = None
+
 # -------------------------------------------------------------------------
 # 2. Sidebar
 # -------------------------------------------------------------------------
@@ -149,6 +153,7 @@ with col_head_2:
         st.session_state.current_step = 0
         st.session_state.stream_completed = False
         st.session_state.final_output = ""
+        st.session_state.last_event_id = None
         st.rerun()
 
 st.divider()
@@ -174,6 +179,7 @@ if not st.session_state.task_id:
                     st.session_state.stream_completed = False
                     st.session_state.events = []
                     st.session_state.final_output = ""
+                    st.session_state.last_event_id = None
                     st.rerun()
                 else:
                     st.error("Failed to contact backend.")
@@ -219,10 +225,12 @@ if st.session_state.task_id:
     if not st.session_state.stream_completed:
         
         # Generator that yields events
-        for event in stream.stream_events(st.session_state.task_id):
+        for event in stream.stream_events(st.session_state.task_id, st.session_state.last_event_id):
             
             # 1. Update Logs (in-memory)
             st.session_state.events.append(event)
+            if event.get("event_id"):
+                st.session_state.last_event_id = event["event_id"]
             
             # 2. Update Progress Graph
             src = event.get("source", "").lower()
@@ -246,6 +254,11 @@ if st.session_state.task_id:
                 # Rerun one last time to finalize UI state (remove cursor, update graph)
                 st.rerun()
 
+        # The stream also ends without DONE (terminal error, unknown/expired or idle task, or
+        # lost connection): don't reconnect past the end on the next rerun.
+        st.session_state.stream_completed = True
+        st.rerun()
+
 # -------------------------------------------------------------------------
 # Footer
 # -------------------------------------------------------------------------
@@ -1,28 +1,65 @@
+import time
 import requests
 import json
 
 BASE_URL = "http://localhost:8000"
 
-def stream_events(task_id: str):
+# Reconnect attempts after a dropped connection (each resumes via Last-Event-ID)
+MAX_RECONNECTS = 5
+
+def stream_events(task_id: str, last_event_id: str = None):
     """
     Yields events from the SSE stream for a given task ID.
     Reads line by line to strictly follow the 'Reads line by line' requirement.
+
+    Each yielded event carries its SSE id as "event_id". The stream ends on DONE or when the
+    server sends a `close` event (task failed, unknown/expired, or idle). If the connection drops
+    before that, we reconnect with the Last-Event-ID header and the server resumes right after
+    the last event we saw, instead of replaying the whole task.
     """
     url = f"{BASE_URL}/stream/{task_id}"
-    try:
-        # stream=True is crucial
-        with requests.get(url, stream=True, timeout=120) as response:
-            for line in response.iter_lines():
-                if line:
+    reconnects = 0
+    while True:
+        headers = {"Last-Event-ID": last_event_id} if last_event_id else {}
+        try:
+            # stream=True is crucial
+            with requests.get(url, stream=True, timeout=120, headers=headers) as response:
+                event_name = "message"
+                for line in response.iter_lines():
+                    if not line:
+                        # Blank line ends an SSE event
+                        event_name = "message"
+                        continue
                     decoded_line = line.decode('utf-8')
-                    
+
                     # Parse SSE format
-                    if decoded_line.startswith("data:"):
+                    if decoded_line.startswith("id:"):
+                        last_event_id = decoded_line[3:].strip()
+                    elif decoded_line.startswith("event:"):
+                        event_name = decoded_line[6:].strip()
+                    elif decoded_line.startswith("data:"):
+                        if event_name == "close":
+                            # Server ended the stream for good; don't reconnect
+                            return
                         json_str = decoded_line[5:].strip()
                         try:
-                            yield json.loads(json_str)
+                            event = json.loads(json_str)
                         except json.JSONDecodeError:
-                            pass 
-                            
-    except Exception as e:
-        yield {"type": "error", "source": "ui", "message": f"Stream disconnected: {str(e)}"}
+                            continue
+                        event["event_id"] = last_event_id
+                        yield event
+                        if event.get("type") == "done":
+                            return
+                        reconnects = 0
+
+        except Exception as e:
+            if reconnects >= MAX_RECONNECTS:
+                yield {"type": "error", "source": "ui", "message": f"Stream disconnected: {str(e)}"}
+                return
+
+        # Stream ended (or broke) before DONE: resume from the last event id
+        reconnects += 1
+        if reconnects > MAX_RECONNECTS:
+            yield {"type": "error", "source": "ui", "message": "Stream disconnected before completion."}
+            return
+        time.sleep(min(2 ** reconnects, 10))